@@ -0,0 +1,234 @@
+"""
+Benchmark of the screening loop against a local mock explorer.
+Runs the same contracts, tasks, rate limiter and Telegram dispatcher as etherscan.py for 10, 100 and 1000
+contracts, each in a fresh process, and reports loop lag, polls per sec, detection latency and memory.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import asyncio
+import resource
+import requests
+import multiprocessing
+
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+from tabulate import tabulate
+
+
+parser = ArgumentParser(
+    usage="python3 %(prog)s [options]\n",
+    description="Benchmarks the screening loop against a local mock block explorer and Telegram.",
+)
+parser.add_argument("--contracts", type=int, nargs="+", default=[10, 100, 1000],
+                    help="Numbers of contracts to benchmark, one run each.")
+parser.add_argument("--duration", type=float, default=60, help="Secs to screen in each run.")
+parser.add_argument("--mode", choices=["transactions", "erc20tokentxns"], default="transactions",
+                    help="Screening mode, same as etherscan.py's -t and -e.")
+parser.add_argument("--interval", type=float, default=5, help="Secs between polls of a contract, ie. sleep_time.")
+parser.add_argument("--txn-rate", type=float, default=0.05, help="New txns per sec for every contract.")
+parser.add_argument("--latency", type=float, default=0.05, help="Min secs the explorer takes to answer.")
+parser.add_argument("--jitter", type=float, default=0.05, help="Max random secs added to the explorer latency.")
+parser.add_argument("--error-ratio", type=float, default=0, help="Fraction of explorer requests that fail with 502.")
+parser.add_argument("--server-rate-limit", type=float, default=0,
+                    help="Max explorer requests per sec per api key, 0 for no limit.")
+parser.add_argument("--rate-limit-mode", choices=["etherscan", "http"], default="etherscan",
+                    help="Answer rate limited requests like Etherscan does or with a 429 status.")
+parser.add_argument("--telegram-rate", type=float, default=0, help="Max Telegram messages per sec, 0 for no limit.")
+parser.add_argument("--rate-limit", type=float, default=5, help="Screener's rate_limit setting.")
+parser.add_argument("--api-keys", type=int, default=1, help="Number of explorer API keys the screener rotates over.")
+parser.add_argument("--connections", type=int, default=10, help="Screener's connections_per_host setting.")
+parser.add_argument("--telegram-interval", type=float, default=3, help="Screener's telegram_interval setting.")
+parser.add_argument("--port", type=int, default=8597, help="Port of the mock explorer.")
+parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table.")
+
+
+def serve_mock(options: dict, port: int) -> None:
+    """Runs the mock explorer, in its own process so it does not compete with the screener for the GIL."""
+    from src.contractscreener.benchmark.mock_explorer import MockExplorer
+
+    MockExplorer(**options).run(port=port)
+
+
+def run_screener(contracts: int, config: dict, results: multiprocessing.Queue) -> None:
+    """Screens a number of mock contracts for a while in a fresh process and puts its measurements in results."""
+    network = "ethereum"
+    mock_url = f"http://127.0.0.1:{config['port']}"
+    os.environ[f"{network.upper()}_API_KEYS"] = ",".join(f"benchmark-{index}" for index in range(config['api_keys']))
+
+    from src.contractscreener.variables import etherscans
+    from src.contractscreener.blockchain.evm import EvmContract
+    from src.contractscreener.blockchain.abi import AbiCache
+    from src.contractscreener.blockchain.explorer import ExplorerPool
+    from src.contractscreener.blockchain.filters import keep_all
+    from src.contractscreener.blockchain.scheduler import ScreeningTask
+    from src.contractscreener.common.message import TelegramDispatcher
+    from src.contractscreener.benchmark.mock_explorer import percentile
+
+    # All explorer requests go to the mock
+    etherscans[network][0] = mock_url
+
+    explorers = ExplorerPool(limit_per_host=config['connections'], rate=config['rate_limit'],
+                             burst=config['rate_limit'])
+    dispatcher = TelegramDispatcher(telegram_token="benchmark", chat_interval=config['telegram_interval'])
+    dispatcher.url = f"{mock_url}/botbenchmark/sendMessage"
+
+    def notify(message: str, **labels) -> None:
+        dispatcher.send(message, telegram_chat_id="benchmark", **labels)
+
+    addresses = [f"0x{index + 1:040x}" for index in range(contracts)]
+    start = perf_counter()
+    with TemporaryDirectory() as abi_dir:
+        abi_cache = AbiCache(abi_dir)
+        with ThreadPoolExecutor(max_workers=min(contracts, 8)) as pool:
+            evm_contracts = list(pool.map(
+                lambda address: EvmContract(network, address, web3_endpoint=f"{mock_url}/rpc", explorers=explorers,
+                                            notify=notify, abi_cache=abi_cache), addresses))
+    init_time = perf_counter() - start
+
+    poll_times = []
+    lags = []
+
+    def contract_poll(contract: EvmContract):
+        async def poll() -> int:
+            baseline = contract.last_block is None
+            poll_start = perf_counter()
+
+            if config['mode'] == "erc20tokentxns":
+                txns = await contract.get_last_erc20_txns(f"0x{'e' * 40}", 100, keep_all)
+            else:
+                txns = await contract.get_last_txns(contract.contract_address, 100, keep_all)
+
+            found_txns = contract.filter_new_txns(txns) if txns else []
+            if found_txns and not baseline:
+                if config['mode'] == "erc20tokentxns":
+                    contract.alert_erc20_txns(found_txns, min_txn_amount=0)
+                else:
+                    contract.alert_checked_txns(found_txns)
+
+            poll_times.append(perf_counter() - poll_start)
+            return len(found_txns)
+
+        return poll
+
+    async def measure_lag() -> None:
+        # How late the event loop wakes up a sleeping task - the delay every poll and alert also sees
+        while True:
+            lag_start = perf_counter()
+            await asyncio.sleep(0.1)
+            lags.append(perf_counter() - lag_start - 0.1)
+
+    async def main() -> None:
+        dispatcher.start()
+        tasks = [ScreeningTask(f"{network} {contract.contract_address}", contract_poll(contract),
+                               config['interval'], timeout=30) for contract in evm_contracts]
+        running = [asyncio.create_task(task.run()) for task in tasks] + [asyncio.create_task(measure_lag())]
+
+        await asyncio.sleep(config['duration'])
+
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+        await dispatcher.close()
+        await explorers.close()
+
+    asyncio.run(main())
+
+    results.put({
+        "contracts": contracts,
+        "initialised": len([contract for contract in evm_contracts if contract.contract]),
+        "init_secs": init_time,
+        "polls_per_sec": len(poll_times) / config['duration'],
+        "poll_p50": percentile(poll_times, 0.5),
+        "poll_p95": percentile(poll_times, 0.95),
+        "lag_p95": percentile(lags, 0.95),
+        "lag_max": max(lags, default=0),
+        # Kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def benchmark(contracts: int, config: dict) -> dict:
+    """
+    Runs one benchmark in a fresh process against the running mock explorer.
+
+    :param contracts: Number of contracts to screen
+    :param config: Dictionary of benchmark options
+    :return: Dictionary of measurements
+    :raises RuntimeError: If the screener process exits without reporting its measurements
+    """
+    mock_url = f"http://127.0.0.1:{config['port']}"
+    requests.post(f"{mock_url}/reset", timeout=10)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_screener, args=(contracts, config, results))
+    process.start()
+
+    while True:
+        # Checked before waiting, so measurements sent right before the process exited are still read
+        alive = process.is_alive()
+        try:
+            measurements = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not alive:
+                raise RuntimeError(f"screener process exited with code {process.exitcode} without reporting "
+                                   f"its measurements, see its traceback above")
+    process.join()
+
+    return {**measurements, **requests.get(f"{mock_url}/stats", timeout=10).json()}
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    config = vars(args)
+
+    if not os.path.isdir("logs"):
+        sys.exit("Run from the project directory, the screener logs into ./logs.")
+
+    mock_options = dict(txn_rate=args.txn_rate, latency=args.latency, jitter=args.jitter,
+                        error_ratio=args.error_ratio, rate_limit=args.server_rate_limit,
+                        rate_limit_mode=args.rate_limit_mode, telegram_rate=args.telegram_rate)
+    mock = multiprocessing.get_context("spawn").Process(target=serve_mock, args=(mock_options, args.port), daemon=True)
+    mock.start()
+
+    # Wait for the mock to listen
+    for _ in range(50):
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/stats", timeout=1)
+            break
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+
+    rows = []
+    try:
+        for contracts in args.contracts:
+            try:
+                result = benchmark(contracts, config)
+            except RuntimeError as e:
+                sys.exit(f"Benchmark of {contracts} contracts failed - {e}.")
+            if args.json:
+                print(json.dumps(result), flush=True)
+
+            rows.append([
+                result['contracts'], f"{result['initialised']}", f"{result['init_secs']:,.1f}",
+                f"{result['polls_per_sec']:,.1f}", f"{result['poll_p50'] * 1000:,.0f}/{result['poll_p95'] * 1000:,.0f}",
+                f"{result['lag_p95'] * 1000:,.1f}/{result['lag_max'] * 1000:,.1f}",
+                f"{result['alerted']}/{result['txns']}",
+                f"{result['latency_p50']:,.1f}/{result['latency_p95']:,.1f}/{result['latency_max']:,.1f}",
+                f"{result['errors']}/{result['rate_limited']}", f"{result['max_rss_mb']:,.0f}",
+            ])
+    finally:
+        mock.terminate()
+
+    if not args.json:
+        columns = ["Contracts", "Initialised", "Init secs", "Polls/sec", "Poll p50/p95 ms", "Loop lag p95/max ms",
+                   "Alerted/txns", "Detection p50/p95/max secs", "502s/rate limited", "Max RSS MB"]
+        print(tabulate(rows, headers=columns, tablefmt="fancy_grid"))
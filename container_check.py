@@ -1,14 +1,15 @@
 """
-Program that constantly checks if a docker container is running.
-It checks the Loop timestamps and notifies vie Telegram if the last timestamp was older than 15 mins.
+Program that constantly checks if the screener is running.
+It reads the heartbeat written by etherscan.py every few secs and notifies via Telegram if the screener has stalled,
+or if any network has gone without a successful poll for too long, and again once it has recovered.
 """
 import os
-import re
-import sys
+import json
 import time
 import datetime
 import requests
 from atexit import register
+from argparse import ArgumentParser
 
 
 def telegram_send_message(message_text: str, teleg_chat_id: str,
@@ -45,8 +46,56 @@ def telegram_send_message(message_text: str, teleg_chat_id: str,
         return None
 
 
-if len(sys.argv) != 2:
-    sys.exit(f"Usage: python3 {os.path.basename(__file__)} <container_name>\n")
+def read_heartbeat(source: str) -> dict or None:
+    """Reads the heartbeat from a status file or a health endpoint url, None if unavailable."""
+    try:
+        if source.startswith(("http://", "https://")):
+            return requests.get(source, timeout=5).json()
+
+        with open(source) as file:
+            return json.load(file)
+
+    except (OSError, ValueError, requests.exceptions.RequestException):
+        return None
+
+
+def find_problems(status: dict or None, now: float, max_age: float, max_lag: float) -> dict:
+    """
+    Checks a heartbeat for a stalled screener and for lagging networks.
+
+    :param status: Heartbeat dictionary
+    :param now: Current time in secs
+    :param max_age: Max secs since the screener last updated its heartbeat
+    :param max_lag: Min secs a network may go without a successful poll, raised to 3 of its poll intervals
+    :return: Dictionary of 'screener' or network name -> description of problem
+    """
+    if not status:
+        return {"screener": "no heartbeat found"}
+
+    age = now - status['updated']
+    if age > max_age:
+        return {"screener": f"heartbeat not updated for {age:,.0f} secs"}
+
+    problems = {}
+    for network, info in status['networks'].items():
+        lag = now - (info['last_success'] or status['started'])
+        if lag > max(max_lag, 3 * info['max_interval']):
+            problems[network] = f"{network} has had no successful poll for {lag:,.0f} secs, " \
+                                f"{info['failing']}/{info['tasks']} tasks failing"
+
+    return problems
+
+
+parser = ArgumentParser(usage="python3 %(prog)s <container_name> [options]\n",
+                        description="Checks the screener's heartbeat and alerts via Telegram if it stalls.")
+parser.add_argument("container_name", help="Name of the screener in alerts, eg. its docker container.")
+parser.add_argument("--heartbeat", default="logs/heartbeat.json",
+                    help="Heartbeat file or health endpoint url, eg. http://127.0.0.1:9477/health.")
+parser.add_argument("--interval", type=float, default=10, help="Secs between two checks.")
+parser.add_argument("--max-age", type=float, default=60, help="Max secs since the screener updated its heartbeat.")
+parser.add_argument("--max-lag", type=float, default=300,
+                    help="Max secs a network may go without a successful poll, at least 3 of its poll intervals.")
+args = parser.parse_args()
 
 
 env_text = os.popen("cat .env").read()
@@ -61,63 +110,49 @@ chat_id_alerts = env_vals['CHAT_ID_ALERTS']
 chat_id_debug = env_vals['CHAT_ID_DEBUG']
 token = env_vals['TOKEN']
 
-current_dir = os.getcwd()
 time_format = "%Y-%m-%d %H:%M:%S, %Z"
-time_format_regex = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}, [A-Za-z]*")
-program_name = os.path.abspath(os.path.basename(__file__))
 program_start_time = datetime.datetime.now()
+watchdog_start = time.time()
 
-container_name = sys.argv[-1]
+container_name = args.container_name
 register(telegram_send_message, f"⚠️ <b>{container_name.upper()}: container_check.py</b> stopped!",
          chat_id_debug, token)
 
-wait_time = 5 * 60  # 5 mins (5 * 60 secs) sleep time in each loop
-max_time_diff = 5 * 60  # 5 mins max difference(in secs) between current and script's last timestamp
 update_time = 12  # 12 hour check 'OK' message to Telegram to notify container_check is still running
 
-# Sleep before starting the script - 15 mins
-time.sleep(15 * 60)
-
+# Problems already alerted, to alert each only once and again when it is resolved
+alerted = {}
 
 while True:
-    # Get timestamp of last execution loop
-    command = f"docker logs {container_name} | tail -n 50"
-    output = os.popen(command).read()
-
-    # Find last Loop timestamp
-    time_str = time_format_regex.findall(output)[-1]
-
-    # Construct date_time object from string
-    script_time = datetime.datetime.strptime(time_str, time_format)
+    now = time.time()
+    status = read_heartbeat(args.heartbeat)
+    problems = find_problems(status, now, args.max_age, args.max_lag)
 
-    now_time = datetime.datetime.now()
+    # Give a starting screener time to write its first heartbeat
+    if status is None and now - watchdog_start < args.max_age:
+        problems = {}
 
-    # Calculate time difference in seconds
-    time_diff = (now_time - script_time).seconds
+    timestamp = datetime.datetime.now().astimezone().strftime(time_format)
+    for key in problems.keys() - alerted.keys():
+        message = f"<b>⚠️ {container_name.upper()}</b> - {timestamp}\n{problems[key]}!"
 
-    # Calculate last loop execution time
-    temp = re.split(r"[ ]?sec[s]?", output)[0]
-    loop_time = float(re.split(r" ", temp)[-1])
-
-    # Alert if container has stopped or is lagging behind
-    if time_diff > max_time_diff:
-
-        timestamp = datetime.datetime.now().astimezone().strftime(time_format)
-        message = f"<b>⚠️ {container_name.upper()}</b> - {timestamp}\n" \
-                  f"<b>{program_name}</b> stopped!\n Last loop time: {loop_time:,.2f} secs.\n"
-
-        # Send Telegram message in Alerts and Debug Chat and Break
+        # Send Telegram message in Alerts and Debug Chat
         telegram_send_message(message, teleg_chat_id=chat_id_alerts, teleg_token=token)
         telegram_send_message(message, teleg_chat_id=chat_id_debug, teleg_token=token)
 
-        break
+    for key in alerted.keys() - problems.keys():
+        message = f"✅ {container_name.upper()} - {timestamp}\n{key} has recovered."
+        telegram_send_message(message, teleg_chat_id=chat_id_alerts, teleg_token=token)
+
+    alerted = problems
 
     # Alert every 12hours if the script is still running
-    if now_time - program_start_time > datetime.timedelta(hours=update_time):
-        message = f"✅ {container_name.upper()}. Last loop time: {loop_time:,.2f} secs."
+    if datetime.datetime.now() - program_start_time > datetime.timedelta(hours=update_time):
+        loop = status['loop'] if status else "n/a"
+        message = f"✅ {container_name.upper()}. Last loop: {loop}. Problems: {len(problems)}."
 
         # Send Telegram message in Debug Chat
         telegram_send_message(message, teleg_chat_id=chat_id_debug, teleg_token=token)
         program_start_time = datetime.datetime.now()
 
-    time.sleep(wait_time)
+    time.sleep(args.interval)
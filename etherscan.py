@@ -1,51 +1,289 @@
 import os
 import sys
-import json
+import signal
+import sqlite3
 import asyncio
 
-from copy import deepcopy
 from atexit import register
 from datetime import datetime
-from time import (
-    sleep,
-    perf_counter,
-)
+from time import perf_counter
+from typing import Dict
 from concurrent.futures import ThreadPoolExecutor
 
 from src.contractscreener.blockchain.interface import args
 from src.contractscreener.blockchain.evm import EvmContract
+from src.contractscreener.blockchain.abi import AbiCache
+from src.contractscreener.blockchain.providers import providers
+from src.contractscreener.blockchain.explorer import ExplorerPool
+from src.contractscreener.blockchain.node import (
+    NodeClient,
+    Erc20LogScreener,
+)
+from src.contractscreener.blockchain.multicall import MulticallBatcher
+from src.contractscreener.blockchain.backfill import Backfill
+from src.contractscreener.blockchain.replay import (
+    Replay,
+    CaptureSink,
+)
+from src.contractscreener.blockchain.stream import (
+    LogSubscriber,
+    activity_keys,
+    contract_filters,
+    transfer_filters,
+)
+from src.contractscreener.blockchain.scheduler import (
+    ScreeningTask,
+    AdaptiveScheduler,
+)
+from src.contractscreener.blockchain.filters import (
+    apply_filter,
+    compile_filter,
+)
 from src.contractscreener.blockchain.helpers import (
+    load_config,
     print_start_message,
-    gather_funcs,
 )
-from src.contractscreener.common.message import telegram_send_message
+from src.contractscreener.common.message import (
+    telegram_send_message,
+    TelegramDispatcher,
+)
+from src.contractscreener.common.checkpoint import CheckpointStore
+from src.contractscreener.common.heartbeat import Heartbeat
+from src.contractscreener.common.coordinator import (
+    Coordinator,
+    CoordinatorClient,
+)
+from src.contractscreener.common.metrics import (
+    metrics,
+    poll_seconds,
+    loop_seconds,
+    breaker_open,
+    alerts_queued,
+    throttle_waiting,
+    poll_interval_seconds,
+)
 from src.contractscreener.common.exceptions import exit_handler
-from src.contractscreener.variables import time_format
+from src.contractscreener.common.logger import (
+    log_error,
+    configure_logging,
+)
+from src.contractscreener.variables import (
+    time_format,
+    infura_endpoints,
+    infura_ws_endpoints,
+)
 
 
 if len(sys.argv) != 3:
     sys.exit(f"Usage: python3 {os.path.basename(__file__)} <mode> etherscan.json\n")
 
-# Send telegram debug message if program terminates
+# Fetch variables, the config is either given inline or as a path to a JSON file
+info = load_config(sys.argv[-1])
+workers = info['settings'].get('workers', 1)
+# Set by the coordinator in the config of each of its workers
+coordinator_address = info['settings'].get('coordinator')
+worker_name = info['settings'].get('worker_name', "")
+
+# Send telegram debug message if program terminates, workers are restarted by their coordinator instead
 timestamp = datetime.now().astimezone().strftime(time_format)
 program_name = os.path.abspath(os.path.basename(__file__))
-register(exit_handler, program_name)
+if not coordinator_address and not args.backfill and not args.replay:
+    register(exit_handler, program_name)
 
-# Fetch variables
-info = json.loads(sys.argv[-1])
 contr_addresses = [contr for contr in info['contracts'].values()]
+# Config names of the contracts, shard updates from the coordinator refer to them
+contract_names = list(info['contracts'])
 
-filter_by = tuple(info['settings']['filter_by'])
+# Filter expression is compiled once and applied to every response batch
+filter_by = info['settings'].get('filter_by', [])
+txn_filter = compile_filter(filter_by)
 sleep_time = info['settings']['sleep_time']
+connections_per_host = info['settings'].get('connections_per_host', 10)
+rate_limit = info['settings'].get('rate_limit', 5)
+rate_burst = info['settings'].get('rate_burst', rate_limit)
+key_quarantine = info['settings'].get('key_quarantine', 2)
+key_max_quarantine = info['settings'].get('key_max_quarantine', 600)
+breaker = info['settings'].get('breaker', {})
+explorer_mirrors = info['settings'].get('explorer_mirrors', {})
+hedge = info['settings'].get('hedge', False)
+hedge_min_delay = info['settings'].get('hedge_min_delay', 0.25)
+node_failover = info['settings'].get('node_failover', True)
+seen_size = info['settings'].get('seen_size', 1000)
+telegram_interval = info['settings'].get('telegram_interval', 3)
+abi_cache_dir = info['settings'].get('abi_cache_dir', "logs/abi")
+abi_cache_ttl = info['settings'].get('abi_cache_ttl', 7 * 24 * 60 * 60)
+providers.pool_size = info['settings'].get('node_connections', 10)
+checkpoint_file = info['settings'].get('checkpoint_file', "logs/checkpoint.db")
+checkpoint_interval = info['settings'].get('checkpoint_interval', 30)
+poll_timeout = info['settings'].get('poll_timeout', 30)
+adaptive = info['settings'].get('adaptive')
+erc20_engine = info['settings'].get('erc20_engine', "explorer")
+node_endpoints = {**infura_endpoints, **info['settings'].get('node_endpoints', {})}
+push = info['settings'].get('push', False)
+ws_endpoints = {**infura_ws_endpoints, **info['settings'].get('ws_endpoints', {})}
+push_min_interval = info['settings'].get('push_min_interval', 2)
+push_fallback_interval = info['settings'].get('push_fallback_interval', 300)
+heartbeat_file = info['settings'].get('heartbeat_file', "logs/heartbeat.json")
+metrics_port = info['settings'].get('metrics_port')
+metrics_host = info['settings'].get('metrics_host', "127.0.0.1")
+worker_timeout = info['settings'].get('worker_timeout', 120)
+worker_restart = info['settings'].get('worker_restart', 60)
+log_max_bytes = info['settings'].get('log_max_bytes', 10 * 1024 * 1024)
+log_rotate_interval = info['settings'].get('log_rotate_interval', 24 * 60 * 60)
+log_backups = info['settings'].get('log_backups', 5)
+log_compress = info['settings'].get('log_compress', True)
+journal_file = info['settings'].get('journal_file', "logs/journal.jsonl")
+journal_max_bytes = info['settings'].get('journal_max_bytes', 100 * 1024 * 1024)
+record_file = info['settings'].get('record_file', "")
+multicall_window = info['settings'].get('multicall_window', 0.01)
+multicall_max_calls = info['settings'].get('multicall_max_calls', 100)
+multicall_cache_ttl = info['settings'].get('multicall_cache_ttl', 24 * 60 * 60)
+
+# Each worker writes its own log files, so no two processes ever rotate the same file
+configure_logging(max_bytes=log_max_bytes, interval=log_rotate_interval, backups=log_backups,
+                  compress=log_compress, journal_file=journal_file, journal_max_bytes=journal_max_bytes,
+                  record_file=record_file, suffix=worker_name)
+
+
+async def backfill() -> bool:
+    """
+    Exports the past txns of every contract within the configured block range.
+    """
+    options = info['settings']['backfill']
+    backfill_explorers = ExplorerPool(limit_per_host=connections_per_host, rate=rate_limit, burst=rate_burst,
+                                      key_quarantine=key_quarantine, key_max_quarantine=key_max_quarantine)
+    history = Backfill(contr_addresses, backfill_explorers, options['from_block'], options['to_block'],
+                       chunk_blocks=options.get('chunk_blocks', 10000), page_size=options.get('page_size', 1000),
+                       concurrency=options.get('concurrency', 4), output_dir=options.get('output_dir', "logs/backfill"),
+                       output_format=options.get('format', "jsonl"), engine=options.get('engine', erc20_engine),
+                       node_endpoints=node_endpoints, timeout=poll_timeout)
+    try:
+        return await history.run()
+    finally:
+        await backfill_explorers.close()
+
+
+# Backfill mode - export history and exit, resumes from the chunks already written when run again
+if args.backfill:
+    sys.exit(0 if asyncio.run(backfill()) else 1)
+
+
+def replay() -> None:
+    """
+    Replays recorded txns through the filter, seen hashes and alerts of every contract, capturing the alerts.
+    """
+    options = info['settings']['replay']
+    # Replayed txns are logged apart from the live ones, eg. logs/txns.replay.log, and not journaled by default
+    configure_logging(max_bytes=log_max_bytes, interval=log_rotate_interval, backups=log_backups,
+                      compress=log_compress, journal_file=options.get('journal_file', ""), suffix="replay")
+
+    sink = CaptureSink(options.get('alerts_file', ""))
+    replay_contracts = [EvmContract(item['network'], item['contract_address'], seen_size=seen_size, notify=sink.send,
+                                    node_failover=False, offline=True) for item in contr_addresses]
+    engine = Replay(contr_addresses, replay_contracts, txn_filter, speed=options.get('speed', 0))
+    try:
+        engine.run(options['input'])
+    finally:
+        sink.close()
+
+    print(engine.report(sink.alerts))
+
+
+# Replay mode - no explorer, node or Telegram is used
+if args.replay:
+    replay()
+    sys.exit()
+
+if worker_name:
+    print(f"{timestamp} - {worker_name} started screening {len(contr_addresses)} contracts.")
+else:
+    print(f"{timestamp} - Started screening:\n")
+    print_start_message(contr_addresses)
+
+
+async def coordinate() -> None:
+    """
+    Runs the screening in worker processes, each screening a shard of the contracts, and delivers their alerts.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+
+    def stop() -> None:
+        # Ignore further SIGTERMs, eg. to the whole process group, while the workers are stopped
+        loop.add_signal_handler(signal.SIGTERM, lambda: None)
+        task.cancel()
+
+    loop.add_signal_handler(signal.SIGTERM, stop)
+
+    coordinator_dispatcher = TelegramDispatcher(chat_interval=telegram_interval)
+    coordinator = Coordinator(os.path.abspath(__file__), sys.argv[1], info, workers, coordinator_dispatcher,
+                              Heartbeat(heartbeat_file), worker_timeout=worker_timeout,
+                              restart_delay=worker_restart, report_interval=sleep_time)
+
+    if metrics_port:
+        alerts_queued.set_function(lambda: {(): len(coordinator_dispatcher)})
+        await metrics.serve(metrics_port, metrics_host, health=lambda: coordinator.heartbeat.last_status)
+        print(f"Serving metrics at http://{metrics_host}:{metrics_port}/metrics")
 
-print(f"{timestamp} - Started screening:\n")
-print_start_message(contr_addresses)
+    try:
+        await coordinator.run()
+    finally:
+        await metrics.close()
+
+
+# Coordinator mode - shard the contracts across worker processes, each running this same script
+if workers > 1 and not coordinator_address:
+    print(f"Screening with {workers} worker processes.")
+    telegram_send_message(f"✅ ETHERSCAN has started.")
+    try:
+        asyncio.run(coordinate())
+    except asyncio.CancelledError:
+        print("Screening stopped.")
+    sys.exit()
 
 # Create a contract instance only once and then query multiple times
-arguments = [[item['network'], item['contract_address']] for item in contr_addresses]
+# One pooled session per explorer host, shared by all contracts and closed on shutdown
+explorers = ExplorerPool(limit_per_host=connections_per_host, rate=rate_limit, burst=rate_burst,
+                         key_quarantine=key_quarantine, key_max_quarantine=key_max_quarantine, breaker=breaker)
+# Alerts are queued and delivered in the background so Telegram never blocks screening,
+# a worker queues them to its coordinator instead, which drops duplicates and delivers them
+if coordinator_address:
+    dispatcher = CoordinatorClient(coordinator_address, worker_name)
+else:
+    dispatcher = TelegramDispatcher(chat_interval=telegram_interval)
+# Known contracts are created from the on-disk ABI cache without any network call
+abi_cache = AbiCache(abi_cache_dir, ttl=abi_cache_ttl)
+# Contract reads made at about the same time on a network are sent as one Multicall3 call
+multicalls = {}
+
+
+def contract_arguments(item: dict) -> dict:
+    """
+    Arguments of the EvmContract of a config entry.
+
+    :param item: Config entry
+    :return: Dictionary of keyword arguments
+    """
+    network = item['network'].lower()
+    if network not in multicalls and node_endpoints.get(network):
+        multicalls[network] = MulticallBatcher(NodeClient(network, node_endpoints[network], explorers),
+                                               window=multicall_window, max_calls=multicall_max_calls,
+                                               immutable_ttl=multicall_cache_ttl)
+
+    return dict(name=item['network'], contract_address=item['contract_address'], explorers=explorers,
+                seen_size=seen_size, notify=dispatcher.send, abi_cache=abi_cache,
+                web3_endpoint=node_endpoints.get(network) or "", mirrors=explorer_mirrors.get(network, []),
+                hedge=hedge, hedge_min_delay=hedge_min_delay, node_failover=node_failover,
+                multicall=multicalls.get(network), alert_reads=item.get('alert_reads'))
 
-with ThreadPoolExecutor(max_workers=len(contr_addresses)) as pool:
-    results = pool.map(lambda p: EvmContract(*p), arguments, timeout=20)
+
+arguments = [contract_arguments(item) for item in contr_addresses]
+
+# Contracts share one Web3 provider per network, a few threads are enough to cover ABI cache misses
+init_workers = min(len(contr_addresses), 8)
+with ThreadPoolExecutor(max_workers=init_workers) as pool:
+    results = pool.map(lambda kwargs: EvmContract(**kwargs), arguments,
+                       timeout=20 * -(-len(contr_addresses) // init_workers))
 
 evm_contracts = list(results)
 contract_instances = [contract for contract in evm_contracts if contract.contract]
@@ -56,49 +294,473 @@ print(f"Initialised {len(contract_instances)}/{len(contr_addresses)} contract in
 if args.transactions:
     print(f"Screening for 'Transactions' and filtering by {filter_by}:")
 
-    txn_args = [[contr['contract_address'], 100, filter_by] for contr in contr_addresses]
-    txn_funcs = [contract.get_last_txns for contract in evm_contracts]
-
 elif args.erc20tokentxns:
     print(f"Screening for 'Erc20 Token Txns' and filtering by {filter_by}:")
 
-    txn_args = [[contr['token_address'], 100, filter_by] for contr in contr_addresses]
-    txn_funcs = [contract.get_last_erc20_txns for contract in evm_contracts]
-
 else:
     sys.exit()
 
-telegram_send_message(f"✅ ETHERSCAN has started.")
 
-old_txns = asyncio.run(gather_funcs(txn_funcs, txn_args))
+def screening_of(contr: dict, contract: EvmContract) -> tuple:
+    """
+    Poll function, its arguments and the checkpoint key of a contract in the current screening mode.
+
+    :param contr: Config entry
+    :param contract: EvmContract of config entry
+    :return: Tuple of poll function, list of its arguments and checkpoint key
+    """
+    if args.erc20tokentxns:
+        return (contract.get_last_erc20_txns, [contr['token_address'], 100, txn_filter],
+                (contr['network'].lower(), f"{contr['token_address']}/{contr['contract_address']}".lower(),
+                 "erc20tokentxns"))
+
+    return (contract.get_last_txns, [contr['contract_address'], 100, txn_filter],
+            (contr['network'].lower(), contr['contract_address'].lower(), "transactions"))
+
+
+txn_funcs, txn_args, checkpoint_keys = [], [], []
+for contr, contract in zip(contr_addresses, evm_contracts):
+    txn_func, txn_arg, checkpoint_key = screening_of(contr, contract)
+    txn_funcs.append(txn_func)
+    txn_args.append(txn_arg)
+    checkpoint_keys.append(checkpoint_key)
 
-loop_counter = 1
-while True:
-    # Wait for new transactions to appear
-    start = perf_counter()
-    sleep(sleep_time)
+# Resume block cursors and seen hashes saved by a previous run
+checkpoints = CheckpointStore(checkpoint_file, max_hashes=seen_size)
+saved_checkpoints = checkpoints.load()
+for contract, key in zip(evm_contracts, checkpoint_keys):
+    if key in saved_checkpoints:
+        contract.last_block, saved_hashes = saved_checkpoints[key]
+        contract.seen.update(saved_hashes)
 
-    new_txns = asyncio.run(gather_funcs(txn_funcs, txn_args))
+resumed = len([key for key in checkpoint_keys if key in saved_checkpoints])
+print(f"Resumed {resumed}/{len(checkpoint_keys)} contracts from {checkpoint_file}.")
 
-    for i, item in enumerate(contr_addresses):
+# Contracts currently screened, a worker's shard can change while it runs
+active = set(range(len(contr_addresses)))
 
-        # If empty list returned - no point to compare
-        if not new_txns[i]:
+
+def node_screener(network: str, indexes: list) -> Erc20LogScreener:
+    """
+    Creates the node screener of some of the watched tokens of a network.
+
+    :param network: Network name
+    :param indexes: Indexes of its contracts
+    :return: Erc20LogScreener
+    """
+    screener = Erc20LogScreener(network, node_endpoints[network], [(i, contr_addresses[i]) for i in indexes],
+                                explorers)
+
+    # Resume the network scan only if every contract on it has a checkpoint
+    cursors = [evm_contracts[i].last_block for i in indexes]
+    if None not in cursors:
+        screener.last_block = min(cursors)
+
+    return screener
+
+
+# Node engine - one eth_getLogs scan per network covering all of its watched tokens
+node_screeners = []
+# Contracts screened by a node screener, the others are polled on their explorer
+node_entries = set()
+if args.erc20tokentxns and erc20_engine == "node":
+    for network in sorted({contr['network'].lower() for contr in contr_addresses}):
+        if not node_endpoints.get(network):
+            print(f"No node endpoint for {network}, its Erc20 txns are polled on its explorer instead.")
             continue
 
-        # Compare new and old txns
-        found_txns = EvmContract.compare_lists(new_txns[i], old_txns[i])
+        watched = [i for i, contr in enumerate(contr_addresses) if contr['network'].lower() == network]
+        node_screeners.append(node_screener(network, watched))
+        node_entries.update(watched)
+
+    print(f"Screening Erc20 Transfers via node logs on {len(node_screeners)} networks.")
+
+# Push mode - poll a contract as soon as a log of its activity is mined
+networks = sorted({contr['network'].lower() for contr in contr_addresses})
+push_endpoints = {network: ws_endpoints[network] for network in networks if push and ws_endpoints.get(network)}
+if push:
+    print(f"Pushing contract logs via WebSocket on {len(push_endpoints)}/{len(networks)} networks.")
+
+
+def activity_key(contr: dict) -> tuple:
+    """
+    Key of a contract's activity, as returned by activity_keys for its logs.
+
+    :param contr: Config entry
+    :return: (contract address, '') or (token address, bridge address) in Erc20 mode
+    """
+    if args.erc20tokentxns:
+        return contr['token_address'].lower(), contr['contract_address'].lower()
+
+    return contr['contract_address'].lower(), ""
+
+
+def push_filters(network: str) -> list:
+    """
+    Log filters of a network's screened contracts.
+
+    :param network: Network name
+    :return: List of 'eth_subscribe logs' filters
+    """
+    keys = {activity_key(contr_addresses[i]) for i in active if contr_addresses[i]['network'].lower() == network}
+    if args.erc20tokentxns:
+        return transfer_filters([token for token, _ in keys], [bridge for _, bridge in keys])
+
+    return contract_filters([address for address, _ in keys])
+
+# Last successful poll of every network, for container_check.py and the health endpoint
+heartbeat = Heartbeat(heartbeat_file)
+
+if not coordinator_address:
+    telegram_send_message(f"✅ ETHERSCAN has started.")
+
+
+async def process_txns(i: int, txns: list, baseline: bool = False) -> int:
+    """
+    Alerts the new txns of a contract and stages its checkpoint.
+
+    :param i: Index of contract
+    :param txns: List of polled transactions
+    :param baseline: If true, txns are only marked as seen
+    :return: Number of new txns
+    """
+    contract = evm_contracts[i]
+
+    # Keep only txns this contract has not seen before
+    found_txns = contract.filter_new_txns(txns) if txns else []
+
+    # If new txns found - check them and send the interesting ones
+    if found_txns and not baseline:
+        min_amount = contr_addresses[i]['min_amount'] if args.erc20tokentxns else 0
+        # Current contract state added to the alerts, read only if any txn is alerted
+        fields = None
+        if contract.alert_reads and any(txn.value / 10 ** txn.token_decimal >= min_amount for txn in found_txns):
+            fields = await contract.read_alert_fields()
+
+        if args.erc20tokentxns:
+            contract.alert_erc20_txns(txns=found_txns, min_txn_amount=min_amount, fields=fields)
+        elif args.transactions:
+            contract.alert_checked_txns(txns=found_txns, fields=fields)
+
+    checkpoints.stage(checkpoint_keys[i], contract.last_block, [txn.hash for txn in found_txns])
+
+    return 0 if baseline else len(found_txns)
+
+
+def contract_poll(i: int):
+    """
+    Creates the poll of a single contract on its explorer.
+
+    :param i: Index of contract
+    :return: Coroutine function
+    """
+    async def poll() -> int:
+        # A contract without a checkpoint takes a baseline first - everything already on chain counts as seen
+        baseline = evm_contracts[i].last_block is None
+        start = perf_counter()
+
+        txns = await txn_funcs[i](*txn_args[i])
+        poll_seconds.observe(perf_counter() - start, network=evm_contracts[i].name)
+
+        return await process_txns(i, txns, baseline)
+
+    return poll
+
+
+def network_poll(screener: Erc20LogScreener):
+    """
+    Creates the poll of all watched tokens of a network on its node.
+
+    :param screener: Erc20LogScreener of network
+    :return: Coroutine function
+    """
+    async def poll() -> int:
+        start = perf_counter()
+        transfers = await screener.get_new_transfers()
+        poll_seconds.observe(perf_counter() - start, network=screener.network)
+
+        if transfers is None:
+            raise ConnectionError(f"Unable to fetch Transfer logs for {screener.network}")
+
+        for i in screener.entries:
+            # Keep each contract's cursor in step with its network scan for checkpoints
+            evm_contracts[i].last_block = screener.last_block
+
+        # Processed together, so the alert_reads of all contracts of the network are read in one batch
+        new_txns = await asyncio.gather(*(process_txns(i, apply_filter(txn_filter, transfers.get(i, [])))
+                                          for i in screener.entries))
+
+        return sum(new_txns)
+
+    return poll
+
+
+async def report(network_tasks: dict) -> None:
+    """
+    Prints a loop line every sleep_time secs, writes batched checkpoints and the heartbeat.
+
+    :param network_tasks: Dictionary of network -> list of its ScreeningTasks
+    :return: None
+    """
+    last_commit = perf_counter()
+    loop_counter = 1
+    while True:
+        start = perf_counter()
+        await asyncio.sleep(sleep_time)
+
+        # Tasks come and go as contracts are moved to or away from this worker
+        tasks = [task for network in network_tasks.values() for task in network]
+
+        # Batch checkpoint writes into one transaction every few secs
+        if perf_counter() - last_commit >= checkpoint_interval:
+            try:
+                checkpoints.commit()
+            except sqlite3.Error as e:
+                # Staged updates are kept and written with the next commit
+                log_error.warning(f"'CheckpointError' - {checkpoint_file} - {e}")
+            last_commit = perf_counter()
+
+        slowest = max([task.last_duration for task in tasks], default=0)
+        max_queued = max([stats['max_queued'] for stats in explorers.limiter.report().values()], default=0)
+        intervals = [task.interval for task in tasks]
+
+        loop_time = perf_counter() - start
+        loop_seconds.set(loop_time)
+
+        timestamp = datetime.now().astimezone().strftime(time_format)
+        name = f"{worker_name} " if worker_name else ""
+        print(f"{timestamp} - {name}Loop {loop_counter} executed in {loop_time:,.2f} secs. "
+              f"Slowest poll {slowest:,.2f} secs. Max queued {max_queued:,.2f} secs. "
+              f"Alerts queued {len(dispatcher)}. Intervals {min(intervals, default=0):,.1f}-"
+              f"{max(intervals, default=0):,.1f} secs.")
+
+        heartbeat.beat(network_tasks, loop_counter)
+        if coordinator_address:
+            dispatcher.heartbeat(heartbeat.last_status)
+        loop_counter += 1
+
+
+async def main() -> None:
+    """
+    Runs every contract, or every network for the node engine, as its own supervised task on one
+    long-running event loop, so a slow or failing explorer never delays alerts on any other chain.
+    """
+    # Shut down cleanly, flushing checkpoints and queued alerts, on 'docker stop'
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    if metrics_port:
+        # Queue depths are read at scrape time
+        alerts_queued.set_function(lambda: {(): len(dispatcher)})
+        throttle_waiting.set_function(lambda: {(host,): count for host, count in explorers.limiter.waiting().items()})
+        breaker_open.set_function(lambda: {(host,): {"closed": 0, "half_open": 0.5, "open": 1}[state]
+                                           for host, state in explorers.breaker_states().items()})
+        await metrics.serve(metrics_port, metrics_host, health=lambda: heartbeat.last_status)
+        print(f"Serving metrics at http://{metrics_host}:{metrics_port}/metrics")
+
+    # Each task wakes up early on a log of its contract's activity in push mode
+    wake_events = {network: {} for network in networks}
+
+    def wake(network: str, log: dict) -> None:
+        for key in activity_keys(log):
+            for event in wake_events.get(network, {}).get(key, []):
+                event.set()
+
+    def wake_all(network: str) -> None:
+        for events in wake_events.get(network, {}).values():
+            for event in events:
+                event.set()
+
+    subscribers = {network: LogSubscriber(network, endpoint, push_filters(network), wake, wake_all)
+                   for network, endpoint in push_endpoints.items()}
+
+    def push_options(network: str) -> dict:
+        subscriber = subscribers.get(network)
+        if not subscriber:
+            return {}
+
+        return {'wake': asyncio.Event(), 'min_wake_interval': push_min_interval,
+                'fallback_interval': push_fallback_interval, 'healthy': lambda: subscriber.healthy}
+
+    # Adaptive intervals keep each explorer within 80% of the rate limit of all of its API keys
+    scheduler = None
+    if adaptive:
+        budgets = {ExplorerPool.host(contract.api): 0.8 * rate_limit * len(contract.api_keys)
+                   for contract in evm_contracts}
+        scheduler = AdaptiveScheduler(adaptive.get('min_interval', 2), adaptive.get('max_interval', 60),
+                                      adaptive.get('target_txns', 1), adaptive.get('alpha', 0.3), budgets)
+        if metrics_port:
+            poll_interval_seconds.set_function(lambda: {(name,): interval
+                                                        for name, interval in scheduler.intervals().items()})
+
+    network_tasks = {network: [] for network in networks}
+    # ScreeningTask or LogSubscriber -> its running asyncio task
+    runs = {subscriber: asyncio.create_task(subscriber.run()) for subscriber in subscribers.values()}
+    # ScreeningTask -> indexes of the contracts it screens
+    task_indexes = {}
+    # Network -> ScreeningTask of its node screener
+    screener_tasks = {}
+
+    def start_task(network: str, task: ScreeningTask, indexes: list) -> None:
+        if task.wake:
+            for i in indexes:
+                wake_events.setdefault(network, {}).setdefault(activity_key(contr_addresses[i]), []).append(task.wake)
+        network_tasks.setdefault(network, []).append(task)
+        task_indexes[task] = indexes
+        runs[task] = asyncio.create_task(task.run())
+
+    def stop_task(network: str, task: ScreeningTask) -> None:
+        runs.pop(task).cancel()
+        if screener_tasks.get(network) is task:
+            del screener_tasks[network]
+        network_tasks[network].remove(task)
+        for i in task_indexes.pop(task):
+            events = wake_events.get(network, {}).get(activity_key(contr_addresses[i]), [])
+            if task.wake in events:
+                events.remove(task.wake)
+        if scheduler:
+            scheduler.unregister(task.name)
+
+    def start_screener(screener: Erc20LogScreener) -> None:
+        # One scan covers all the network's contracts
+        task = ScreeningTask(f"{screener.network} logs", network_poll(screener), sleep_time, poll_timeout,
+                             scheduler=scheduler, host=ExplorerPool.host(screener.node.endpoint),
+                             **push_options(screener.network))
+        screener_tasks[screener.network] = task
+        start_task(screener.network, task, list(screener.entries))
+
+    def start_contract(i: int) -> None:
+        contr = contr_addresses[i]
+        host = ExplorerPool.host(evm_contracts[i].api)
+        if scheduler:
+            scheduler.budgets.setdefault(host, 0.8 * rate_limit * len(evm_contracts[i].api_keys))
+
+        start_task(contr['network'].lower(), ScreeningTask(
+            f"{contr['network']} {checkpoint_keys[i][1]}", contract_poll(i), contr.get('sleep_time', sleep_time),
+            poll_timeout, scheduler=scheduler, host=host, **push_options(contr['network'].lower())), [i])
+
+    async def apply_shard(contracts: Dict[str, dict]) -> None:
+        """
+        Starts and stops screening the contracts moved to or away from this worker by its coordinator,
+        leaving the tasks of all other contracts running.
+
+        :param contracts: Dictionary of config name -> config entry of the worker's new shard
+        :return: None
+        """
+        removed = {i for i in active if contract_names[i] not in contracts}
+        screened = {contract_names[i] for i in active}
+        added = [name for name in contracts if name not in screened]
+        if not removed and not added:
+            return
+
+        changed = {contr_addresses[i]['network'].lower() for i in removed}
+        for network, tasks in list(network_tasks.items()):
+            for task in list(tasks):
+                indexes = task_indexes[task]
+                if removed.isdisjoint(indexes):
+                    continue
+
+                stop_task(network, task)
+                # A network scan goes on for its remaining contracts
+                kept = [i for i in indexes if i not in removed]
+                if kept:
+                    start_screener(node_screener(network, kept))
+
+        active.difference_update(removed)
+        node_entries.difference_update(removed)
+        # The new owner resumes the moved contracts from their latest checkpoints
+        try:
+            checkpoints.commit()
+        except sqlite3.Error as e:
+            log_error.warning(f"'CheckpointError' - {checkpoint_file} - {e}")
+
+        # A contract that comes back keeps its instance, new ones are created in threads like on start
+        known = {name: i for i, name in enumerate(contract_names)}
+        loop = asyncio.get_running_loop()
+        created = await asyncio.gather(*(loop.run_in_executor(None, lambda item=contracts[name]: EvmContract(
+            **contract_arguments(item))) for name in added if name not in known))
+        for name, contract in zip([name for name in added if name not in known], created):
+            known[name] = len(contract_names)
+            contract_names.append(name)
+            contr_addresses.append(contracts[name])
+            evm_contracts.append(contract)
+            txn_func, txn_arg, checkpoint_key = screening_of(contracts[name], contract)
+            txn_funcs.append(txn_func)
+            txn_args.append(txn_arg)
+            checkpoint_keys.append(checkpoint_key)
+
+        saved = checkpoints.load()
+        indexes = [known[name] for name in added]
+        for i in indexes:
+            if checkpoint_keys[i] in saved:
+                evm_contracts[i].last_block, saved_hashes = saved[checkpoint_keys[i]]
+                evm_contracts[i].seen.update(saved_hashes)
+            changed.add(contr_addresses[i]['network'].lower())
+        active.update(indexes)
+
+        # Subscriptions follow the contracts of their network
+        for network in changed:
+            subscriber = subscribers.get(network)
+            if not any(contr_addresses[i]['network'].lower() == network for i in active):
+                if subscriber:
+                    runs.pop(subscriber).cancel()
+                    del subscribers[network]
+                network_tasks.pop(network, None)
+                wake_events.pop(network, None)
+            elif subscriber:
+                await subscriber.resubscribe(push_filters(network))
+            elif push and ws_endpoints.get(network):
+                subscribers[network] = LogSubscriber(network, ws_endpoints[network], push_filters(network), wake,
+                                                     wake_all)
+                runs[subscribers[network]] = asyncio.create_task(subscribers[network].run())
+
+        for network in sorted({contr_addresses[i]['network'].lower() for i in indexes}):
+            watched = [i for i in indexes if contr_addresses[i]['network'].lower() == network]
+            if args.erc20tokentxns and erc20_engine == "node" and node_endpoints.get(network):
+                node_entries.update(watched)
+                # Merged into the network scan, which goes on from its cursor
+                task = screener_tasks.get(network)
+                if task:
+                    cursor = evm_contracts[task_indexes[task][0]].last_block
+                    for i in watched:
+                        if evm_contracts[i].last_block is None:
+                            evm_contracts[i].last_block = cursor
+                    watched = task_indexes[task] + watched
+                    stop_task(network, task)
+                start_screener(node_screener(network, watched))
+            else:
+                for i in watched:
+                    start_contract(i)
+
+        timestamp = datetime.now().astimezone().strftime(time_format)
+        print(f"{timestamp} - {worker_name} screening {len(active)} contracts, {len(added)} moved here and "
+              f"{len(removed)} moved away.")
+
+    for screener in node_screeners:
+        start_screener(screener)
+    for i in range(len(contr_addresses)):
+        if i not in node_entries:
+            start_contract(i)
+
+    if coordinator_address:
+        dispatcher.on_shard = apply_shard
+    dispatcher.start()
+
+    reporting = asyncio.create_task(report(network_tasks))
+    try:
+        await reporting
 
-        # If new txns found - check them and send the interesting ones
-        if found_txns:
-            if args.erc20tokentxns:
-                evm_contracts[i].alert_erc20_txns(txns=found_txns, min_txn_amount=item['min_amount'])
-            elif args.transactions:
-                evm_contracts[i].alert_checked_txns(txns=found_txns)
+    finally:
+        background = [reporting, *runs.values()]
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
 
-            # Save latest txns in old_txns only if there is a found txn
-            old_txns[i] = deepcopy(new_txns[i])
+        checkpoints.close()
+        await dispatcher.close()
+        await explorers.close()
+        await metrics.close()
 
-    timestamp = datetime.now().astimezone().strftime(time_format)
-    print(f"{timestamp} - Loop {loop_counter} executed in {(perf_counter() - start):,.2f} secs.")
-    loop_counter += 1
+try:
+    asyncio.run(main())
+except asyncio.CancelledError:
+    print("Screening stopped.")
@@ -0,0 +1,286 @@
+import re
+import asyncio
+import random
+
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from time import time
+from itertools import count
+from typing import (
+    List,
+    Dict,
+    Tuple,
+)
+
+from aiohttp import web
+
+
+# ERC20 'transfer(address,uint256)'
+MOCK_ABI = '[{"type":"function","name":"transfer","stateMutability":"nonpayable",' \
+           '"inputs":[{"name":"to","type":"address"},{"name":"value","type":"uint256"}],' \
+           '"outputs":[{"name":"","type":"bool"}]}]'
+
+TXN_HASH_REGEX = re.compile(r"/tx/(0x[0-9a-f]{64})")
+
+# Txns every address already has on its first request
+BASELINE_TXNS = 5
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Nearest rank percentile of a list of values.
+
+    :param values: List of numbers
+    :param fraction: Percentile between 0 and 1, eg. 0.95
+    :return: Percentile, 0 for an empty list
+    """
+    if not values:
+        return 0
+
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class MockExplorer:
+
+    def __init__(self, txn_rate: float = 0.05, latency: float = 0.05, jitter: float = 0.05,
+                 error_ratio: float = 0, rate_limit: float = 0, rate_limit_mode: str = "etherscan",
+                 block_time: float = 1, telegram_rate: float = 0, seed: int = 0):
+        """
+        Local stand-in for the Etherscan 'txlist', 'tokentx' and 'getabi' endpoints, a node's JSON-RPC
+        and Telegram's 'sendMessage', serving a synthetic stream of new txns for every polled address.
+        Txns are generated lazily on request, each stamped with the time it was 'mined', so the delay
+        until its alert reaches 'sendMessage' is the end-to-end detection latency.
+
+        :param txn_rate: New txns per sec for every address
+        :param latency: Min secs to wait before answering an explorer request
+        :param jitter: Max random secs added to latency
+        :param error_ratio: Fraction of explorer requests answered with a 502 error
+        :param rate_limit: Max explorer requests per sec for each api key, 0 for no limit
+        :param rate_limit_mode: 'etherscan' answers rate limited requests like Etherscan does,
+         with status '0' and 'Max rate limit reached', 'http' answers with a 429 status
+        :param block_time: Secs between two blocks
+        :param telegram_rate: Max Telegram messages per sec, answered with 'retry_after' when exceeded, 0 for no limit
+        :param seed: Seed of random latencies and errors
+        """
+        if rate_limit_mode not in ("etherscan", "http"):
+            raise ValueError(f"Rate limit mode must be 'etherscan' or 'http', not {rate_limit_mode}")
+
+        self.txn_rate = txn_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_ratio = error_ratio
+        self.rate_limit = rate_limit
+        self.rate_limit_mode = rate_limit_mode
+        self.block_time = block_time
+        self.telegram_rate = telegram_rate
+
+        self.random = random.Random(seed)
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forgets all generated txns and statistics, eg. between two benchmark runs.
+
+        :return: None
+        """
+        self.start = time()
+        self.ids = count(1)
+
+        # (action, address, token) -> [txn start time, list of block numbers, list of txns]
+        self.streams: Dict[Tuple[str, str, str], list] = {}
+        # txn hash -> time it was mined
+        self.mined: Dict[str, float] = {}
+        self.alerted: Dict[str, float] = {}
+
+        # api key -> [second, requests within it]
+        self.windows: Dict[str, List[int]] = {}
+        self.telegram_window = [0, 0]
+
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.messages = 0
+        self.telegram_limited = 0
+
+    def block_number(self, at: float) -> int:
+        return 15_000_000 + int((at - self.start) / self.block_time)
+
+    def make_txn(self, action: str, address: str, token: str, mined: float) -> dict:
+        """Creates one synthetic explorer txn mined at a given time."""
+        txn_id = next(self.ids)
+        txn = {
+            "blockNumber": str(self.block_number(mined)),
+            "timeStamp": str(int(mined)),
+            "hash": f"0x{txn_id:064x}",
+            "from": f"0x{self.random.getrandbits(160):040x}",
+            "to": address,
+            "value": str(self.random.randint(10 ** 6, 10 ** 12)),
+            "gas": "21000",
+            "gasPrice": "1000000000",
+            "input": "0xa9059cbb",
+            "functionName": "transfer(address to, uint256 value)",
+        }
+        if action == "tokentx":
+            txn.update({"contractAddress": token, "tokenSymbol": "MOCK", "tokenDecimal": "6", "logIndex": "0"})
+
+        self.mined[txn['hash']] = mined
+        return txn
+
+    def generate(self, action: str, address: str, token: str, now: float) -> list:
+        """Generates the txns of an address mined since its last request."""
+        key = (action, address, token)
+        stream = self.streams.get(key)
+        if stream is None:
+            # A few txns mined before the first request, for the screener's baseline
+            stream = self.streams[key] = [now, [], []]
+            mined_times = [now - age * self.block_time for age in range(BASELINE_TXNS, 0, -1)]
+        else:
+            due = int((now - stream[0]) * self.txn_rate) if self.txn_rate > 0 else 0
+            mined_times = [stream[0] + number / self.txn_rate
+                           for number in range(len(stream[2]) - BASELINE_TXNS + 1, due + 1)]
+
+        for mined in mined_times:
+            txn = self.make_txn(action, address, token, mined)
+            stream[1].append(int(txn['blockNumber']))
+            stream[2].append(txn)
+
+        return stream
+
+    def is_rate_limited(self, window: List[int], limit: float, now: float) -> bool:
+        """Counts a request in a fixed one second window and checks it against a limit."""
+        if window[0] != int(now):
+            window[0], window[1] = int(now), 0
+
+        window[1] += 1
+        return 0 < limit < window[1]
+
+    async def api(self, request: web.Request) -> web.Response:
+        """Explorer 'api' endpoint."""
+        query = request.query
+        now = time()
+        self.requests += 1
+
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        if self.random.random() < self.error_ratio:
+            self.errors += 1
+            return web.Response(status=502, text="<html><body>502 Bad Gateway</body></html>")
+
+        window = self.windows.setdefault(query.get('apikey', ""), [0, 0])
+        if self.is_rate_limited(window, self.rate_limit, now):
+            self.rate_limited += 1
+            if self.rate_limit_mode == "http":
+                return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+            return web.json_response({"status": "0", "message": "NOTOK", "result": "Max rate limit reached"})
+
+        action = query.get('action')
+        if action == "getabi":
+            return web.json_response({"status": "1", "message": "OK", "result": MOCK_ABI})
+
+        if action not in ("txlist", "tokentx"):
+            return web.json_response({"status": "0", "message": "NOTOK", "result": "Error! Missing Or invalid Action"})
+
+        address = query.get('address', "").lower()
+        token = query.get('contractaddress', "").lower()
+        _, blocks, txns = self.generate(action, address, token, now)
+
+        start = bisect_left(blocks, int(query.get('startblock', 0)))
+        end = bisect_right(blocks, int(query.get('endblock', 99999999)))
+        selected = txns[start:end]
+        if query.get('sort') == "desc":
+            selected = selected[::-1]
+
+        page = int(query.get('page', 1))
+        offset = int(query.get('offset', 10000))
+        selected = selected[(page - 1) * offset:page * offset]
+
+        if not selected:
+            return web.json_response({"status": "0", "message": "No transactions found", "result": []})
+
+        return web.json_response({"status": "1", "message": "OK", "result": selected})
+
+    async def rpc(self, request: web.Request) -> web.Response:
+        """Node JSON-RPC endpoint, enough for creating contracts and their proxy check."""
+        data = await request.json()
+        results = {
+            "eth_chainId": "0x1",
+            "net_version": "1",
+            "eth_blockNumber": hex(self.block_number(time())),
+            "eth_getStorageAt": "0x" + "0" * 64,
+        }
+        return web.json_response({"jsonrpc": "2.0", "id": data.get('id'), "result": results.get(data['method'])})
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        """Telegram 'sendMessage' endpoint, recording when each txn's first alert arrives."""
+        data = await request.post()
+        now = time()
+
+        if self.is_rate_limited(self.telegram_window, self.telegram_rate, now):
+            self.telegram_limited += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}})
+
+        self.messages += 1
+        for txn_hash in TXN_HASH_REGEX.findall(data.get('text', "")):
+            if txn_hash in self.mined and txn_hash not in self.alerted:
+                self.alerted[txn_hash] = now
+
+        return web.json_response({"ok": True, "result": {}})
+
+    def stats(self) -> dict:
+        """
+        Statistics since the last reset.
+
+        :return: Dictionary of statistics
+        """
+        latencies = [alerted - self.mined[txn_hash] for txn_hash, alerted in self.alerted.items()]
+        # Txns mined after the first request of their address, ie. the ones the screener should alert
+        expected = sum(len(stream[2]) - BASELINE_TXNS for stream in self.streams.values())
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "messages": self.messages,
+            "telegram_limited": self.telegram_limited,
+            "txns": expected,
+            "alerted": len(latencies),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "latency_max": max(latencies, default=0),
+        }
+
+    async def stats_endpoint(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def reset_endpoint(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"ok": True})
+
+    def app(self) -> web.Application:
+        """
+        Creates the aiohttp application serving all mock endpoints.
+
+        :return: aiohttp Application
+        """
+        app = web.Application()
+        app.router.add_get("/api", self.api)
+        app.router.add_post("/rpc", self.rpc)
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        app.router.add_get("/stats", self.stats_endpoint)
+        app.router.add_post("/reset", self.reset_endpoint)
+
+        return app
+
+    def run(self, host: str = "127.0.0.1", port: int = 8597) -> None:
+        """
+        Serves the mock endpoints until the process is stopped.
+
+        :param host: Host to listen on
+        :param port: Port to listen on
+        :return: None
+        """
+        web.run_app(self.app(), host=host, port=port, print=None, access_log=None)
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from time import time
+from typing import Optional
+
+
+# bytes32(uint256(keccak256('eip1967.proxy.implementation')) - 1)
+EIP1967_IMPLEMENTATION_SLOT = "0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc"
+
+
+class AbiCache:
+
+    def __init__(self, directory: str = "logs/abi", ttl: float = 7 * 24 * 60 * 60):
+        """
+        Content-addressed on-disk cache of contract ABIs.
+        Each ABI is stored once under its sha256 digest, and an index file per network and address
+        points at the digest, the proxy implementation address if any, and when it was fetched.
+
+        :param directory: Cache directory
+        :param ttl: Secs after which a cached ABI is fetched again
+        """
+        self.directory = directory
+        self.ttl = ttl
+
+    def _index_path(self, network: str, address: str) -> str:
+        return os.path.join(self.directory, "index", network.lower(), f"{address.lower()}.json")
+
+    def _abi_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "abi", f"{digest}.json")
+
+    @staticmethod
+    def _write(path: str, text: str) -> None:
+        """Writes a file atomically, so a crash never leaves a half written cache entry."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # A temp file of its own, contracts sharing an ABI may be created by several threads at once
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                file.write(text)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def get(self, network: str, address: str) -> Optional[str]:
+        """
+        Gets a cached ABI if it has not expired.
+
+        :param network: Network name
+        :param address: Contract's address
+        :return: Contract's ABI as JSON text or None if not cached
+        """
+        try:
+            with open(self._index_path(network, address)) as file:
+                entry = json.load(file)
+
+            if time() - entry['fetched_at'] > self.ttl:
+                return None
+
+            with open(self._abi_path(entry['digest'])) as file:
+                return file.read()
+
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, network: str, address: str, abi: str, implementation: Optional[str] = None) -> None:
+        """
+        Caches a contract's ABI.
+
+        :param network: Network name
+        :param address: Contract's address
+        :param abi: Contract's ABI as JSON text
+        :param implementation: Implementation address if the contract is a proxy
+        :return: None
+        """
+        digest = hashlib.sha256(abi.encode()).hexdigest()
+
+        if not os.path.exists(self._abi_path(digest)):
+            self._write(self._abi_path(digest), abi)
+
+        entry = {"digest": digest, "implementation": implementation, "fetched_at": time()}
+        self._write(self._index_path(network, address), json.dumps(entry))
+
+    def invalidate(self, network: str, address: str) -> None:
+        """
+        Removes a contract from the cache, so its ABI is fetched again on next use.
+
+        :param network: Network name
+        :param address: Contract's address
+        :return: None
+        """
+        try:
+            os.remove(self._index_path(network, address))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,490 @@
+import os
+import json
+import asyncio
+
+from time import perf_counter
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+from src.contractscreener.blockchain.explorer import ExplorerPool
+from src.contractscreener.blockchain.node import (
+    NodeClient,
+    decode_transfer,
+)
+from src.contractscreener.blockchain.records import (
+    Txn,
+    loads,
+)
+from src.contractscreener.common.logger import log_error
+from src.contractscreener.common.metrics import (
+    txns_scanned,
+    request_errors,
+    request_seconds,
+)
+from src.contractscreener.variables import etherscans
+
+
+# Etherscan compatible explorers return at most 10,000 txns for one block range, over all of its pages
+MAX_RESULTS = 10000
+
+
+def parquet_schema():
+    """
+    Column types of the Parquet output. Values can exceed 64 bits and are kept as decimal strings.
+
+    :return: pyarrow Schema
+    """
+    return pyarrow.schema([
+        ("network", pyarrow.string()), ("contract", pyarrow.string()), ("hash", pyarrow.string()),
+        ("blockNumber", pyarrow.int64()), ("timeStamp", pyarrow.int64()), ("from", pyarrow.string()),
+        ("to", pyarrow.string()), ("value", pyarrow.string()), ("input", pyarrow.string()),
+        ("functionName", pyarrow.string()), ("gasPrice", pyarrow.string()), ("contractAddress", pyarrow.string()),
+        ("tokenSymbol", pyarrow.string()), ("tokenDecimal", pyarrow.int64()), ("logIndex", pyarrow.int64()),
+    ])
+
+
+class ChunkWriter:
+
+    def __init__(self, filename: str, output_format: str = "jsonl"):
+        """
+        Streams the rows of one chunk to a temporary file, which is renamed to its final name only once
+        the whole chunk has been fetched. A chunk file that exists is therefore always complete.
+
+        :param filename: Final path of the chunk file
+        :param output_format: 'jsonl' or 'parquet'
+        """
+        self.filename = filename
+        self.temp_file = f"{filename}.tmp"
+        self.output_format = output_format
+        self.rows = 0
+
+        self._file = None
+        self._writer = None
+
+    def write(self, rows: List[Dict[str, object]]) -> None:
+        """
+        Appends rows to the chunk file, eg. one explorer page.
+
+        :param rows: List of row dictionaries
+        :return: None
+        """
+        self.rows += len(rows)
+
+        if self.output_format == "parquet":
+            if self._writer is None:
+                self._writer = parquet.ParquetWriter(self.temp_file, parquet_schema(), compression="zstd")
+            for row in rows:
+                row['value'] = str(row['value'])
+                row['gasPrice'] = str(row['gasPrice'])
+            # Each page becomes a row group, so memory is bounded by a page
+            self._writer.write_table(pyarrow.Table.from_pylist(rows, schema=parquet_schema()))
+            return
+
+        if self._file is None:
+            self._file = open(self.temp_file, "w")
+        self._file.writelines(f"{json.dumps(row, separators=(',', ':'))}\n" for row in rows)
+
+    def close(self) -> None:
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def commit(self, filename: Optional[str] = None) -> None:
+        """
+        Marks the chunk complete by moving its file to the final name, also for a chunk without any rows.
+
+        :param filename: Final path, if only part of the chunk was fetched
+        :return: None
+        """
+        self.close()
+        if not os.path.exists(self.temp_file):
+            self.write([])
+            self.close()
+        os.replace(self.temp_file, filename or self.filename)
+
+    def discard(self) -> None:
+        """
+        Drops a partially fetched chunk.
+
+        :return: None
+        """
+        self.close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+        self.rows = 0
+
+
+class Backfill:
+
+    def __init__(self, contracts: List[dict], explorers: ExplorerPool, from_block: int, to_block: int,
+                 chunk_blocks: int = 10000, page_size: int = 1000, concurrency: int = 4,
+                 output_dir: str = "logs/backfill", output_format: str = "jsonl", engine: str = "explorer",
+                 node_endpoints: Optional[Dict[str, str]] = None, retries: int = 3, timeout: float = 30):
+        """
+        Scans a block range for the txns of every contract and writes them to one file per chunk of blocks.
+        Chunks are fetched concurrently, each request waiting for the shared explorer rate limits.
+        Chunk files already written are skipped, so an interrupted backfill resumes where it stopped.
+        Contract entries with a 'token_address' are backfilled with their Erc20 Transfers.
+
+        :param contracts: List of contract entries of the config file
+        :param explorers: Shared pool of explorer sessions, rate limits and API keys
+        :param from_block: First block of range
+        :param to_block: Last block of range
+        :param chunk_blocks: Number of blocks in each chunk
+        :param page_size: Number of txns in each explorer page
+        :param concurrency: Number of chunks fetched at the same time
+        :param output_dir: Directory of the chunk files, one sub directory per contract
+        :param output_format: 'jsonl' or 'parquet'
+        :param engine: 'explorer' pages through txlist/tokentx, 'node' reads Erc20 Transfers with eth_getLogs
+        :param node_endpoints: Network -> JSON-RPC url, for the node engine
+        :param retries: Number of times a failed chunk is fetched again before it is left for the next run
+        :param timeout: Max number of secs to wait for a request
+        """
+        if output_format == "parquet" and pyarrow is None:
+            raise ImportError("Parquet output needs pyarrow, install it with 'poetry install --extras parquet'")
+
+        self.contracts = contracts
+        self.explorers = explorers
+        self.from_block = from_block
+        self.to_block = to_block
+        self.chunk_blocks = max(chunk_blocks, 1)
+        self.page_size = min(page_size, MAX_RESULTS)
+        self.concurrency = concurrency
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.engine = engine
+        self.node_endpoints = node_endpoints or {}
+        self.retries = retries
+        self.timeout = timeout
+
+        self.nodes: Dict[str, NodeClient] = {}
+        # Token address -> (symbol, decimals) for decoding node Transfer logs
+        self.token_info: Dict[str, Tuple[str, int]] = {}
+
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.chunks_failed = 0
+        self.txns = 0
+
+    def contract_dir(self, contract: dict) -> str:
+        """
+        Directory of a contract's chunk files, eg. 'logs/backfill/ethereum_0xa3c6...b63a'.
+
+        :param contract: Contract entry
+        :return: Directory path
+        """
+        name = f"{contract['network']}_{contract.get('token_address', '')}_{contract['contract_address']}"
+
+        return os.path.join(self.output_dir, name.replace("__", "_").lower())
+
+    def chunk_file(self, contract: dict, from_block: int, to_block: int) -> str:
+        extension = "parquet" if self.output_format == "parquet" else "jsonl"
+
+        return os.path.join(self.contract_dir(contract), f"{from_block:010d}-{to_block:010d}.{extension}")
+
+    def written(self, contract: dict) -> List[Tuple[int, int]]:
+        """
+        Block ranges of the chunk files an earlier run wrote for a contract.
+
+        :param contract: Contract entry
+        :return: Sorted list of first and last block of each chunk file
+        """
+        extension = "parquet" if self.output_format == "parquet" else "jsonl"
+
+        ranges = []
+        for file in os.listdir(self.contract_dir(contract)):
+            name, _, file_extension = file.partition(".")
+            first, _, last = name.partition("-")
+            if file_extension == extension and first.isdigit() and last.isdigit():
+                ranges.append((int(first), int(last)))
+
+        return sorted(ranges)
+
+    @staticmethod
+    def missing(from_block: int, to_block: int, written: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Block ranges within a chunk not covered by any chunk file.
+
+        :param from_block: First block of chunk
+        :param to_block: Last block of chunk
+        :param written: Sorted list of first and last block of each chunk file
+        :return: List of first and last block of each missing range
+        """
+        gaps = []
+        cursor = from_block
+        for first, last in written:
+            if last < cursor:
+                continue
+            if first > to_block:
+                break
+            if first > cursor:
+                gaps.append((cursor, first - 1))
+            cursor = last + 1
+
+        if cursor <= to_block:
+            gaps.append((cursor, to_block))
+
+        return gaps
+
+    def chunks(self) -> List[Tuple[dict, int, int]]:
+        """
+        Splits the block range of every contract into chunks aligned to multiples of chunk_blocks,
+        leaving out the blocks already written by an earlier run.
+
+        :return: List of contract entry, first block and last block of each chunk still to fetch
+        """
+        chunks = []
+        for contract in self.contracts:
+            os.makedirs(self.contract_dir(contract), exist_ok=True)
+            written = self.written(contract)
+
+            start = self.from_block
+            while start <= self.to_block:
+                end = min((start // self.chunk_blocks + 1) * self.chunk_blocks - 1, self.to_block)
+                gaps = self.missing(start, end, written)
+
+                self.chunks_total += max(len(gaps), 1)
+                if not gaps:
+                    self.chunks_done += 1
+                chunks += [(contract, first, last) for first, last in gaps]
+                start = end + 1
+
+        return chunks
+
+    def node(self, network: str) -> NodeClient:
+        if network not in self.nodes:
+            self.nodes[network] = NodeClient(network, self.node_endpoints[network], self.explorers)
+
+        return self.nodes[network]
+
+    async def fetch_explorer(self, contract: dict, from_block: int, to_block: int,
+                             writer: ChunkWriter) -> Optional[int]:
+        """
+        Pages through an explorer's txlist or tokentx results of a block range, oldest first.
+        A range holding more txns than the explorer's result window is written up to the block the window
+        ends in.
+
+        :param contract: Contract entry
+        :param from_block: First block of range
+        :param to_block: Last block of range
+        :param writer: Writer of the chunk file
+        :return: Last block whose txns were all written, or None if a request failed
+        """
+        network = contract['network'].lower()
+        api = etherscans[network][0]
+        if 'token_address' in contract:
+            api = f"{api}/api?module=account&action=tokentx"
+            payload = {"contractaddress": contract['token_address'], "address": contract['contract_address']}
+        else:
+            api = f"{api}/api?module=account&action=txlist"
+            payload = {"address": contract['contract_address']}
+
+        host = self.explorers.host(api)
+        api_keys = self.explorers.keys(network)
+
+        # Txns of the last block of a page may continue on the next page, they are held back until it is read
+        pending: List[Txn] = []
+
+        page = 1
+        while True:
+            # A further page would go past the explorer's result window
+            if page * self.page_size > MAX_RESULTS:
+                return pending[0].block_number - 1
+
+            api_key, _ = await self.explorers.acquire_key(api, network)
+            params = {**payload, "startblock": from_block, "endblock": to_block, "page": page,
+                      "offset": self.page_size, "sort": "asc", "apikey": api_key}
+
+            start = perf_counter()
+            try:
+                async with self.explorers.session(api).get(api, params=params, timeout=self.timeout) as response:
+                    txn_dict = loads(await response.read())
+            except Exception as e:
+                request_errors.inc(host=host, kind="connection")
+                api_keys.record(api_key, "error")
+                log_error.warning(f"'BackfillError' - {network} blocks {from_block}-{to_block} - {e}")
+                return None
+            request_seconds.observe(perf_counter() - start, host=host)
+
+            if not isinstance(txn_dict, dict) or txn_dict.get('status') != "1":
+                if isinstance(txn_dict, dict) and txn_dict.get('message') == "No transactions found":
+                    api_keys.record(api_key, "ok")
+                    self.write_txns(contract, pending, writer)
+                    return to_block
+
+                result = str(txn_dict.get('result', "") if isinstance(txn_dict, dict) else txn_dict).lower()
+                rate_limited = "rate limit" in result
+                api_keys.record(api_key, "rate_limit" if rate_limited else "invalid" if "api key" in result
+                                else "error")
+                request_errors.inc(host=host, kind="rate_limit" if rate_limited else "response")
+                log_error.warning(f"'BackfillError' - {network} blocks {from_block}-{to_block} - {txn_dict}")
+                return None
+
+            api_keys.record(api_key, "ok")
+            try:
+                txns = [Txn.from_explorer(txn) for txn in txn_dict['result']]
+            except (TypeError, KeyError, AttributeError):
+                request_errors.inc(host=host, kind="response")
+                log_error.warning(f"'BackfillError' - {network} blocks {from_block}-{to_block} - unexpected txn")
+                return None
+
+            if len(txns) < self.page_size:
+                self.write_txns(contract, pending + txns, writer)
+                return to_block
+
+            last_block = txns[-1].block_number
+            self.write_txns(contract, [txn for txn in pending + txns if txn.block_number < last_block], writer)
+            pending = [txn for txn in pending + txns if txn.block_number == last_block]
+            page += 1
+
+    async def fetch_node(self, contract: dict, from_block: int, to_block: int,
+                         writer: ChunkWriter) -> Optional[int]:
+        """
+        Reads the Erc20 Transfers of a block range from the node's logs.
+
+        :param contract: Contract entry
+        :param from_block: First block of range
+        :param to_block: Last block of range
+        :param writer: Writer of the chunk file
+        :return: Last block of range, or None if a request failed, eg. too many logs for one range
+        """
+        node = self.node(contract['network'].lower())
+        token_address = contract['token_address']
+
+        if token_address not in self.token_info:
+            metadata = await node.erc20_metadata(token_address, self.timeout)
+            if metadata is None:
+                return None
+            self.token_info[token_address] = metadata
+
+        logs = await node.get_transfers(token_address, contract['contract_address'], from_block, to_block,
+                                        self.timeout)
+        if logs is None:
+            return None
+
+        symbol, decimals = self.token_info[token_address]
+        self.write_txns(contract, [decode_transfer(log, symbol, decimals) for log in logs], writer)
+
+        return to_block
+
+    def write_txns(self, contract: dict, txns: List[Txn], writer: ChunkWriter) -> None:
+        network = contract['network'].lower()
+        writer.write([{"network": network, "contract": contract['contract_address'], **txn.to_dict()}
+                      for txn in txns])
+
+        txns_scanned.inc(len(txns), network=network)
+        self.txns += len(txns)
+
+    async def fetch_chunk(self, contract: dict, from_block: int, to_block: int,
+                          queue: "asyncio.Queue[Tuple[dict, int, int]]") -> None:
+        """
+        Fetches one chunk into its file, a failed one is fetched again with a growing delay. The rest of a chunk
+        holding more txns than the explorer returns, or more logs than the node returns, is put back on the queue.
+
+        :param contract: Contract entry
+        :param from_block: First block of chunk
+        :param to_block: Last block of chunk
+        :param queue: Queue of chunks to fetch
+        :return: None
+        """
+        use_node = self.engine == "node" and 'token_address' in contract
+        writer = ChunkWriter(self.chunk_file(contract, from_block, to_block), self.output_format)
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+
+            try:
+                if use_node:
+                    last_block = await self.fetch_node(contract, from_block, to_block, writer)
+                else:
+                    last_block = await self.fetch_explorer(contract, from_block, to_block, writer)
+            except BaseException:
+                writer.discard()
+                raise
+
+            if last_block is not None and last_block >= from_block:
+                writer.commit(self.chunk_file(contract, from_block, last_block))
+                self.chunks_done += 1
+                if last_block < to_block:
+                    self.chunks_total += 1
+                    queue.put_nowait((contract, last_block + 1, to_block))
+                return
+
+            writer.discard()
+
+            # A single block with more txns than the explorer's result window
+            if last_block is not None:
+                break
+
+            # Maybe too many logs for the node - fetch each half on its own. Only down to 1/16 of a chunk,
+            # so the chunks of an unreachable node are not split any further
+            if use_node and to_block - from_block + 1 > max(self.chunk_blocks // 16, 1):
+                middle = (from_block + to_block) // 2
+                self.chunks_total += 1
+                queue.put_nowait((contract, from_block, middle))
+                queue.put_nowait((contract, middle + 1, to_block))
+                return
+
+        self.chunks_failed += 1
+        log_error.warning(f"'BackfillError' - gave up on {self.chunk_file(contract, from_block, to_block)}, "
+                          f"it is fetched again on the next run")
+
+    async def worker(self, queue: "asyncio.Queue[Tuple[dict, int, int]]") -> None:
+        while True:
+            contract, from_block, to_block = await queue.get()
+            try:
+                await self.fetch_chunk(contract, from_block, to_block, queue)
+            finally:
+                queue.task_done()
+
+    async def report(self, interval: float = 10) -> None:
+        start = perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            print(self.progress(perf_counter() - start))
+
+    def progress(self, secs: float) -> str:
+        return f"Backfill: {self.chunks_done}/{self.chunks_total} chunks, {self.chunks_failed} failed, " \
+               f"{self.txns:,} txns in {secs:,.0f} secs ({self.txns / max(secs, 1e-9):,.0f} txns/s)"
+
+    async def run(self, report_interval: float = 10) -> bool:
+        """
+        Fetches every chunk still missing.
+
+        :param report_interval: Secs between two progress lines
+        :return: True if every chunk has been written
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in self.chunks():
+            queue.put_nowait(chunk)
+
+        start = perf_counter()
+        print(f"Backfill: blocks {self.from_block}-{self.to_block} of {len(self.contracts)} contracts, "
+              f"{queue.qsize()}/{self.chunks_total} chunks to fetch.")
+
+        tasks = [asyncio.create_task(self.worker(queue)) for _ in range(max(self.concurrency, 1))]
+        tasks.append(asyncio.create_task(self.report(report_interval)))
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        print(self.progress(perf_counter() - start))
+
+        return self.chunks_failed == 0
@@ -0,0 +1,110 @@
+from collections import deque
+from time import monotonic
+from typing import Deque
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+
+    def __init__(self, window: int = 20, min_requests: int = 10, failure_ratio: float = 0.5,
+                 slow_secs: float = 2.5, open_secs: float = 30):
+        """
+        Circuit breaker of one endpoint, driven by its recent errors and latency.
+        Closed, requests flow and their outcomes are recorded. Once too many recent requests failed or were slow,
+        it opens and requests are skipped for open_secs. It then goes half-open and lets a single trial request
+        through, which closes it again on success or reopens it on failure.
+
+        :param window: Number of recent requests the failure ratio is taken over
+        :param min_requests: Min number of recent requests before the breaker may open
+        :param failure_ratio: Ratio of failed or slow recent requests that opens the breaker
+        :param slow_secs: Secs after which a successful request counts as failed
+        :param open_secs: Secs to skip requests for once open
+        """
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.slow_secs = slow_secs
+        self.open_secs = open_secs
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial = False
+
+        # True for each failed or slow recent request
+        self.outcomes: Deque[bool] = deque(maxlen=max(window, 1))
+        # Secs taken by recent successful requests
+        self.latencies: Deque[float] = deque(maxlen=100)
+
+    def allow(self) -> bool:
+        """
+        Checks whether a request may be sent now, taking the trial request slot if half-open.
+
+        :return: True if the request may be sent
+        """
+        if self.state == OPEN:
+            if monotonic() - self.opened_at < self.open_secs:
+                return False
+            self.state = HALF_OPEN
+            self.trial = False
+
+        if self.state == HALF_OPEN:
+            if self.trial:
+                return False
+            self.trial = True
+
+        return True
+
+    def record(self, success: bool, latency: float = 0.0) -> None:
+        """
+        Records the outcome of a request allowed by allow().
+
+        :param success: True if the request succeeded
+        :param latency: Secs the request took
+        :return: None
+        """
+        if success:
+            self.latencies.append(latency)
+
+        failed = not success or latency > self.slow_secs
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open()
+            else:
+                self.state = CLOSED
+                self.outcomes.clear()
+            return
+
+        self.outcomes.append(failed)
+        if len(self.outcomes) >= self.min_requests and sum(self.outcomes) / len(self.outcomes) >= self.failure_ratio:
+            self._open()
+
+    def release(self) -> None:
+        """
+        Gives back an allowed request that was cancelled before it had an outcome, eg. the slower of two hedges.
+
+        :return: None
+        """
+        if self.state == HALF_OPEN:
+            self.trial = False
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = monotonic()
+        self.outcomes.clear()
+
+    def p95(self, default: float = 1.0) -> float:
+        """
+        95th percentile of recent successful request latencies.
+
+        :param default: Secs returned before any request succeeded
+        :return: Secs
+        """
+        if not self.latencies:
+            return default
+
+        latencies = sorted(self.latencies)
+
+        return latencies[min(int(0.95 * len(latencies)), len(latencies) - 1)]
@@ -1,9 +1,12 @@
-import os
 import json
+import asyncio
+
+from time import (
+    time,
+    perf_counter,
+)
 
 from requests.exceptions import ConnectionError
-from aiohttp import ClientSession
-from json.decoder import JSONDecodeError
 
 from datetime import (
     datetime,
@@ -12,15 +15,55 @@ from datetime import (
 from typing import (
     List,
     Dict,
+    Tuple,
+    Union,
+    Optional,
+    Callable,
+    Iterator,
 )
 
 from web3 import Web3
+from eth_abi import decode_abi
+from aiohttp import ClientResponse
 from web3.contract import Contract
+from eth_utils.abi import collapse_if_tuple
 
+from src.contractscreener.blockchain.abi import (
+    AbiCache,
+    EIP1967_IMPLEMENTATION_SLOT,
+)
+from src.contractscreener.blockchain.explorer import ExplorerPool
+from src.contractscreener.blockchain.keys import ApiKeyPool
+from src.contractscreener.blockchain.multicall import MulticallBatcher
+from src.contractscreener.blockchain.node import (
+    NodeClient,
+    decode_transfer,
+)
+from src.contractscreener.blockchain.providers import providers
+from src.contractscreener.blockchain.seen import SeenHashes
+from src.contractscreener.blockchain.records import (
+    Txn,
+    loads,
+)
+from src.contractscreener.blockchain.response import ResultStream
+from src.contractscreener.blockchain.filters import (
+    Predicate,
+    apply_filter,
+    compile_filter,
+)
 from src.contractscreener.common.message import telegram_send_message
+from src.contractscreener.common.metrics import (
+    txns_scanned,
+    node_failovers,
+    request_errors,
+    request_seconds,
+    hedged_requests,
+)
 from src.contractscreener.common.logger import (
     log_txns,
     log_error,
+    log_journal,
+    log_polls,
 )
 from src.contractscreener.variables import (
     time_format,
@@ -32,13 +75,33 @@ from src.contractscreener.variables import (
 
 class EvmContract:
 
-    def __init__(self, name: str, contract_address: str, web3_endpoint: str = ""):
+    def __init__(self, name: str, contract_address: str, web3_endpoint: str = "",
+                 explorers: Optional[ExplorerPool] = None, seen_size: int = 1000,
+                 notify: Optional[Callable[..., None]] = None, abi_cache: Optional[AbiCache] = None,
+                 mirrors: Optional[List[str]] = None, hedge: bool = False, hedge_min_delay: float = 0.25,
+                 node_failover: bool = True, offline: bool = False,
+                 multicall: Optional[MulticallBatcher] = None, alert_reads: Optional[list] = None):
         """
         EVM contract and transaction screener class.
 
         :param name: Network name
         :param contract_address: Contract address on given network
         :param web3_endpoint: Node provider network url endpoint
+        :param explorers: Shared pool of explorer sessions, owned and closed by the caller
+        :param seen_size: Max number of recent txn hashes to remember for spotting new txns
+        :param notify: Function that sends an alert message, also given the txn's network, on-chain txn_time and
+         alert_key keywords, eg. TelegramDispatcher.send. Default sends the message right away with
+         telegram_send_message
+        :param abi_cache: On-disk ABI cache, contracts found in it are created without any network call
+        :param mirrors: Explorer api urls serving the same data as the network's explorer, eg. a self-hosted one
+        :param hedge: If true, a request slower than its host's p95 latency is also sent to the next healthy mirror
+        :param hedge_min_delay: Min secs to wait before sending a hedged request
+        :param node_failover: If true, Erc20 txns are read from the node's Transfer logs while every explorer
+         host is down
+        :param offline: If true, no ABI is loaded and no contract instance created, eg. to replay recorded txns
+        :param multicall: Shared batcher of the network's contract reads, used by call_function
+        :param alert_reads: Read-only functions of the contract whose current results are added to its alerts,
+         each a function name or a [function name, arguments] pair, eg. ['totalSupply', ['balanceOf', ['0x...']]]
         """
 
         if name.lower() not in etherscans:
@@ -50,7 +113,38 @@ class EvmContract:
         self.web_page = etherscans[self.name][1]
         self.color = etherscans[self.name][2]
 
-        self.node_api_key = os.getenv(f"{self.name.upper()}_API_KEY")
+        self.explorers = explorers if explorers else ExplorerPool()
+        self.mirrors = [mirror.rstrip("/") for mirror in mirrors or []]
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+
+        # Reads Erc20 Transfers from the node while the explorer is down
+        node_endpoint = web3_endpoint or infura_endpoints.get(self.name)
+        self.node = NodeClient(self.name, node_endpoint, self.explorers) if node_failover and node_endpoint else None
+        # Token address -> (symbol, decimals), learnt from explorer txns for decoding node Transfer logs
+        self.token_info: Dict[str, Tuple[str, int]] = {}
+
+        self.multicall = multicall
+        self.alert_reads: List[Tuple[str, list]] = []
+        for read in alert_reads or []:
+            name, args = (read, []) if isinstance(read, str) else read
+            # Web3 only takes checksummed address arguments
+            self.alert_reads.append((name, [Web3.toChecksumAddress(arg) if isinstance(arg, str) and Web3.isAddress(arg)
+                                            else arg for arg in args]))
+
+        # Highest block processed so far and explorer page to request within it
+        self.last_block: Optional[int] = None
+        self.page = 1
+        # True while more new txns arrived than fit on one page, which are then paged through in ascending order
+        self.catching_up = False
+
+        self.seen = SeenHashes(seen_size)
+
+        self.notify = notify if notify else lambda message, **labels: telegram_send_message(message)
+
+        # Explorer requests rotate over all of the network's API keys, one-off requests use the first one
+        self.api_keys = self.explorers.keys(self.name)
+        self.node_api_key = self.api_keys.first()
 
         self.abi_endpoint = f"{self.api}/api?module=contract&action=getabi"
 
@@ -59,14 +153,76 @@ class EvmContract:
         self.erc20_api = f"{self.api}/api?module=account&action=tokentx"
 
         # Create contract instance
+        if offline:
+            self.contract = None
+            return
+
         try:
-            abi = self.get_contract_abi(self.contract_address, self.name, self.abi_endpoint)
+            abi = self.load_abi(abi_cache, web3_endpoint)
             self.contract = self.create_contract(self.name, self.contract_address, abi, web3_endpoint)
         except Exception as e:
             self.contract = None
             message = f"Contract instance not created for {self.name}, {self.contract_address}. {e}"
             log_error.warning(message)
 
+            if abi_cache:
+                abi_cache.invalidate(self.name, self.contract_address)
+
+    def load_abi(self, abi_cache: Optional[AbiCache] = None, web3_endpoint: str = "") -> str:
+        """
+        Loads the contract's ABI from the cache, or from the explorer on a cache miss.
+        EIP-1967 proxies get the ABI of their implementation contract.
+
+        :param abi_cache: On-disk ABI cache
+        :param web3_endpoint: Node provider network url endpoint
+        :return: Contract's ABI
+        """
+        if abi_cache:
+            abi = abi_cache.get(self.name, self.contract_address)
+            if abi:
+                return abi
+
+        cacheable = True
+        try:
+            implementation = self.get_proxy_implementation(self.name, self.contract_address, web3_endpoint)
+        except Exception as e:
+            # Do not cache an ABI that may belong to the proxy rather than its implementation
+            log_error.warning(f"'ProxyError': Unable to resolve proxy for {self.name}, {self.contract_address}. {e}")
+            implementation = None
+            cacheable = False
+
+        abi = self.get_contract_abi(implementation or self.contract_address, self.name, self.abi_endpoint)
+
+        # Explorers return an error text instead of an ABI for unverified contracts
+        if not isinstance(abi, str) or not isinstance(json.loads(abi), list):
+            raise ValueError(f"No ABI available - {abi}")
+
+        if abi_cache and cacheable:
+            abi_cache.put(self.name, self.contract_address, abi, implementation)
+
+        return abi
+
+    @staticmethod
+    def get_proxy_implementation(network: str, address: str, web3_endpoint: str = "") -> Optional[str]:
+        """
+        Reads the implementation address of an EIP-1967 proxy contract.
+
+        :param network: Name of Blockchain, eg. Ethereum or Optimism
+        :param address: Contract's address
+        :param web3_endpoint: Node provider network url endpoint
+        :return: Implementation address or None if the contract is not a proxy
+        """
+        # Shared, pooled Web3 instance of the network
+        w3 = providers.get(network, web3_endpoint)
+
+        slot = w3.eth.get_storage_at(Web3.toChecksumAddress(address), int(EIP1967_IMPLEMENTATION_SLOT, 16))
+        implementation = "0x" + slot.hex()[-40:]
+
+        if int(implementation, 16) == 0:
+            return None
+
+        return implementation.lower()
+
     @staticmethod
     def run_contract_function(contract_instance: Contract, function_name: str, args_list: list):
         """
@@ -85,6 +241,73 @@ class EvmContract:
 
         return result
 
+    async def call_function(self, function_name: str, args_list: list, ttl: Optional[float] = None):
+        """
+        Runs a read-only function of the contract, like run_contract_function. With a MulticallBatcher, reads made
+        at about the same time by any contract of the network are sent in one request, eg. when enriching alerts.
+
+        :param function_name: Name of function to get executed
+        :param args_list: List of arguments to pass to function
+        :param ttl: Secs to cache the result, default caches only immutable reads, eg. decimals()
+        :return: Decoded return value, a list for functions with several outputs, None if the read failed
+        """
+        if self.contract is None:
+            return None
+
+        if self.multicall is None:
+            try:
+                return await asyncio.to_thread(self.run_contract_function, self.contract, function_name, args_list)
+            except Exception as e:
+                log_error.warning(f"'CallError' - {self.name} {self.contract_address}.{function_name} - {e}")
+                return None
+
+        try:
+            contract_func = self.contract.functions[str(function_name)](*args_list)
+            data = self.contract.encodeABI(fn_name=str(function_name), args=args_list)
+        except Exception as e:
+            log_error.warning(f"'CallError' - {self.name} {self.contract_address}.{function_name} - {e}")
+            return None
+
+        result = await self.multicall.call(self.contract_address, data, ttl)
+        if not result or result == "0x":
+            return None
+
+        output_types = [collapse_if_tuple(output) for output in contract_func.abi['outputs']]
+        try:
+            values = decode_abi(output_types, bytes.fromhex(result[2:]))
+        except Exception as e:
+            log_error.warning(f"'DecodeError' - {self.name} {self.contract_address}.{function_name} - {e}")
+            return None
+
+        return values[0] if len(values) == 1 else list(values)
+
+    async def read_alert_fields(self) -> Dict[str, object]:
+        """
+        Reads the alert_reads functions of the contract all at once, so a MulticallBatcher sends them in one request
+        together with the reads of the network's other contracts.
+
+        :return: Function call -> its result, eg. {'totalSupply': 10**24}, failed reads are left out
+        """
+        results = await asyncio.gather(*(self.call_function(name, args) for name, args in self.alert_reads))
+
+        fields = {}
+        for (name, args), result in zip(self.alert_reads, results):
+            if result is not None:
+                fields[f"{name}({', '.join(str(arg) for arg in args)})" if args else name] = result
+
+        return fields
+
+    @staticmethod
+    def format_fields(fields: Optional[Dict[str, object]]) -> str:
+        """
+        Alert message lines of the alert_reads results.
+
+        :param fields: Function call -> its result
+        :return: One line per field, each starting with a new line
+        """
+        return "".join(f"\n{name}: {value:,}" if isinstance(value, int) and not isinstance(value, bool)
+                       else f"\n{name}: {value}" for name, value in (fields or {}).items())
+
     @staticmethod
     def get_contract_abi(address: str, network: str, abi_endpoint: str, timeout: float = 3) -> str or None:
         """
@@ -96,7 +319,7 @@ class EvmContract:
         :param timeout: Max number of secs to wait for request
         :return: Contract's ABI
         """
-        node_api_key = os.getenv(f"{network.upper()}_API_KEY")
+        node_api_key = ApiKeyPool.from_env(network).first()
 
         # Contract's ABI
         payload = {'address': address, 'apikey': node_api_key}
@@ -124,10 +347,8 @@ class EvmContract:
         :param web3_endpoint: Node provider network url endpoint
         :return: web3 Contract instance
         """
-        if web3_endpoint == "":
-            web3_endpoint = infura_endpoints[network.lower()]
-
-        w3 = Web3(Web3.HTTPProvider(web3_endpoint))
+        # Shared, pooled Web3 instance of the network
+        w3 = providers.get(network, web3_endpoint)
 
         # Convert transaction address to check-sum address
         checksum_address = Web3.toChecksumAddress(address)
@@ -152,100 +373,406 @@ class EvmContract:
 
         return func_params
 
+    def filter_new_txns(self, txns: List[Txn]) -> List[Txn]:
+        """
+        Filters out transactions already seen by this contract and remembers the new ones.
+
+        :param txns: List of transaction records
+        :return: List of transaction records not seen before
+        """
+        return self.seen.filter_new(txns)
+
+    def alert_key(self, txn: Txn) -> str:
+        """
+        Identity of a txn's alert, the same in every process screening this contract.
+
+        :param txn: Transaction record
+        :return: Alert key, eg. 'ethereum:0xa3c6...:0xc43c...:12'
+        """
+        return f"{self.name}:{self.contract_address.lower()}:{txn.hash}:{txn.log_index}"
+
+    def journal(self, txn: Txn, alerted: bool) -> None:
+        """
+        Appends a txn to the transaction journal, written to disk in the background.
+
+        :param txn: Transaction record
+        :param alerted: True if an alert was sent for the txn
+        :return: None
+        """
+        record = {"seen": int(time()), "network": self.name, "contract": self.contract_address, "alerted": alerted,
+                  **txn.to_journal()}
+        log_journal.info(json.dumps(record, separators=(",", ":")))
+
+    def record_poll(self, txns: List[Txn], baseline: bool = False) -> None:
+        """
+        Appends every txn of a poll to the poll recording, if one is kept, for replaying it later.
+
+        :param txns: List of transaction records
+        :param baseline: True for the first poll of a contract, whose txns are only marked as seen
+        :return: None
+        """
+        if log_polls.disabled or not txns:
+            return
+
+        record = {"t": time(), "network": self.name, "contract": self.contract_address,
+                  "txns": [txn.to_dict() for txn in txns]}
+        if baseline:
+            record['baseline'] = True
+        log_polls.info(json.dumps(record, separators=(",", ":")))
+
     @staticmethod
-    def compare_lists(new_list: List[Dict[str, str]], old_list: List[Dict[str, str]],
-                      keyword: str = 'hash') -> list:
+    def compile_filter(filter_by: Union[Predicate, tuple, dict]) -> Predicate:
         """
-        Compares two lists of dictionaries.
+        Compiles a filter expression, already compiled filters are returned as they are.
 
-        :param new_list: New list
-        :param old_list: Old list
-        :param keyword: Keyword to compare with
-        :return: List of dictionaries that are in new list but not in old list
+        :param filter_by: Compiled filter or filter expression, eg. ('to', '0x000...000')
+        :return: Compiled filter
         """
+        return filter_by if callable(filter_by) else compile_filter(filter_by)
 
-        try:
-            hashes = [txn[keyword] for txn in old_list]
+    def block_range(self, txn_count: int) -> Dict[str, str]:
+        """
+        Block range and paging query parameters for the next explorer request.
+        The first request takes a baseline of the latest txns, every next one asks only for
+        txns from the last processed block onwards, newest first so reading can stop at the first processed one.
+        While catching up on more new txns than fit on one page, they are paged through in ascending order.
 
-            list_diff = [txn for txn in new_list if txn[keyword] not in hashes]
+        :param txn_count: Max number of transactions per page
+        :return: Dictionary of query parameters
+        """
+        if self.last_block is None:
+            return {"startblock": "0", "endblock": "99999999", "page": "1",
+                    "offset": str(txn_count), "sort": "desc"}
 
-            return list_diff
+        if self.catching_up:
+            return {"startblock": str(self.last_block), "endblock": "99999999", "page": str(self.page),
+                    "offset": str(txn_count), "sort": "asc"}
 
-        except TypeError:
-            return []
+        return {"startblock": str(self.last_block), "endblock": "99999999", "page": "1",
+                "offset": str(txn_count), "sort": "desc"}
 
-    async def get_last_txns(self, contract_address: str, txn_count: int = 1,
-                            filter_by: tuple = (), timeout: float = 3) -> List:
+    def is_processed(self, txn: Txn) -> bool:
         """
-        Gets the last transactions from a specified contract address.
+        Checks if a txn was handled by an earlier poll, so all txns older than it were too.
 
-        :param contract_address: Contract address on Blockchain
-        :param txn_count: Number of transactions to return
-        :param filter_by: Filter transactions by field and value, eg. ('to', '0x000...000')
-        :param timeout: Max number of secs to wait for request
-        :return: A list of transaction dictionaries
+        :param txn: Transaction record
+        :return: True if txn is seen or below the block cursor
         """
-        if int(txn_count) < 1:
-            txn_count = 1
+        return txn.hash in self.seen or (self.last_block is not None and txn.block_number < self.last_block)
 
-        if contract_address == "":
-            contract_address = self.contract_address
+    def update_cursor(self, txns: List[Txn], txn_count: int, reached_processed: bool = False) -> None:
+        """
+        Moves the block cursor to the highest block seen in an explorer response.
+        If a whole page is filled by the cursor block itself, the next request asks for the next page.
+        If a whole newest-first page holds only new txns, the cursor stays and the next requests
+        page through the gap in ascending order.
+
+        :param txns: Unfiltered list of transaction records
+        :param txn_count: Max number of transactions per page
+        :param reached_processed: True if reading stopped at a txn processed by an earlier poll
+        :return: None
+        """
+        if not txns:
+            self.catching_up = False
+            return
 
-        payload = {"address": contract_address, "startblock": "0", "endblock": "99999999", "sort": "desc",
-                   "apikey": self.node_api_key}
+        if self.last_block is not None and not self.catching_up:
+            if not reached_processed and len(txns) >= txn_count:
+                self.catching_up = True
+                self.page = 1
+                return
 
-        async with ClientSession(timeout=timeout) as async_session:
-            try:
-                async with async_session.get(self.txn_api, ssl=False, params=payload, timeout=timeout) as response:
+        elif self.catching_up and len(txns) < txn_count:
+            self.catching_up = False
 
-                    try:
-                        txn_dict = await response.json()
-                    except JSONDecodeError:
-                        log_error.warning(f"'JSONError' - {self.name} - {response.status} - {response.url}")
-                        return []
+        highest_block = max(txn.block_number for txn in txns)
 
-            except Exception as e:
-                log_error.warning(f"'ConnectionError': Unable to fetch transaction data for {self.name} - {e}")
-                return []
+        if self.last_block is not None and highest_block <= self.last_block:
+            if len(txns) >= txn_count:
+                self.page += 1
+            return
 
-        if txn_dict['status'] != "1":
-            log_error.warning(f"'ResponseError' {response.status} - {txn_dict} - {response.url}")
+        self.last_block = highest_block
+        self.page = 1
+
+    def endpoints(self, api: str) -> Iterator[str]:
+        """
+        Yields the explorer endpoint and then its mirrors whose circuit breaker lets a request through.
+
+        :param api: Explorer api endpoint
+        :return: Iterator of endpoints
+        """
+        for endpoint in [api] + [api.replace(self.api, mirror, 1) for mirror in self.mirrors]:
+            if self.explorers.breaker(endpoint).allow():
+                yield endpoint
+
+    async def query_explorer(self, api: str, payload: dict, txn_count: int, timeout: float = 3) -> Optional[List]:
+        """
+        Queries a block explorer transaction list endpoint and advances the block cursor.
+
+        :param api: Explorer api endpoint
+        :param payload: Request query parameters
+        :param txn_count: Max number of transactions per page
+        :param timeout: Max number of secs to wait for request
+        :return: A list of transaction records, None if every explorer host is down
+        """
+        endpoints = self.endpoints(api)
+        endpoint = next(endpoints, None)
+        if endpoint is None:
+            return None
+
+        response = await self.fetch_hedged(endpoint, endpoints, payload, txn_count, timeout)
+        if response is None:
+            return []
+
+        txn_dict, last_txns, reached_processed = response
+
+        # Nothing new since the cursor block - not an error
+        if txn_dict.get('message') == "No transactions found":
+            self.catching_up = False
             return []
 
-        # Get a list with specified number of txns
+        txns_scanned.inc(len(last_txns), network=self.name)
+        self.record_poll(last_txns, baseline=self.last_block is None)
+        self.update_cursor(last_txns, txn_count, reached_processed)
+
+        return last_txns
+
+    async def fetch_hedged(self, endpoint: str, spares: Iterator[str], payload: dict, txn_count: int,
+                           timeout: float = 3) -> Optional[Tuple[dict, List[Txn], bool]]:
+        """
+        Sends a request to an explorer endpoint. A failed request is sent once more to the next healthy spare.
+        With hedging, the request is also sent to the next healthy spare once it has taken longer than its
+        host's p95 latency, and whichever answers first is used.
+
+        :param endpoint: Explorer api endpoint
+        :param spares: Iterator of healthy mirror endpoints
+        :param payload: Request query parameters
+        :param txn_count: Max number of transactions per page
+        :param timeout: Max number of secs to wait for request
+        :return: Response fields, list of transaction records, True if a processed txn was reached,
+            or None if the request failed
+        """
+        sent = asyncio.Event()
+        running = {asyncio.create_task(self.fetch_explorer(endpoint, payload, txn_count, timeout, sent))}
+
+        timer = None
+        if self.hedge and self.mirrors:
+            # Counted from when the request leaves the rate limiter
+            delay = min(max(self.explorers.breaker(endpoint).p95(), self.hedge_min_delay), timeout)
+            timer = asyncio.create_task(self.after_sent(sent, delay))
+
+        spare_sent = False
+        try:
+            while running:
+                waiting = running | ({timer} if timer and not spare_sent else set())
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done & running:
+                    running.discard(task)
+                    if task.result() is not None:
+                        return task.result()
+
+                # Hedge a slow request, or retry a failed one, on the next healthy spare - once
+                if not spare_sent and (timer in done or not running):
+                    spare_sent = True
+                    spare = next(spares, None)
+                    if spare:
+                        if running:
+                            hedged_requests.inc(host=self.explorers.host(spare))
+                        running.add(asyncio.create_task(self.fetch_explorer(spare, payload, txn_count, timeout)))
+
+            return None
+
+        finally:
+            for task in running:
+                task.cancel()
+            if timer:
+                timer.cancel()
+            await asyncio.gather(*running, *([timer] if timer else []), return_exceptions=True)
+
+    @staticmethod
+    async def after_sent(sent: asyncio.Event, delay: float) -> None:
+        """Waits until a request is sent and then for delay secs more."""
+        await sent.wait()
+        await asyncio.sleep(delay)
+
+    async def fetch_explorer(self, api: str, payload: dict, txn_count: int, timeout: float = 3,
+                             sent: Optional[asyncio.Event] = None) -> Optional[Tuple[dict, List[Txn], bool]]:
+        """
+        Sends one request to a block explorer transaction list endpoint, recording its outcome
+        with the host's circuit breaker and the API key used.
+
+        :param api: Explorer api endpoint
+        :param payload: Request query parameters
+        :param txn_count: Max number of transactions per page
+        :param timeout: Max number of secs to wait for request
+        :param sent: Event set once the request leaves the rate limiter
+        :return: Response fields, list of transaction records, True if a processed txn was reached,
+            or None if the request failed
+        """
+        breaker = self.explorers.breaker(api)
+        try:
+            # Wait for a free slot in the rate limit of the least used API key, shared by all contracts
+            api_key, _ = await self.explorers.acquire_key(api, self.name)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+
+        payload = {**payload, "apikey": api_key}
+        if sent:
+            sent.set()
+
+        # Newest-first polls after the baseline can stop reading at the first processed txn
+        streaming = self.last_block is not None and payload.get('sort') == "desc"
+        reached_processed = False
+
+        host = self.explorers.host(api)
+        start = perf_counter()
+
+        async_session = self.explorers.session(api)
         try:
-            last_txns = txn_dict['result'][:txn_count]
-        except TypeError:
+            async with async_session.get(api, ssl=False, params=payload, timeout=timeout) as response:
+
+                try:
+                    if streaming:
+                        txn_dict, last_txns, reached_processed = await self.stream_txns(response, txn_count)
+                    else:
+                        # orjson, if installed, decodes the raw body without building an intermediate str
+                        txn_dict = loads(await response.read())
+                        last_txns = None
+                except ValueError:
+                    request_errors.inc(host=host, kind="rate_limit" if response.status == 429 else "json")
+                    self.api_keys.record(api_key, "rate_limit" if response.status == 429 else "error")
+                    # A rate limited key says nothing about the health of the host
+                    if response.status == 429:
+                        breaker.release()
+                    else:
+                        breaker.record(False)
+                    log_error.warning(f"'JSONError' - {self.name} - {response.status} - {response.url}")
+                    return None
+                except (TypeError, KeyError, AttributeError):
+                    request_errors.inc(host=host, kind="response")
+                    self.api_keys.record(api_key, "error")
+                    breaker.record(False)
+                    log_error.warning(f"'ResponseError' {response.status} - unexpected txn - {response.url}")
+                    return None
+
+        except asyncio.CancelledError:
+            # The slower of two hedged requests
+            breaker.release()
+            raise
+
+        except Exception as e:
+            request_errors.inc(host=host, kind="connection")
+            self.api_keys.record(api_key, "error")
+            breaker.record(False)
+            log_error.warning(f"'ConnectionError': Unable to fetch transaction data for {self.name} - {e}")
+            return None
+
+        latency = perf_counter() - start
+        request_seconds.observe(latency, host=host)
+
+        if txn_dict.get('status') != "1":
+            if txn_dict.get('message') == "No transactions found":
+                self.api_keys.record(api_key, "ok")
+                breaker.record(True, latency)
+                return txn_dict, [], False
+
+            # eg. 'Max rate limit reached' or 'Missing/Invalid API Key'
+            result = str(txn_dict.get('result', "")).lower()
+            rate_limited = "rate limit" in result
+            invalid_key = "api key" in result
+            self.api_keys.record(api_key, "rate_limit" if rate_limited else "invalid" if invalid_key else "error")
+            request_errors.inc(host=host, kind="rate_limit" if rate_limited else "response")
+            if rate_limited or invalid_key:
+                breaker.release()
+            else:
+                breaker.record(False)
             log_error.warning(f"'ResponseError' {response.status} - {txn_dict} - {response.url}")
-            return []
+            return None
 
-        if len(filter_by) == 2:
-            field = filter_by[0]  # Eg. 'to' or 'from'
-            value = filter_by[1]  # Eg. '0x000...0000'
+        # Get a list with specified number of txns, parsing each one into a compact record once
+        if last_txns is None:
             try:
-                temp = {t_dict['hash']: t_dict for t_dict in last_txns
-                        if type(t_dict) is dict and t_dict[field] == value}
+                last_txns = [Txn.from_explorer(txn) for txn in txn_dict['result'][:txn_count]]
+            except (TypeError, KeyError, AttributeError):
+                request_errors.inc(host=host, kind="response")
+                self.api_keys.record(api_key, "error")
+                breaker.record(False)
+                log_error.warning(f"'ResponseError' {response.status} - {txn_dict} - {response.url}")
+                return None
 
-                last_txns_cleaned = [txn for txn in temp.values()]
-                return last_txns_cleaned
+        self.api_keys.record(api_key, "ok")
+        breaker.record(True, latency)
 
-            except KeyError:
-                raise KeyError(f"Error in f'get_last_txns': Can not filter by {filter_by} for {self.name}")
+        return txn_dict, last_txns, reached_processed
+
+    async def stream_txns(self, response: ClientResponse, txn_count: int,
+                          chunk_size: int = 16384) -> Tuple[dict, List[Txn], bool]:
+        """
+        Parses a newest-first explorer response while it downloads, one txn at a time.
+        Stops, and drops the rest of the body, at the first txn processed by an earlier poll or after txn_count txns.
+
+        :param response: Explorer response
+        :param txn_count: Max number of transactions to read
+        :param chunk_size: Number of bytes to read at a time
+        :return: Top level response fields, list of new transaction records, True if a processed txn was reached
+        """
+        stream = ResultStream(response.content.iter_chunked(chunk_size))
+
+        last_txns = []
+        async for item in stream.results():
+            txn = Txn.from_explorer(item)
+            if self.is_processed(txn):
+                # Everything after it is older - no need to download it
+                response.close()
+                return stream.fields, last_txns, True
+
+            last_txns.append(txn)
+            if len(last_txns) >= txn_count:
+                response.close()
+                break
 
-        else:
-            return last_txns
+        return stream.fields, last_txns, False
 
-    async def get_last_erc20_txns(self, token_address: str, txn_count: int = 1, filter_by: tuple = (),
+    async def get_last_txns(self, contract_address: str, txn_count: int = 1,
+                            filter_by: Union[Predicate, tuple, dict] = (), timeout: float = 3) -> List:
+        """
+        Gets the last transactions from a specified contract address.
+        Only transactions from the last processed block onwards are requested.
+
+        :param contract_address: Contract address on Blockchain
+        :param txn_count: Number of transactions to return
+        :param filter_by: Compiled filter or filter expression, eg. ('to', '0x000...000')
+        :param timeout: Max number of secs to wait for request
+        :return: A list of transaction records
+        """
+        if int(txn_count) < 1:
+            txn_count = 1
+
+        if contract_address == "":
+            contract_address = self.contract_address
+
+        payload = {"address": contract_address, **self.block_range(txn_count)}
+
+        last_txns = await self.query_explorer(self.txn_api, payload, txn_count, timeout)
+
+        return apply_filter(self.compile_filter(filter_by), last_txns or [])
+
+    async def get_last_erc20_txns(self, token_address: str, txn_count: int = 1,
+                                  filter_by: Union[Predicate, tuple, dict] = (),
                                   bridge_address: str = "", timeout: float = 3) -> List:
         """
         Gets the latest Token transactions from a specific smart contract address.
+        Only transactions from the last processed block onwards are requested.
 
         :param token_address: Address of Token contract of interest
         :param txn_count: Number of transactions to return
-        :param filter_by: Filter transactions by field and value, eg. ('to', '0x000...000')
+        :param filter_by: Compiled filter or filter expression, eg. ('to', '0x000...000')
         :param bridge_address: Address of the smart contract interacting with Token
         :param timeout: Max number of secs to wait for request
-        :return: A list of transaction dictionaries
+        :return: A list of transaction records
         """
         if int(txn_count) < 1:
             txn_count = 1
@@ -255,68 +782,82 @@ class EvmContract:
         if bridge_address == "":
             bridge_address = self.contract_address
 
-        payload = {"contractaddress": token_address, "address": bridge_address, "page": "1",
-                   "offset": "100", "sort": "desc", "apikey": self.node_api_key}
+        payload = {"contractaddress": token_address, "address": bridge_address, **self.block_range(txn_count)}
 
-        async with ClientSession(timeout=timeout) as async_session:
-            try:
-                async with async_session.get(self.erc20_api, ssl=False, params=payload, timeout=timeout) as response:
+        last_txns = await self.query_explorer(self.erc20_api, payload, txn_count, timeout)
 
-                    try:
-                        txn_dict = await response.json()
-                    except JSONDecodeError:
-                        log_error.warning(f"'JSONError' - {self.name} - {response.status} - {response.url}")
-                        return []
+        if last_txns is None:
+            # Every explorer host is down - read the Transfers from the node instead
+            last_txns = await self.get_node_erc20_txns(token_address, bridge_address, timeout) if self.node else []
+        elif last_txns:
+            self.token_info[token_address] = (last_txns[0].token_symbol, last_txns[0].token_decimal)
 
-            except Exception as e:
-                log_error.warning(f"'ConnectionError': Unable to fetch transaction data for {self.name} - {e}")
-                return []
+        return apply_filter(self.compile_filter(filter_by), last_txns)
 
-        if txn_dict['status'] != "1":
-            log_error.warning(f"'ResponseError' {response.status} - {txn_dict} - {response.url}")
+    async def get_node_erc20_txns(self, token_address: str, bridge_address: str, timeout: float = 3,
+                                  max_blocks: int = 2000) -> List[Txn]:
+        """
+        Gets the Token transactions of a contract from the node's Transfer logs, from the last processed block
+        onwards. Takes over the block cursor, so the explorer resumes where the node left off.
+
+        :param token_address: Address of Token contract of interest
+        :param bridge_address: Address of the smart contract interacting with Token
+        :param timeout: Max number of secs to wait for request
+        :param max_blocks: Max number of blocks to scan in one poll
+        :return: A list of transaction records
+        """
+        node_failovers.inc(network=self.name)
+
+        head = await self.node.block_number(timeout)
+        if head is None:
             return []
 
-        # Get a list with specified number of txns
-        try:
-            last_txns = txn_dict['result'][:txn_count]
-        except TypeError:
-            log_error.warning(f"'ResponseError' {response.status} - {txn_dict} - {response.url}")
+        # Baseline - everything already on chain counts as seen
+        if self.last_block is None:
+            self.last_block = head
             return []
 
-        if len(filter_by) == 2:
-            field = filter_by[0]  # Eg. 'to' or 'from'
-            value = filter_by[1]  # Eg. '0x000...0000'
-            try:
-                temp = {t_dict['hash']: t_dict for t_dict in last_txns
-                        if type(t_dict) is dict and t_dict[field] == value}
+        if token_address not in self.token_info:
+            if self.multicall:
+                metadata = await self.multicall.erc20_metadata(token_address)
+            else:
+                metadata = await self.node.erc20_metadata(token_address, timeout)
+            if metadata is None:
+                return []
+            self.token_info[token_address] = metadata
+
+        to_block = min(head, self.last_block + max_blocks)
+        logs = await self.node.get_transfers(token_address, bridge_address, self.last_block, to_block, timeout)
+        if logs is None:
+            return []
 
-                last_txns_cleaned = [txn for txn in temp.values()]
-                return last_txns_cleaned
+        symbol, decimals = self.token_info[token_address]
+        txns = [decode_transfer(log, symbol, decimals) for log in logs]
+        txns_scanned.inc(len(txns), network=self.name)
+        self.record_poll(txns)
 
-            except KeyError:
-                raise KeyError(f"Error in f'get_last_erc20_txns': Can not filter by {filter_by} for {self.name}")
+        # Every block up to to_block has been read in full
+        self.last_block = to_block
+        self.page = 1
+        self.catching_up = False
 
-        else:
-            return last_txns
+        return txns
 
-    def alert_checked_txns(self, txns: list) -> None:
+    def alert_checked_txns(self, txns: List[Txn], fields: Optional[Dict[str, object]] = None) -> None:
         """
         Alerts each txn from the txn list.
 
         :param txns: List of transactions
+        :param fields: Results of the alert_reads, added to each alert
         :return: None
         """
         for txn in txns:
-            txn_hash = txn['hash']
-            value = float(txn['value'])
-            from_addr = txn['from']
-            to_addr = txn['to']
-            time_at_secs = int(txn['timeStamp'])
-            try:
-                function_name: str = txn['functionName']
-                function_name = function_name.split("(")[0]
-            except (KeyError, TypeError):
-                function_name = 'n/a'
+            txn_hash = txn.hash
+            value = float(txn.value)
+            from_addr = txn.from_address
+            to_addr = txn.to_address
+            time_at_secs = txn.timestamp
+            function_name = txn.function_name.split("(")[0] if txn.function_name else 'n/a'
 
             txn_hash_format = f"{txn_hash[0:6]}...{txn_hash[-4:]}"  # eg. 0xc43c...37ea
             from_addr_format = f"{from_addr[0:6]}...{from_addr[-4:]}"  # eg. 0xc43c...37ea
@@ -336,41 +877,47 @@ class EvmContract:
                       f"From {from_addr_format} -> To {to_addr_format}\n" \
                       f"Stamp:  {txn_stamp}\n" \
                       f"Type: {function_name}\n" \
-                      f"Value: {value:,.3f}"
+                      f"Value: {value:,.3f}" \
+                      f"{self.format_fields(fields)}"
 
             terminal_msg = f"{txn_hash}, {self.name}"
 
             # Log all transactions
             log_txns.info(terminal_msg)
-            telegram_send_message(message)
+            self.journal(txn, alerted=True)
+            self.notify(message, network=self.name, txn_time=txn.timestamp, alert_key=self.alert_key(txn))
 
-    def alert_erc20_txns(self, txns: list, min_txn_amount: float) -> None:
+    def alert_erc20_txns(self, txns: List[Txn], min_txn_amount: float,
+                         fields: Optional[Dict[str, object]] = None) -> None:
         """
         Checks transaction list and alerts if new transaction is important.
 
         :param txns: List of transactions
         :param min_txn_amount: Minimum transfer amount to alert for
+        :param fields: Results of the alert_reads, added to each alert
         :return: None
         """
         for txn in txns:
 
-            txn_amount = float(int(txn['value']) / 10 ** int(txn['tokenDecimal']))
+            txn_amount = float(txn.value / 10 ** txn.token_decimal)
             # round txn amount number
-            rounding = int(txn['tokenDecimal']) // 6
+            rounding = txn.token_decimal // 6
             txn_amount = round(txn_amount, rounding)
-            token_name = txn['tokenSymbol']
+            token_name = txn.token_symbol
 
             # Construct messages
             time_stamp = datetime.now().astimezone().strftime(time_format)
             message = f"{time_stamp} - hop_etherscan_async\n" \
                       f"-> {txn_amount:,} {token_name} swapped on " \
-                      f"<a href='{self.web_page}/tx/{txn['hash']}'>{self.name.upper()} {self.color}</a>"
+                      f"<a href='{self.web_page}/tx/{txn.hash}'>{self.name.upper()} {self.color}</a>" \
+                      f"{self.format_fields(fields)}"
 
-            terminal_msg = f"{txn['hash']}, {txn_amount:,} {token_name} swapped on {self.name.upper()}"
+            terminal_msg = f"{txn.hash}, {txn_amount:,} {token_name} swapped on {self.name.upper()}"
 
             # Log all transactions
             log_txns.info(terminal_msg)
+            self.journal(txn, alerted=txn_amount >= min_txn_amount)
 
             if txn_amount >= min_txn_amount:
                 # Send formatted Telegram message
-                telegram_send_message(message)
+                self.notify(message, network=self.name, txn_time=txn.timestamp, alert_key=self.alert_key(txn))
@@ -0,0 +1,145 @@
+from typing import (
+    Dict,
+    Tuple,
+    Optional,
+)
+from urllib.parse import urlsplit
+
+from aiohttp import (
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
+
+from src.contractscreener.blockchain.keys import ApiKeyPool
+from src.contractscreener.blockchain.breaker import CircuitBreaker
+from src.contractscreener.blockchain.ratelimit import RateLimiter
+
+
+class ExplorerPool:
+
+    def __init__(self, limit_per_host: int = 10, keepalive_timeout: float = 60,
+                 dns_cache_ttl: int = 300, timeout: float = 10, rate: float = 5, burst: int = 5,
+                 key_quarantine: float = 2, key_max_quarantine: float = 600, breaker: Optional[dict] = None):
+        """
+        Long-lived pooled aiohttp sessions, one per block explorer host.
+        Sessions are created lazily from within the running event loop and reused across polls,
+        so TCP and TLS handshakes are paid only once per keep-alive connection.
+
+        :param limit_per_host: Max number of open connections to each explorer host
+        :param keepalive_timeout: Secs to keep an idle connection open for reuse
+        :param dns_cache_ttl: Secs to cache resolved explorer host addresses
+        :param timeout: Default max number of secs to wait for a request
+        :param rate: Number of requests allowed per sec for each explorer host and API key
+        :param burst: Max number of requests allowed back to back for each explorer host and API key
+        :param key_quarantine: Secs a rate limited API key is left out, doubled on each consecutive failure
+        :param key_max_quarantine: Max secs an API key is left out, and the secs an invalid one is left out
+        :param breaker: Keyword arguments of each explorer host's CircuitBreaker, eg. {'open_secs': 30}
+        """
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+
+        self.limiter = RateLimiter(rate, burst)
+        self.key_quarantine = key_quarantine
+        self.key_max_quarantine = key_max_quarantine
+
+        self.breaker_options = breaker or {}
+
+        self._keys: Dict[str, ApiKeyPool] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+        self._sessions: Dict[str, ClientSession] = {}
+
+    @staticmethod
+    def host(url: str) -> str:
+        """
+        Returns the host part of an explorer url, eg. 'api.etherscan.io'.
+
+        :param url: Explorer url
+        :return: Host name
+        """
+        return urlsplit(url).netloc.lower()
+
+    def session(self, url: str) -> ClientSession:
+        """
+        Returns the pooled session for the explorer host of a given url, creating it on first use.
+        Must be called from within a running event loop.
+
+        :param url: Explorer url
+        :return: aiohttp ClientSession
+        """
+        host = self.host(url)
+
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            # aiohttp speaks HTTP/1.1 only - keep-alive reuse is what removes the per poll handshake
+            connector = TCPConnector(limit=self.limit_per_host, limit_per_host=self.limit_per_host,
+                                     ttl_dns_cache=self.dns_cache_ttl, keepalive_timeout=self.keepalive_timeout)
+            session = ClientSession(connector=connector, timeout=ClientTimeout(total=self.timeout))
+            self._sessions[host] = session
+
+        return session
+
+    def keys(self, network: str) -> ApiKeyPool:
+        """
+        Returns the API keys of a network's explorer, read from the environment on first use.
+
+        :param network: Network name, eg. 'ethereum'
+        :return: ApiKeyPool
+        """
+        network = network.lower()
+
+        if network not in self._keys:
+            self._keys[network] = ApiKeyPool.from_env(network, quarantine=self.key_quarantine,
+                                                      max_quarantine=self.key_max_quarantine)
+
+        return self._keys[network]
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker of the explorer host of a given url, creating it on first use.
+
+        :param url: Explorer url
+        :return: CircuitBreaker
+        """
+        host = self.host(url)
+
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(**self.breaker_options)
+
+        return self._breakers[host]
+
+    def breaker_states(self) -> Dict[str, str]:
+        """
+        Current state of each explorer host's circuit breaker.
+
+        :return: Dictionary of host -> 'closed', 'open' or 'half_open'
+        """
+        return {host: breaker.state for host, breaker in self._breakers.items()}
+
+    async def acquire_key(self, url: str, network: str) -> Tuple[str, float]:
+        """
+        Chooses the network's API key with most of its rate limit left and waits for that rate limit.
+
+        :param url: Explorer url
+        :param network: Network name, eg. 'ethereum'
+        :return: API key to send the request with, number of secs the request spent queued
+        """
+        host = self.host(url)
+        api_key = self.keys(network).choose(lambda key: self.limiter.bucket(host, key).available())
+
+        return api_key, await self.limiter.acquire(host, api_key)
+
+    async def close(self) -> None:
+        """
+        Closes all pooled sessions and their connections.
+
+        :return: None
+        """
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+
+        self._sessions.clear()
@@ -0,0 +1,146 @@
+from typing import (
+    List,
+    Union,
+    Callable,
+)
+
+from src.contractscreener.blockchain.records import Txn
+
+
+# Compiled filter, returns True for transactions to keep
+Predicate = Callable[[Txn], bool]
+
+RANGE_OPERATORS = {
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+# Fields held as numbers on a Txn, compared as numbers by eq and in as well
+NUMERIC_FIELDS = frozenset({"blockNumber", "timeStamp", "value", "gasPrice", "tokenDecimal", "logIndex"})
+
+
+def keep_all(txn: Txn) -> bool:
+    return True
+
+
+def _number(value) -> float or None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+
+def _compile_field(expression: dict) -> Predicate:
+    """Compiles a single field condition, eg. {"field": "value", "gte": 1e18}."""
+    if "field" not in expression:
+        raise ValueError(f"Filter has no field: {expression}. Use one of field, and, or, not, selector.")
+
+    field = expression['field']
+    if field not in Txn.FIELDS:
+        raise ValueError(f"Unknown filter field '{field}' in {expression}. Use one of {', '.join(Txn.FIELDS)}.")
+    checks = []
+
+    if field in NUMERIC_FIELDS:
+        if "eq" in expression:
+            expected = _number(expression['eq'])
+            if expected is None:
+                raise ValueError(f"Filter value must be a number: {expression}")
+            checks.append(lambda txn: txn.get(field) == expected)
+
+        if "in" in expression:
+            expected_set = frozenset(_number(item) for item in expression['in'])
+            if None in expected_set:
+                raise ValueError(f"Filter values must be numbers: {expression}")
+            checks.append(lambda txn: txn.get(field) in expected_set)
+
+    else:
+        if "eq" in expression:
+            expected = str(expression['eq']).lower()
+            checks.append(lambda txn: str(txn.get(field, "")).lower() == expected)
+
+        if "in" in expression:
+            expected_set = frozenset(str(item).lower() for item in expression['in'])
+            checks.append(lambda txn: str(txn.get(field, "")).lower() in expected_set)
+
+    if "selector" in expression:
+        selectors = expression['selector']
+        selectors = frozenset(s.lower() for s in ([selectors] if isinstance(selectors, str) else selectors))
+        checks.append(lambda txn: str(txn.get(field, ""))[:10].lower() in selectors)
+
+    for operator, compare in RANGE_OPERATORS.items():
+        if operator in expression:
+            bound = _number(expression[operator])
+            if bound is None:
+                raise ValueError(f"Filter bound must be a number: {expression}")
+
+            def check(txn, compare=compare, bound=bound):
+                number = _number(txn.get(field))
+                return number is not None and compare(number, bound)
+
+            checks.append(check)
+
+    if not checks:
+        raise ValueError(f"Filter has no condition: {expression}. Use one of eq, in, selector, gt, gte, lt, lte.")
+
+    if len(checks) == 1:
+        return checks[0]
+
+    return lambda txn: all(check(txn) for check in checks)
+
+
+def compile_filter(expression: Union[list, tuple, dict, None]) -> Predicate:
+    """
+    Compiles a filter expression from config into a predicate, once at startup.
+
+    Expressions are either the legacy (field, value) pair, eg. ["to", "0x000...000"], or a dictionary:
+    {"and": [...]}, {"or": [...]}, {"not": {...}}, or a field condition such as
+    {"field": "to", "in": ["0x...", "0x..."]}, {"field": "value", "gte": 1e18, "lt": 1e21},
+    {"field": "input", "selector": ["0xa9059cbb"]} or {"selector": "0xa9059cbb"}.
+    Addresses and strings are compared case-insensitively, numbers are compared as numbers.
+
+    :param expression: Filter expression
+    :return: Function that returns True for transactions to keep
+    """
+    if not expression:
+        return keep_all
+
+    if isinstance(expression, (list, tuple)):
+        if len(expression) != 2:
+            raise ValueError(f"Filter must be a (field, value) pair: {expression}")
+        return _compile_field({"field": expression[0], "eq": expression[1]})
+
+    if "and" in expression:
+        predicates = [compile_filter(item) for item in expression['and']]
+        return lambda txn: all(predicate(txn) for predicate in predicates)
+
+    if "or" in expression:
+        predicates = [compile_filter(item) for item in expression['or']]
+        return lambda txn: any(predicate(txn) for predicate in predicates)
+
+    if "not" in expression:
+        predicate = compile_filter(expression['not'])
+        return lambda txn: not predicate(txn)
+
+    if "selector" in expression and "field" not in expression:
+        return _compile_field({"field": "input", **expression})
+
+    return _compile_field(expression)
+
+
+def apply_filter(predicate: Predicate, txns: List[Txn]) -> List[Txn]:
+    """
+    Applies a compiled filter to a whole batch of transactions, keeping one transaction per hash.
+
+    :param predicate: Compiled filter
+    :param txns: List of transaction records
+    :return: Filtered list of transaction records
+    """
+    if predicate is keep_all:
+        return txns
+
+    return list({txn.hash: txn for txn in txns if predicate(txn)}.values())
@@ -1,11 +1,24 @@
-import asyncio
-from typing import (
-    List,
-    Callable,
-)
+import os
+import json
+from typing import List
 from tabulate import tabulate
 
 
+def load_config(argument: str) -> dict:
+    """
+    Loads the JSON config, given either inline or as the path of a JSON file. A file has no
+    command line size limit, so it fits any number of contracts.
+
+    :param argument: JSON string or path of JSON file
+    :return: Config dictionary
+    """
+    if os.path.isfile(argument):
+        with open(argument) as file:
+            return json.load(file)
+
+    return json.loads(argument)
+
+
 def print_start_message(arguments: List[dict]) -> None:
     """Prints script start message of all network configurations.
 
@@ -32,17 +45,3 @@ def print_start_message(arguments: List[dict]) -> None:
     print(tabulate(table, headers=columns, showindex=True,
                    tablefmt="fancy_grid", numalign="left", stralign="left", colalign="left"))
 
-
-async def gather_funcs(functions: List[Callable], func_args: List[list]) -> tuple:
-    """
-    Gathers all asyncio http requests to be scheduled.
-
-    :param functions: List of function pointers to execute
-    :param func_args: List of function arguments
-    :return: List of all 1inch swaps
-    """
-    function_list = [function(*arg) for function, arg in zip(functions, func_args)]
-
-    func_results = await asyncio.gather(*function_list)
-
-    return func_results
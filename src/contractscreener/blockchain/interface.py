@@ -23,6 +23,16 @@ parser.add_argument(
          f" filter criteria."
 )
 
+parser.add_argument(
+    "-b", "--backfill", action="store", type=str, nargs=1, metavar="\b", dest="backfill",
+    help=f"Exports the past transactions of every contract within a block range to JSONL or Parquet files."
+)
+
+parser.add_argument(
+    "-r", "--replay", action="store", type=str, nargs=1, metavar="\b", dest="replay",
+    help=f"Replays recorded transactions through the filter and alert pipeline offline and reports its timing."
+)
+
 parser.add_argument(
     "-v", "--version", action="version", version=__version__,
     help="Prints the program's current version."
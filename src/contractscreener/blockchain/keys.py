@@ -0,0 +1,129 @@
+import os
+
+from time import monotonic
+from typing import (
+    List,
+    Dict,
+    Callable,
+)
+
+from src.contractscreener.common.logger import log_error
+from src.contractscreener.common.metrics import api_key_requests
+
+
+class ApiKey:
+
+    __slots__ = ("key", "label", "requests", "rate_limited", "invalid", "strikes", "quarantined_until")
+
+    def __init__(self, key: str):
+        """
+        One explorer API key and its usage counters.
+
+        :param key: API key, empty for requests without a key
+        """
+        self.key = key
+        # Only the end of a key is ever logged or exported
+        self.label = f"...{key[-4:]}" if key else "none"
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.invalid = 0
+        # Consecutive failures, each doubling the next quarantine
+        self.strikes = 0
+        self.quarantined_until = 0.0
+
+
+class ApiKeyPool:
+
+    def __init__(self, network: str, keys: List[str], quarantine: float = 2, max_quarantine: float = 600):
+        """
+        Explorer API keys of a network. Each key has its own rate limit, so requests are spread across
+        the keys and polling capacity grows with their number. A key that is rate limited or rejected
+        is left out for a while.
+
+        :param network: Network name, eg. 'ethereum'
+        :param keys: List of API keys
+        :param quarantine: Secs a rate limited key is left out, doubled on each consecutive failure
+        :param max_quarantine: Max secs a key is left out, and the secs an invalid key is left out
+        """
+        self.network = network.lower()
+        self.quarantine = quarantine
+        self.max_quarantine = max_quarantine
+
+        # Duplicates would share one rate limit while counting twice
+        self.keys: Dict[str, ApiKey] = {key: ApiKey(key) for key in dict.fromkeys(keys or [""])}
+
+    @classmethod
+    def from_env(cls, network: str, **kwargs) -> "ApiKeyPool":
+        """
+        Reads the keys of a network from the comma separated '<NETWORK>_API_KEYS' env variable,
+        or its single '<NETWORK>_API_KEY'.
+
+        :param network: Network name, eg. 'ethereum'
+        :param kwargs: Quarantine arguments of ApiKeyPool
+        :return: ApiKeyPool
+        """
+        keys = os.getenv(f"{network.upper()}_API_KEYS") or os.getenv(f"{network.upper()}_API_KEY") or ""
+
+        return cls(network, [key.strip() for key in keys.split(",") if key.strip()], **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def first(self) -> str:
+        """
+        Returns the first key, for one-off requests outside of the rate limiter, eg. fetching an ABI.
+
+        :return: API key
+        """
+        return next(iter(self.keys))
+
+    def choose(self, remaining: Callable[[str], float]) -> str:
+        """
+        Chooses the key to send the next request with - the one with most of its rate limit left,
+        skipping quarantined keys. If every key is quarantined, the one released the soonest.
+
+        :param remaining: Function returning the requests a key may send right now
+        :return: API key
+        """
+        now = monotonic()
+        available = [api_key for api_key in self.keys.values() if api_key.quarantined_until <= now]
+        if not available:
+            return min(self.keys.values(), key=lambda api_key: api_key.quarantined_until).key
+
+        return max(available, key=lambda api_key: (remaining(api_key.key), -api_key.requests)).key
+
+    def record(self, key: str, outcome: str) -> None:
+        """
+        Records the outcome of a request sent with a key, quarantining the key on a rate limit or rejection.
+
+        :param key: API key
+        :param outcome: 'ok', 'rate_limit', 'invalid' or 'error'
+        :return: None
+        """
+        api_key = self.keys.get(key)
+        if api_key is None:
+            return
+
+        api_key.requests += 1
+        api_key_requests.inc(network=self.network, key=api_key.label, outcome=outcome)
+
+        if outcome == "ok":
+            api_key.strikes = 0
+
+        elif outcome == "rate_limit":
+            api_key.rate_limited += 1
+            api_key.strikes += 1
+            self._quarantine(api_key, min(self.quarantine * 2 ** (api_key.strikes - 1), self.max_quarantine))
+
+        elif outcome == "invalid":
+            api_key.invalid += 1
+            self._quarantine(api_key, self.max_quarantine)
+
+    def _quarantine(self, api_key: ApiKey, secs: float) -> None:
+        # With a single key there is nothing to switch to, it just keeps being rate limited by the explorer
+        if len(self.keys) < 2:
+            return
+
+        api_key.quarantined_until = monotonic() + secs
+        log_error.warning(f"'ApiKeyError' - {self.network} key {api_key.label} quarantined for {secs:,.0f} secs.")
@@ -0,0 +1,214 @@
+import asyncio
+
+from time import monotonic
+from collections import OrderedDict
+from typing import (
+    Set,
+    List,
+    Dict,
+    Tuple,
+    Optional,
+)
+
+from eth_abi import (
+    encode_abi,
+    decode_abi,
+)
+
+from src.contractscreener.blockchain.node import (
+    NodeClient,
+    SYMBOL_SELECTOR,
+    DECIMALS_SELECTOR,
+    decode_abi_string,
+)
+from src.contractscreener.common.logger import log_error
+from src.contractscreener.common.metrics import contract_reads
+
+
+# Multicall3, deployed at the same address on every supported network
+MULTICALL3_ADDRESS = "0xca11bde05977b3631167028862be2a173976ca11"
+# aggregate3((address,bool,bytes)[])
+AGGREGATE3_SELECTOR = "0x82ad56cb"
+# name()
+NAME_SELECTOR = "0x06fdde03"
+# Reads whose result never changes, cached for immutable_ttl secs
+IMMUTABLE_SELECTORS = {NAME_SELECTOR, SYMBOL_SELECTOR, DECIMALS_SELECTOR}
+
+
+class MulticallBatcher:
+
+    def __init__(self, node: NodeClient, window: float = 0.01, max_calls: int = 100,
+                 immutable_ttl: float = 24 * 60 * 60, cache_size: int = 10000, timeout: float = 10):
+        """
+        Batches the contract reads of a network. Reads made within window secs of each other are sent as one
+        Multicall3 aggregate3 eth_call, or as one JSON-RPC batch of eth_calls on a network without Multicall3,
+        and each result is handed back to its caller. Identical reads made at the same time share one call.
+
+        :param node: JSON-RPC client of the network's node
+        :param window: Secs to collect reads for before sending them
+        :param max_calls: Max number of reads in one batch, a full batch is sent right away
+        :param immutable_ttl: Secs to cache the result of reads that never change, eg. decimals() or symbol()
+        :param cache_size: Max number of cached results
+        :param timeout: Max number of secs to wait for a batch
+        """
+        self.node = node
+        self.window = window
+        self.max_calls = max_calls
+        self.immutable_ttl = immutable_ttl
+        self.cache_size = cache_size
+        self.timeout = timeout
+
+        # False once the network turned out not to have Multicall3
+        self.multicall = True
+
+        # Reads waiting for the next batch, and the result of each read not answered yet
+        self._pending: List[Tuple[str, str]] = []
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # (target, calldata) -> expiry time and result, least recently used first
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def call(self, target: str, data: str, ttl: Optional[float] = None) -> Optional[str]:
+        """
+        Reads a contract, as part of the next batch.
+
+        :param target: Contract address
+        :param data: ABI encoded calldata, eg. '0x313ce567' for decimals()
+        :param ttl: Secs to cache the result, default immutable_ttl for immutable reads and 0 for the others
+        :return: ABI encoded return data, or None if the read failed
+        """
+        key = (target.lower(), data.lower())
+        if ttl is None:
+            ttl = self.immutable_ttl if key[1][:10] in IMMUTABLE_SELECTORS else 0
+
+        cached = self._cache.get(key)
+        if cached and cached[0] > monotonic():
+            self._cache.move_to_end(key)
+            contract_reads.inc(network=self.node.network, source="cache")
+            return cached[1]
+
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[key] = future
+            self._pending.append(key)
+
+            if len(self._pending) >= self.max_calls:
+                self.flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self.flush)
+
+        # A caller giving up does not cancel the read of the others waiting for it
+        result = await asyncio.shield(future)
+
+        if ttl and result is not None:
+            self._cache[key] = (monotonic() + ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return result
+
+    def flush(self) -> None:
+        """
+        Sends the reads collected so far as one batch.
+
+        :return: None
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        keys, self._pending = self._pending, []
+        if keys:
+            task = asyncio.create_task(self.execute(keys))
+            # Keep a reference until done, the event loop only keeps a weak one
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def execute(self, keys: List[Tuple[str, str]]) -> None:
+        """
+        Sends a batch of reads and hands each result to the callers waiting for it.
+
+        :param keys: List of target and calldata of each read
+        :return: None
+        """
+        results = None
+        try:
+            results = await self.read(keys)
+        except Exception as e:
+            log_error.warning(f"'MulticallError' - {self.node.network} batch of {len(keys)} - {e}")
+        finally:
+            for i, key in enumerate(keys):
+                future = self._inflight.pop(key)
+                if not future.done():
+                    future.set_result(results[i] if results else None)
+
+    async def read(self, keys: List[Tuple[str, str]]) -> Optional[List[Optional[str]]]:
+        """
+        Sends a batch of reads as a single eth_call, a Multicall3 aggregate3 call or a JSON-RPC batch.
+
+        :param keys: List of target and calldata of each read
+        :return: Return data of each read, None for a failed one, or None if the whole batch failed
+        """
+        network = self.node.network
+
+        if len(keys) == 1:
+            contract_reads.inc(network=network, source="call")
+            (target, data), = keys
+            return [await self.node.call("eth_call", [{"to": target, "data": data}, "latest"], self.timeout)]
+
+        if self.multicall:
+            results = await self.aggregate3(keys)
+            if results is not None:
+                contract_reads.inc(len(keys), network=network, source="multicall")
+                return results
+
+        contract_reads.inc(len(keys), network=network, source="batch")
+
+        return await self.node.batch([("eth_call", [{"to": target, "data": data}, "latest"]) for target, data in keys],
+                                     self.timeout)
+
+    async def aggregate3(self, keys: List[Tuple[str, str]]) -> Optional[List[Optional[str]]]:
+        """
+        Sends a batch of reads as one Multicall3 aggregate3 call, each read allowed to fail on its own.
+
+        :param keys: List of target and calldata of each read
+        :return: Return data of each read, None for a failed one, or None if the call failed
+        """
+        calls = [(target, True, bytes.fromhex(data[2:])) for target, data in keys]
+        data = AGGREGATE3_SELECTOR + encode_abi(["(address,bool,bytes)[]"], [calls]).hex()
+
+        result = await self.node.call("eth_call", [{"to": MULTICALL3_ADDRESS, "data": data}, "latest"], self.timeout)
+        if result is None:
+            return None
+
+        # Calling an address without code returns nothing
+        if result == "0x":
+            self.multicall = False
+            log_error.warning(f"'MulticallError' - no Multicall3 on {self.node.network}, using JSON-RPC batches")
+            return None
+
+        returned, = decode_abi(["(bool,bytes)[]"], bytes.fromhex(result[2:]))
+
+        return [f"0x{return_data.hex()}" if success else None for success, return_data in returned]
+
+    async def erc20_metadata(self, token_address: str) -> Optional[Tuple[str, int]]:
+        """
+        Reads the symbol and decimals of an Erc20 token in one batch, cached for immutable_ttl secs.
+
+        :param token_address: Token contract address
+        :return: Token symbol and decimals, or None if a read failed
+        """
+        symbol, decimals = await asyncio.gather(self.call(token_address, SYMBOL_SELECTOR),
+                                                self.call(token_address, DECIMALS_SELECTOR))
+        if not symbol or not decimals or decimals == "0x":
+            return None
+
+        try:
+            return decode_abi_string(symbol), int(decimals, 16)
+        except ValueError:
+            return None
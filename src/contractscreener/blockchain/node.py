@@ -0,0 +1,340 @@
+from time import perf_counter
+from itertools import count
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+)
+
+from src.contractscreener.blockchain.explorer import ExplorerPool
+from src.contractscreener.blockchain.records import Txn
+from src.contractscreener.common.logger import log_error
+from src.contractscreener.common.metrics import (
+    txns_scanned,
+    request_errors,
+    request_seconds,
+)
+
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+# Function selectors of Erc20 decimals() and symbol()
+DECIMALS_SELECTOR = "0x313ce567"
+SYMBOL_SELECTOR = "0x95d89b41"
+
+
+def address_to_topic(address: str) -> str:
+    """
+    Left pads an address to a 32 byte log topic.
+
+    :param address: Address, eg. '0xa3c6...b63a'
+    :return: Topic hex string
+    """
+    return "0x" + address.lower().replace("0x", "").rjust(64, "0")
+
+
+def topic_to_address(topic: str) -> str:
+    """
+    Takes the address out of a 32 byte log topic.
+
+    :param topic: Topic hex string
+    :return: Lower case address
+    """
+    return "0x" + topic[-40:].lower()
+
+
+def decode_abi_string(result: str) -> str:
+    """
+    Decodes an ABI encoded string return value, or a bytes32 one as returned by some older tokens.
+
+    :param result: Return value hex string
+    :return: Decoded string
+    """
+    data = bytes.fromhex(result[2:] if result.startswith("0x") else result)
+    if len(data) == 32:
+        return data.rstrip(b"\x00").decode(errors="replace")
+
+    offset = int.from_bytes(data[:32], "big")
+    length = int.from_bytes(data[offset:offset + 32], "big")
+
+    return data[offset + 32:offset + 32 + length].decode(errors="replace")
+
+
+def decode_transfer(log: dict, token_symbol: str, token_decimal: int) -> Txn:
+    """
+    Decodes a Transfer log into the same fields as an explorer 'tokentx' transaction.
+
+    :param log: Log dictionary
+    :param token_symbol: Symbol of the transferred token
+    :param token_decimal: Decimals of the transferred token
+    :return: Transaction record
+    """
+    return Txn(
+        hash=log['transactionHash'],
+        block_number=int(log['blockNumber'], 16),
+        # Only some nodes include the block time in logs
+        timestamp=int(log.get('blockTimestamp', "0x0"), 16),
+        log_index=int(log['logIndex'], 16),
+        from_address=topic_to_address(log['topics'][1]),
+        to_address=topic_to_address(log['topics'][2]),
+        value=int(log['data'], 16),
+        contract_address=log['address'].lower(),
+        token_symbol=token_symbol,
+        token_decimal=int(token_decimal),
+    )
+
+
+class NodeClient:
+
+    _ids = count(1)
+
+    def __init__(self, network: str, endpoint: str, explorers: ExplorerPool):
+        """
+        Minimal async JSON-RPC client for a node endpoint, using the shared pooled sessions.
+
+        :param network: Network name
+        :param endpoint: Node provider network url endpoint
+        :param explorers: Shared pool of sessions
+        """
+        self.network = network.lower()
+        self.endpoint = endpoint
+        self.explorers = explorers
+
+    async def call(self, method: str, params: list, timeout: float = 10):
+        """
+        Sends a JSON-RPC request.
+
+        :param method: RPC method, eg. 'eth_getLogs'
+        :param params: List of RPC params
+        :param timeout: Max number of secs to wait for request
+        :return: RPC result or None if the request failed
+        """
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+
+        host = self.explorers.host(self.endpoint)
+        start = perf_counter()
+
+        async_session = self.explorers.session(self.endpoint)
+        try:
+            async with async_session.post(self.endpoint, json=payload, timeout=timeout) as response:
+                rpc_dict = await response.json(content_type=None)
+
+        except Exception as e:
+            request_errors.inc(host=host, kind="connection")
+            log_error.warning(f"'ConnectionError': Unable to call {method} for {self.network} - {e}")
+            return None
+
+        request_seconds.observe(perf_counter() - start, host=host)
+
+        if not isinstance(rpc_dict, dict) or 'error' in rpc_dict:
+            request_errors.inc(host=host, kind="rate_limit" if response.status == 429 else "response")
+            log_error.warning(f"'ResponseError' {method} - {self.network} - {rpc_dict}")
+            return None
+
+        return rpc_dict.get('result')
+
+    async def batch(self, requests: List[Tuple[str, list]], timeout: float = 10) -> Optional[List]:
+        """
+        Sends several JSON-RPC requests in a single HTTP request, as a JSON-RPC batch.
+
+        :param requests: List of RPC method and params of each request
+        :param timeout: Max number of secs to wait for request
+        :return: RPC result of each request, None for a failed one, or None if the whole batch failed
+        """
+        payload = [{"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+                   for method, params in requests]
+
+        host = self.explorers.host(self.endpoint)
+        start = perf_counter()
+
+        async_session = self.explorers.session(self.endpoint)
+        try:
+            async with async_session.post(self.endpoint, json=payload, timeout=timeout) as response:
+                rpc_list = await response.json(content_type=None)
+
+        except Exception as e:
+            request_errors.inc(host=host, kind="connection")
+            log_error.warning(f"'ConnectionError': Unable to send a batch of {len(requests)} for {self.network} - {e}")
+            return None
+
+        request_seconds.observe(perf_counter() - start, host=host)
+
+        # A node without batch support answers with a single error object
+        if not isinstance(rpc_list, list):
+            request_errors.inc(host=host, kind="rate_limit" if response.status == 429 else "response")
+            log_error.warning(f"'ResponseError' batch - {self.network} - {rpc_list}")
+            return None
+
+        # Responses of a batch may come in any order
+        results = {rpc_dict.get('id'): rpc_dict.get('result') for rpc_dict in rpc_list
+                   if isinstance(rpc_dict, dict) and 'error' not in rpc_dict}
+
+        return [results.get(request['id']) for request in payload]
+
+    async def block_number(self, timeout: float = 10) -> Optional[int]:
+        """
+        Gets the latest block number.
+
+        :param timeout: Max number of secs to wait for request
+        :return: Block number or None if the request failed
+        """
+        result = await self.call("eth_blockNumber", [], timeout)
+
+        return int(result, 16) if result else None
+
+    async def get_logs(self, addresses: List[str], topics: list, from_block: int, to_block: int,
+                       timeout: float = 10) -> Optional[List[dict]]:
+        """
+        Gets all logs emitted by any of the addresses within a block range.
+
+        :param addresses: List of emitting contract addresses
+        :param topics: List of topic filters
+        :param from_block: First block of range
+        :param to_block: Last block of range
+        :param timeout: Max number of secs to wait for request
+        :return: List of log dictionaries or None if the request failed
+        """
+        log_filter = {"address": addresses, "topics": topics, "fromBlock": hex(from_block), "toBlock": hex(to_block)}
+
+        return await self.call("eth_getLogs", [log_filter], timeout)
+
+    async def erc20_metadata(self, token_address: str, timeout: float = 10) -> Optional[Tuple[str, int]]:
+        """
+        Reads the symbol and decimals of an Erc20 token.
+
+        :param token_address: Token contract address
+        :param timeout: Max number of secs to wait for request
+        :return: Token symbol and decimals, or None if a request failed
+        """
+        requests = [("eth_call", [{"to": token_address, "data": SYMBOL_SELECTOR}, "latest"]),
+                    ("eth_call", [{"to": token_address, "data": DECIMALS_SELECTOR}, "latest"])]
+
+        # Both reads in one round trip, or one after the other on a node without batch support
+        results = await self.batch(requests, timeout)
+        if results is None:
+            results = [await self.call(method, params, timeout) for method, params in requests]
+
+        symbol, decimals = results
+        if not symbol or not decimals or decimals == "0x":
+            return None
+
+        try:
+            return decode_abi_string(symbol), int(decimals, 16)
+        except ValueError:
+            return None
+
+    async def get_transfers(self, token_address: str, address: str, from_block: int, to_block: int,
+                            timeout: float = 10) -> Optional[List[dict]]:
+        """
+        Gets the Transfer logs of a token from or to an address within a block range, oldest first.
+
+        :param token_address: Token contract address
+        :param address: Address on either side of the Transfers
+        :param from_block: First block of range
+        :param to_block: Last block of range
+        :param timeout: Max number of secs to wait for request
+        :return: List of log dictionaries or None if a request failed
+        """
+        topic = address_to_topic(address)
+
+        # Transfer topics are [signature, from, to] - one query for each side
+        logs_from = await self.get_logs([token_address], [TRANSFER_TOPIC, topic], from_block, to_block, timeout)
+        logs_to = await self.get_logs([token_address], [TRANSFER_TOPIC, None, topic], from_block, to_block, timeout)
+        if logs_from is None or logs_to is None:
+            return None
+
+        logs = {(log['transactionHash'], log['logIndex']): log for log in logs_from + logs_to
+                if len(log['topics']) == 3 and not log.get('removed')}
+
+        return sorted(logs.values(), key=lambda log: (int(log['blockNumber'], 16), int(log['logIndex'], 16)))
+
+
+class Erc20LogScreener:
+
+    def __init__(self, network: str, endpoint: str, watched: List[Tuple[int, dict]],
+                 explorers: ExplorerPool, max_blocks: int = 2000):
+        """
+        Screens all watched Erc20 tokens of a network for Transfers from or to their bridge address,
+        with one eth_getLogs per side for each new block range instead of one tokentx call per contract.
+
+        :param network: Network name
+        :param endpoint: Node provider network url endpoint
+        :param watched: List of (index, config entry) with 'token_address', 'contract_address', 'token', 'decimals'
+        :param explorers: Shared pool of sessions
+        :param max_blocks: Max number of blocks to scan in one poll
+        """
+        self.network = network.lower()
+        self.node = NodeClient(network, endpoint, explorers)
+        self.max_blocks = max_blocks
+
+        # (token address, bridge address) -> list of watched indexes
+        self.routes: Dict[Tuple[str, str], List[int]] = {}
+        self.entries: Dict[int, dict] = {}
+        for index, entry in watched:
+            key = (entry['token_address'].lower(), entry['contract_address'].lower())
+            self.routes.setdefault(key, []).append(index)
+            self.entries[index] = entry
+
+        self.tokens = sorted({token for token, _ in self.routes})
+        self.bridges = sorted({bridge for _, bridge in self.routes})
+
+        # Last block scanned
+        self.last_block: Optional[int] = None
+
+    def decode_transfer(self, log: dict, entry: dict) -> Txn:
+        """
+        Decodes a Transfer log into the same fields as an explorer 'tokentx' transaction.
+
+        :param log: Log dictionary
+        :param entry: Config entry of the watched token
+        :return: Transaction record
+        """
+        return decode_transfer(log, entry['token'], entry['decimals'])
+
+    async def get_new_transfers(self, timeout: float = 10) -> Optional[Dict[int, List[Txn]]]:
+        """
+        Gets all watched Transfers in the blocks mined since the last poll.
+        The first poll only sets the block cursor.
+
+        :param timeout: Max number of secs to wait for request
+        :return: Dictionary of watched index -> list of transaction records, None if a request failed
+        """
+        head = await self.node.block_number(timeout)
+        if head is None:
+            return None
+
+        if self.last_block is None:
+            self.last_block = head
+            return {}
+
+        from_block = self.last_block + 1
+        to_block = min(head, self.last_block + self.max_blocks)
+        if from_block > to_block:
+            return {}
+
+        bridge_topics = [address_to_topic(bridge) for bridge in self.bridges]
+
+        # Transfer topics are [signature, from, to] - one query for each side of the bridge
+        logs_from = await self.node.get_logs(self.tokens, [TRANSFER_TOPIC, bridge_topics],
+                                             from_block, to_block, timeout)
+        logs_to = await self.node.get_logs(self.tokens, [TRANSFER_TOPIC, None, bridge_topics],
+                                           from_block, to_block, timeout)
+        if logs_from is None or logs_to is None:
+            return None
+        txns_scanned.inc(len(logs_from) + len(logs_to), network=self.network)
+
+        transfers = {}
+        for log in sorted({(log['transactionHash'], log['logIndex']): log for log in logs_from + logs_to}.values(),
+                          key=lambda log: (int(log['blockNumber'], 16), int(log['logIndex'], 16))):
+            if len(log['topics']) != 3 or log.get('removed'):
+                continue
+
+            token = log['address'].lower()
+            for bridge in {topic_to_address(log['topics'][1]), topic_to_address(log['topics'][2])}:
+                for index in self.routes.get((token, bridge), []):
+                    transfers.setdefault(index, []).append(self.decode_transfer(log, self.entries[index]))
+
+        self.last_block = to_block
+
+        return transfers
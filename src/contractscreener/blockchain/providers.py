@@ -0,0 +1,52 @@
+from threading import Lock
+from typing import Dict
+
+from web3 import Web3
+from urllib3 import Retry
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from src.contractscreener.variables import infura_endpoints
+
+
+class ProviderRegistry:
+
+    def __init__(self, pool_size: int = 10):
+        """
+        Registry of one shared Web3 instance per node endpoint, so all contracts on a network
+        reuse the same keep-alive connection pool instead of opening one each.
+
+        :param pool_size: Max number of open connections to each node endpoint
+        """
+        self.pool_size = pool_size
+
+        self._web3: Dict[str, Web3] = {}
+        self._lock = Lock()
+
+    def get(self, network: str, web3_endpoint: str = "") -> Web3:
+        """
+        Returns the shared Web3 instance of a network, creating it on first use. Thread safe.
+
+        :param network: Name of Blockchain, eg. Ethereum or Optimism
+        :param web3_endpoint: Node provider network url endpoint, default is from infura_endpoints
+        :return: Web3 instance
+        """
+        if web3_endpoint == "":
+            web3_endpoint = infura_endpoints[network.lower()]
+
+        with self._lock:
+            if web3_endpoint not in self._web3:
+                # pool_block caps open connections, extra callers wait for a free one
+                session = Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True,
+                                      max_retries=Retry(total=2, status_forcelist=[429, 500, 502, 503, 504]))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                self._web3[web3_endpoint] = Web3(Web3.HTTPProvider(web3_endpoint, session=session))
+
+            return self._web3[web3_endpoint]
+
+
+# Shared by all contracts of the process
+providers = ProviderRegistry()
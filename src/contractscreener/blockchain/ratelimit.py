@@ -0,0 +1,153 @@
+import asyncio
+
+from time import monotonic
+from typing import (
+    Dict,
+    Tuple,
+    Optional,
+)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float = 5, burst: int = 5):
+        """
+        Async token bucket that spaces out requests to stay within an API's rate limit.
+        Waiting requests are served in FIFO order.
+
+        :param rate: Number of requests allowed per sec
+        :param burst: Max number of requests allowed back to back
+        """
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+
+        self.tokens = float(self.burst)
+        self.updated = monotonic()
+
+        # Queueing stats since the last report
+        self.requests = 0
+        self.queued_time = 0.0
+        self.max_queued = 0.0
+        # Requests waiting for a token right now
+        self.waiting = 0
+
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        """
+        Number of requests that may be sent right away, less the ones already waiting.
+
+        :return: Number of requests, negative if requests are queued
+        """
+        self._refill()
+
+        return self.tokens - self.waiting
+
+    async def acquire(self) -> float:
+        """
+        Waits until a request may be sent.
+
+        :return: Number of secs the request spent queued
+        """
+        # Created lazily so the lock belongs to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        start = monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                self._refill()
+                while self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    self._refill()
+
+                self.tokens -= 1
+        finally:
+            self.waiting -= 1
+
+        queued = monotonic() - start
+
+        self.requests += 1
+        self.queued_time += queued
+        self.max_queued = max(self.max_queued, queued)
+
+        return queued
+
+
+class RateLimiter:
+
+    def __init__(self, rate: float = 5, burst: int = 5):
+        """
+        Central request scheduler with one token bucket per explorer host and API key,
+        shared by all contracts screened on that explorer.
+
+        :param rate: Number of requests allowed per sec for each host and API key
+        :param burst: Max number of requests allowed back to back for each host and API key
+        """
+        self.rate = rate
+        self.burst = burst
+
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def bucket(self, host: str, api_key: Optional[str] = "") -> TokenBucket:
+        """
+        Returns the token bucket of an explorer host and API key, creating it on first use.
+
+        :param host: Explorer host name
+        :param api_key: Explorer API key
+        :return: TokenBucket
+        """
+        key = (host, str(api_key or ""))
+
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(self.rate, self.burst)
+
+        return self._buckets[key]
+
+    async def acquire(self, host: str, api_key: Optional[str] = "") -> float:
+        """
+        Waits until a request to an explorer host with a given API key may be sent.
+
+        :param host: Explorer host name
+        :param api_key: Explorer API key
+        :return: Number of secs the request spent queued
+        """
+        return await self.bucket(host, api_key).acquire()
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Queueing stats of each explorer host since the last report.
+
+        :return: Dictionary of host -> number of requests, avg and max secs queued
+        """
+        totals = {}
+        for (host, _), bucket in self._buckets.items():
+            requests, queued_time, max_queued = totals.get(host, (0, 0.0, 0.0))
+            totals[host] = (requests + bucket.requests, queued_time + bucket.queued_time,
+                            max(max_queued, bucket.max_queued))
+
+            bucket.requests = 0
+            bucket.queued_time = 0.0
+            bucket.max_queued = 0.0
+
+        return {host: {"requests": requests, "avg_queued": queued_time / requests if requests else 0.0,
+                       "max_queued": max_queued}
+                for host, (requests, queued_time, max_queued) in totals.items()}
+
+    def waiting(self) -> Dict[str, int]:
+        """
+        Number of requests currently queued for each explorer host.
+
+        :return: Dictionary of host -> number of waiting requests
+        """
+        totals = {}
+        for (host, _), bucket in self._buckets.items():
+            totals[host] = totals.get(host, 0) + bucket.waiting
+
+        return totals
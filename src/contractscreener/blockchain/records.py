@@ -0,0 +1,119 @@
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from typing import Dict
+
+
+def _int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class Txn:
+    """
+    Compact transaction record holding only the fields the screener uses, with numbers parsed once.
+    Records come from explorer 'txlist'/'tokentx' results or decoded node logs.
+    """
+
+    __slots__ = ("hash", "block_number", "timestamp", "from_address", "to_address", "value", "input",
+                 "function_name", "gas_price", "contract_address", "token_symbol", "token_decimal", "log_index")
+
+    # Explorer field name -> record attribute, used by filters
+    FIELDS = {
+        "hash": "hash",
+        "blockNumber": "block_number",
+        "timeStamp": "timestamp",
+        "from": "from_address",
+        "to": "to_address",
+        "value": "value",
+        "input": "input",
+        "functionName": "function_name",
+        "gasPrice": "gas_price",
+        "contractAddress": "contract_address",
+        "tokenSymbol": "token_symbol",
+        "tokenDecimal": "token_decimal",
+        "logIndex": "log_index",
+    }
+
+    def __init__(self, hash: str, block_number: int = 0, timestamp: int = 0, from_address: str = "",
+                 to_address: str = "", value: int = 0, input: str = "", function_name: str = "",
+                 gas_price: int = 0, contract_address: str = "", token_symbol: str = "",
+                 token_decimal: int = 0, log_index: int = 0):
+        self.hash = hash
+        self.block_number = block_number
+        self.timestamp = timestamp
+        self.from_address = from_address
+        self.to_address = to_address
+        self.value = value
+        self.input = input
+        self.function_name = function_name
+        self.gas_price = gas_price
+        self.contract_address = contract_address
+        self.token_symbol = token_symbol
+        self.token_decimal = token_decimal
+        self.log_index = log_index
+
+    def __repr__(self) -> str:
+        return f"Txn({self.hash}, block {self.block_number})"
+
+    def get(self, field: str, default=None):
+        """
+        Gets a field by its explorer name, eg. 'to' or 'gasPrice'.
+
+        :param field: Explorer field name
+        :param default: Value returned for unknown fields
+        :return: Field value
+        """
+        attribute = self.FIELDS.get(field)
+
+        return getattr(self, attribute) if attribute else default
+
+    def to_dict(self) -> Dict[str, object]:
+        """
+        Converts the record back to a dictionary keyed by explorer field names.
+
+        :return: Dictionary of transaction fields
+        """
+        return {field: getattr(self, attribute) for field, attribute in self.FIELDS.items()}
+
+    def to_journal(self) -> Dict[str, object]:
+        """
+        Converts the record to a compact dictionary for the transaction journal - empty fields are left out
+        and the input is cut to its function selector. Txn.from_explorer reads it back.
+
+        :return: Dictionary of non-empty transaction fields
+        """
+        record = {field: getattr(self, attribute) for field, attribute in self.FIELDS.items()
+                  if getattr(self, attribute)}
+        if self.input:
+            record['input'] = self.input[:10]
+
+        return record
+
+    @classmethod
+    def from_explorer(cls, txn: dict) -> "Txn":
+        """
+        Creates a record from an explorer transaction dictionary of string values.
+
+        :param txn: Explorer transaction dictionary
+        :return: Txn record
+        """
+        return cls(
+            hash=txn['hash'],
+            block_number=_int(txn.get('blockNumber')),
+            timestamp=_int(txn.get('timeStamp')),
+            from_address=txn.get('from', ""),
+            to_address=txn.get('to', ""),
+            value=_int(txn.get('value')),
+            input=txn.get('input', ""),
+            function_name=txn.get('functionName', ""),
+            gas_price=_int(txn.get('gasPrice')),
+            contract_address=txn.get('contractAddress', ""),
+            token_symbol=txn.get('tokenSymbol', ""),
+            token_decimal=_int(txn.get('tokenDecimal')),
+            log_index=_int(txn.get('logIndex')),
+        )
@@ -0,0 +1,234 @@
+import os
+import gzip
+import json
+
+from time import (
+    sleep,
+    perf_counter,
+)
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Iterator,
+    Optional,
+)
+
+from tabulate import tabulate
+
+from src.contractscreener.blockchain.evm import EvmContract
+from src.contractscreener.blockchain.records import (
+    Txn,
+    loads,
+)
+from src.contractscreener.blockchain.filters import (
+    Predicate,
+    apply_filter,
+)
+
+
+# Pipeline stages timed by a replay, in the order each batch passes them
+STAGES = ("read", "parse", "filter", "seen", "alert")
+
+
+class CaptureSink:
+
+    def __init__(self, filename: str = ""):
+        """
+        Alert sink of a replay, in place of the Telegram dispatcher. Counts the alerts and writes each of them
+        to a JSONL file, if given, so the alerts of two replays can be compared by their alert keys.
+
+        :param filename: Path of alerts file, empty to only count the alerts
+        """
+        self.filename = filename
+        self.alerts = 0
+
+        self._file = open(filename, "w") if filename else None
+
+    def send(self, message: str, network: str = "", txn_time: float = 0, alert_key: str = "") -> None:
+        """
+        Captures an alert, same arguments as TelegramDispatcher.send.
+
+        :param message: Alert message
+        :param network: Network of the txn
+        :param txn_time: On-chain unix time of the txn
+        :param alert_key: Identity of the alert
+        :return: None
+        """
+        self.alerts += 1
+
+        if self._file:
+            alert = {"alert_key": alert_key, "network": network, "txn_time": txn_time, "message": message}
+            self._file.write(f"{json.dumps(alert, separators=(',', ':'))}\n")
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def replay_files(path: str) -> List[str]:
+    """
+    Lists the recorded files to replay, oldest first. A directory holds eg. a poll recording or journal
+    with its rotated files, or the chunk files of a backfill.
+
+    :param path: Path of a file or directory
+    :return: List of file paths
+    """
+    if not os.path.isdir(path):
+        return [path]
+
+    def order(file: str) -> Tuple[str, str, bool, str]:
+        directory, name = os.path.split(file)
+        base, _, rotation = name.partition(".jsonl")
+        # Rotated files of a log come before the file still being written
+        return directory, base, not rotation, rotation
+
+    files = [os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names
+             if ".jsonl" in name and not name.endswith(".tmp")]
+
+    return sorted(files, key=order)
+
+
+def read_batches(path: str) -> Iterator[Tuple[float, str, str, List[dict], bool]]:
+    """
+    Reads recorded txns as the batches they were polled in. Lines of a poll recording are one poll each,
+    lines of a transaction journal or backfill are single txns, batched by contract and the time they were
+    seen, or their block.
+
+    :param path: Path of a file or directory, gzipped files are read as they are
+    :return: Iterator of recording time, network, contract address, list of txn dictionaries of each batch
+        and True for a contract's baseline poll, whose txns were only marked as seen
+    """
+    batch_key = None
+    batch: List[dict] = []
+
+    for file in replay_files(path):
+        with (gzip.open(file, "rt") if file.endswith(".gz") else open(file)) as lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = loads(line)
+
+                if 'txns' in record:
+                    if batch:
+                        yield batch_key[2], batch_key[0], batch_key[1], batch, False
+                        batch_key, batch = None, []
+                    yield record.get('t', 0), record['network'], record['contract'], record['txns'], \
+                        record.get('baseline', False)
+                    continue
+
+                key = (record['network'], record['contract'], record.get('seen') or record.get('timeStamp', 0))
+                if key != batch_key and batch:
+                    yield batch_key[2], batch_key[0], batch_key[1], batch, False
+                    batch = []
+                batch_key = key
+                batch.append(record)
+
+    if batch:
+        yield batch_key[2], batch_key[0], batch_key[1], batch, False
+
+
+class Replay:
+
+    def __init__(self, entries: List[dict], contracts: List[EvmContract], txn_filter: Predicate,
+                 speed: float = 0):
+        """
+        Pushes recorded txns through the screening pipeline of the live modes - filter, seen hashes and alerts -
+        timing each stage. Contract entries with a 'token_address' are alerted like the Erc20 mode, the others
+        like the Transactions mode.
+
+        :param entries: List of contract entries of the config file
+        :param contracts: EvmContract of each entry, sending its alerts to a CaptureSink
+        :param txn_filter: Compiled filter_by of the config file
+        :param speed: Replay speed relative to the recording, eg. 10 for ten times faster, 0 for as fast as possible
+        """
+        self.txn_filter = txn_filter
+        self.speed = speed
+
+        # (network, contract address) -> contract and min_amount of Erc20 entries
+        self.contracts: Dict[Tuple[str, str], Tuple[EvmContract, Optional[float]]] = {}
+        for entry, contract in zip(entries, contracts):
+            min_amount = entry['min_amount'] if 'token_address' in entry else None
+            self.contracts[(contract.name, contract.contract_address)] = contract, min_amount
+
+        self.stages: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.waited = 0.0
+        self.txns = 0
+        self.new_txns = 0
+        self.skipped = 0
+
+    def run(self, path: str) -> None:
+        """
+        Replays every batch of a recording.
+
+        :param path: Path of a recorded file or directory
+        :return: None
+        """
+        batches = read_batches(path)
+        first: Optional[Tuple[float, float]] = None
+
+        while True:
+            start = perf_counter()
+            batch = next(batches, None)
+            self.stages['read'] += perf_counter() - start
+            if batch is None:
+                break
+
+            recorded_at, network, address, rows, baseline = batch
+            target = self.contracts.get((network.lower(), address.lower()))
+            if target is None:
+                self.skipped += len(rows)
+                continue
+            contract, min_amount = target
+
+            # Keep the recorded gaps between batches, scaled by speed
+            if self.speed and recorded_at:
+                if first is None:
+                    first = recorded_at, perf_counter()
+                delay = (recorded_at - first[0]) / self.speed - (perf_counter() - first[1])
+                if delay > 0:
+                    sleep(delay)
+                    self.waited += delay
+
+            start = perf_counter()
+            txns = [Txn.from_explorer(row) for row in rows]
+            parsed = perf_counter()
+            txns = apply_filter(self.txn_filter, txns)
+            filtered = perf_counter()
+            found_txns = contract.filter_new_txns(txns)
+            seen = perf_counter()
+            if found_txns and not baseline:
+                if min_amount is None:
+                    contract.alert_checked_txns(txns=found_txns)
+                else:
+                    contract.alert_erc20_txns(txns=found_txns, min_txn_amount=min_amount)
+            alerted = perf_counter()
+
+            self.stages['parse'] += parsed - start
+            self.stages['filter'] += filtered - parsed
+            self.stages['seen'] += seen - filtered
+            self.stages['alert'] += alerted - seen
+
+            self.txns += len(rows)
+            self.new_txns += 0 if baseline else len(found_txns)
+
+    def report(self, alerts: int) -> str:
+        """
+        Summary of a replay - txns per sec and the time taken by each pipeline stage.
+
+        :param alerts: Number of alerts captured
+        :return: Report text
+        """
+        busy = sum(self.stages.values())
+        table = [[stage, f"{secs:,.3f}", f"{100 * secs / max(busy, 1e-9):.1f}%",
+                  f"{1e6 * secs / max(self.txns, 1):,.2f}"] for stage, secs in self.stages.items()]
+
+        summary = f"Replayed {self.txns:,} txns in {busy:,.2f} secs ({self.txns / max(busy, 1e-9):,.0f} txns/s), " \
+                  f"{self.new_txns:,} new, {alerts:,} alerts"
+        if self.skipped:
+            summary += f", {self.skipped:,} txns of contracts not in the config skipped"
+        if self.waited:
+            summary += f", {self.waited:,.1f} secs waited for the recorded pace"
+
+        return f"{summary}.\n{tabulate(table, headers=['Stage', 'Secs', 'Share', 'µs/txn'])}"
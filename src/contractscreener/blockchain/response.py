@@ -0,0 +1,112 @@
+from codecs import getincrementaldecoder
+from json import (
+    JSONDecoder,
+    JSONDecodeError,
+)
+from typing import (
+    Dict,
+    AsyncIterator,
+)
+
+
+WHITESPACE = " \t\n\r"
+
+
+class ResultStream:
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        """
+        Incremental parser of an explorer response such as {"status": "1", "message": "OK", "result": [...]},
+        that yields the items of its 'result' array one at a time while the body is still downloading.
+        The caller can stop at any item without reading, or parsing, the rest of the body.
+
+        :param chunks: Async iterator of body chunks, eg. response.content.iter_chunked(16384)
+        """
+        self.chunks = chunks.__aiter__()
+
+        # Top level fields other than a 'result' array, eg. status and message
+        self.fields: Dict[str, object] = {}
+
+        self._decoder = JSONDecoder()
+        self._utf8 = getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    async def _fill(self) -> None:
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            chunk = b""
+
+        # Drop what is already parsed so only the item being parsed is kept in memory
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(chunk, final=self._eof)
+        self._pos = 0
+
+    async def _peek(self) -> str:
+        """Skips whitespace and returns the next character, or '' at the end of the body."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                return ""
+
+            await self._fill()
+
+    async def _expect(self, chars: str) -> str:
+        char = await self._peek()
+        if not char or char not in chars:
+            raise JSONDecodeError(f"Expecting one of {chars!r}", self._buffer, self._pos)
+
+        self._pos += 1
+        return char
+
+    async def _value(self) -> object:
+        await self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except JSONDecodeError:
+                if self._eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+
+            await self._fill()
+
+    async def results(self) -> AsyncIterator[object]:
+        """
+        Yields the items of the 'result' array as they are parsed.
+        Other top level fields are collected into self.fields, a 'result' that is not an array included.
+
+        :return: Async iterator of result items
+        """
+        await self._expect("{")
+        if await self._peek() == "}":
+            return
+
+        while True:
+            key = await self._value()
+            await self._expect(":")
+
+            if key == "result" and await self._peek() == "[":
+                self._pos += 1
+                if await self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield await self._value()
+                        if await self._expect(",]") == "]":
+                            break
+            else:
+                self.fields[key] = await self._value()
+
+            if await self._expect(",}") == "}":
+                return
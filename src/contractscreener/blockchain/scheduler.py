@@ -0,0 +1,220 @@
+import asyncio
+
+from time import (
+    time,
+    perf_counter,
+)
+from typing import (
+    Dict,
+    Callable,
+    Optional,
+    Awaitable,
+)
+
+from src.contractscreener.common.logger import log_error
+
+
+class AdaptiveScheduler:
+
+    def __init__(self, min_interval: float = 2, max_interval: float = 60, target_txns: float = 1,
+                 alpha: float = 0.3, budgets: Optional[Dict[str, float]] = None):
+        """
+        Chooses each task's polling interval from an exponentially weighted moving average (EWMA)
+        of its new txns per sec, so busy contracts are polled more often and idle ones back off.
+        The intervals of all tasks on one explorer host are stretched as needed to stay within its request budget.
+
+        :param min_interval: Min secs between two polls of a task
+        :param max_interval: Max secs between two polls of a task, unless the budget needs more
+        :param target_txns: Number of new txns a poll should find on average
+        :param alpha: EWMA weight of the latest observation, between 0 and 1
+        :param budgets: Dictionary of explorer host -> max requests per sec for all its tasks
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_txns = target_txns
+        self.alpha = alpha
+        self.budgets = budgets if budgets else {}
+
+        self.rates: Dict[str, float] = {}
+        self.hosts: Dict[str, str] = {}
+        # host -> sum of polls per sec its tasks would like to make
+        self.demand: Dict[str, float] = {}
+
+    def register(self, name: str, host: str, interval: float) -> None:
+        """
+        Registers a task, starting from a rate that matches its configured interval.
+
+        :param name: Name of task
+        :param host: Explorer host the task polls
+        :param interval: Configured secs between polls
+        :return: None
+        """
+        self.hosts[name] = host
+        self.rates[name] = self.target_txns / interval
+        self.demand[host] = self.demand.get(host, 0) + 1 / self._desired(name)
+
+    def unregister(self, name: str) -> None:
+        """
+        Unregisters a task, eg. of a contract moved to another worker.
+
+        :param name: Name of task
+        :return: None
+        """
+        if name in self.hosts:
+            self.demand[self.hosts[name]] -= 1 / self._desired(name)
+            del self.hosts[name], self.rates[name]
+
+    def _desired(self, name: str) -> float:
+        rate = self.rates[name]
+        interval = self.target_txns / rate if rate > 0 else self.max_interval
+
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def interval(self, name: str) -> float:
+        """
+        Current interval of a task, stretched to fit its explorer's request budget.
+
+        :param name: Name of task
+        :return: Secs until the next poll
+        """
+        budget = self.budgets.get(self.hosts[name])
+        if not budget:
+            return self._desired(name)
+
+        return self._desired(name) * max(self.demand[self.hosts[name]] / budget, 1)
+
+    def update(self, name: str, new_txns: int, elapsed: float) -> float:
+        """
+        Updates the EWMA rate of a task with the outcome of a poll.
+
+        :param name: Name of task
+        :param new_txns: Number of new txns the poll found
+        :param elapsed: Secs since the previous poll
+        :return: Secs until the next poll
+        """
+        if elapsed > 0:
+            host = self.hosts[name]
+            self.demand[host] -= 1 / self._desired(name)
+            self.rates[name] = self.alpha * new_txns / elapsed + (1 - self.alpha) * self.rates[name]
+            self.demand[host] += 1 / self._desired(name)
+
+        return self.interval(name)
+
+    def intervals(self) -> Dict[str, float]:
+        """
+        Interval currently chosen for each task.
+
+        :return: Dictionary of task name -> secs between polls
+        """
+        return {name: self.interval(name) for name in self.hosts}
+
+
+class ScreeningTask:
+
+    def __init__(self, name: str, poll: Callable[[], Awaitable[Optional[int]]], interval: float,
+                 timeout: float = 30, wake: Optional[asyncio.Event] = None, max_backoff: float = 300,
+                 scheduler: Optional[AdaptiveScheduler] = None, host: str = "", min_wake_interval: float = 0,
+                 fallback_interval: float = 0, healthy: Optional[Callable[[], bool]] = None):
+        """
+        Supervised task that polls one contract, or one network, on its own interval.
+        A slow, failing or crashing poll is timed out, logged and retried with backoff,
+        without holding up any other task.
+
+        :param name: Name of task for logging, eg. 'ethereum 0xa3c6...b63a'
+        :param poll: Coroutine function that polls once, handles its results and returns the number of new txns
+        :param interval: Secs to wait between polls
+        :param timeout: Max secs a poll may take
+        :param wake: Optional event that triggers the next poll early, eg. on a new block
+        :param max_backoff: Max secs to wait before retrying a failing poll
+        :param scheduler: Optional adaptive scheduler that picks the interval after every poll
+        :param host: Explorer host the task polls, for the scheduler's request budget
+        :param min_wake_interval: Min secs between the starts of two polls, however often the wake event is set
+        :param fallback_interval: Secs to wait between polls instead of the interval while healthy returns True
+        :param healthy: Optional function returning whether the wake events are currently being pushed
+        """
+        self.name = name
+        self.poll = poll
+        self.interval = interval
+        self.timeout = timeout
+        self.wake = wake
+        self.max_backoff = max_backoff
+        self.scheduler = scheduler
+        self.min_wake_interval = min_wake_interval
+        self.fallback_interval = fallback_interval
+        self.healthy = healthy
+
+        if scheduler:
+            scheduler.register(name, host, interval)
+
+        self.failures = 0
+        self.last_duration = 0.0
+        self.last_success: Optional[float] = None
+        self.last_start = 0.0
+
+    async def wait(self) -> None:
+        """
+        Waits for the interval to pass or the wake event to be set, whichever comes first.
+        While the wake events are healthy the interval is stretched to the fallback interval,
+        and a wake within the min wake interval of the last poll is held back until it has passed.
+
+        :return: None
+        """
+        if self.wake is None:
+            await asyncio.sleep(self.interval)
+            return
+
+        waited = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                waited += self.interval
+                # Checked after every interval, so a dropped subscription falls back to the interval
+                if self.healthy and self.healthy() and waited < self.fallback_interval:
+                    continue
+                break
+
+            # Wakes set while held back are served by this same poll
+            delay = self.min_wake_interval - (perf_counter() - self.last_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            break
+
+        self.wake.clear()
+
+    async def run(self) -> None:
+        """
+        Polls until cancelled.
+
+        :return: None
+        """
+        last_start = None
+        while True:
+            start = self.last_start = perf_counter()
+            try:
+                new_txns = await asyncio.wait_for(self.poll(), timeout=self.timeout)
+                self.failures = 0
+                self.last_success = time()
+
+                if self.scheduler and last_start is not None:
+                    self.interval = self.scheduler.update(self.name, new_txns or 0, start - last_start)
+                last_start = start
+
+            except asyncio.CancelledError:
+                raise
+
+            except asyncio.TimeoutError:
+                self.failures += 1
+                log_error.warning(f"'TimeoutError' - {self.name} - poll took longer than {self.timeout} secs.")
+
+            except Exception as e:
+                self.failures += 1
+                log_error.warning(f"'{type(e).__name__}' - {self.name} - {e}")
+
+            self.last_duration = perf_counter() - start
+
+            if self.failures:
+                # Exponent capped, a float interval times 2 ** 1024 overflows
+                await asyncio.sleep(min(self.interval * 2 ** min(self.failures, 16), self.max_backoff))
+            else:
+                await self.wait()
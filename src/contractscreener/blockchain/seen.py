@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import (
+    List,
+    Iterable,
+)
+
+from src.contractscreener.blockchain.records import Txn
+
+
+class SeenHashes:
+
+    def __init__(self, max_size: int = 1000):
+        """
+        Bounded, least recently seen evicted, index of transaction hashes.
+        Answers 'is this txn new?' in O(1) and keeps only the hash of each txn.
+
+        :param max_size: Max number of hashes to remember
+        """
+        self.max_size = max(int(max_size), 1)
+
+        self._hashes: "OrderedDict[str, None]" = OrderedDict()
+
+    def __contains__(self, txn_hash: str) -> bool:
+        return txn_hash in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __iter__(self):
+        return iter(self._hashes)
+
+    def add(self, txn_hash: str) -> bool:
+        """
+        Marks a hash as seen, evicting the least recently seen hash if full.
+
+        :param txn_hash: Transaction hash
+        :return: True if hash was not seen before
+        """
+        if txn_hash in self._hashes:
+            self._hashes.move_to_end(txn_hash)
+            return False
+
+        self._hashes[txn_hash] = None
+        if len(self._hashes) > self.max_size:
+            self._hashes.popitem(last=False)
+
+        return True
+
+    def update(self, txn_hashes: Iterable[str]) -> None:
+        """
+        Marks multiple hashes as seen.
+
+        :param txn_hashes: Iterable of transaction hashes
+        :return: None
+        """
+        for txn_hash in txn_hashes:
+            self.add(txn_hash)
+
+    def filter_new(self, txns: List[Txn]) -> List[Txn]:
+        """
+        Returns the transactions not seen before and marks all of them as seen.
+
+        :param txns: List of transaction records
+        :return: List of transaction records not seen before
+        """
+        return [txn for txn in txns if self.add(txn.hash)]
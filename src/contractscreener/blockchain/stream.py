@@ -0,0 +1,169 @@
+import asyncio
+
+from typing import (
+    List,
+    Tuple,
+    Callable,
+    Optional,
+)
+
+from aiohttp import (
+    ClientSession,
+    ClientTimeout,
+    ClientWebSocketResponse,
+    WSMsgType,
+)
+
+from src.contractscreener.blockchain.node import (
+    TRANSFER_TOPIC,
+    address_to_topic,
+    topic_to_address,
+)
+from src.contractscreener.common.logger import log_error
+
+
+def contract_filters(addresses: List[str]) -> List[dict]:
+    """
+    Log filters matching every event emitted by the screened contracts.
+
+    :param addresses: Contract addresses
+    :return: List of 'eth_subscribe logs' filters
+    """
+    return [{"address": sorted({address.lower() for address in addresses})}]
+
+
+def transfer_filters(tokens: List[str], bridges: List[str]) -> List[dict]:
+    """
+    Log filters matching the Transfers of the watched tokens from or to their bridge addresses.
+
+    :param tokens: Token addresses
+    :param bridges: Bridge contract addresses
+    :return: List of 'eth_subscribe logs' filters, one for each side of the bridge
+    """
+    tokens = sorted({token.lower() for token in tokens})
+    bridge_topics = [address_to_topic(bridge) for bridge in sorted(set(bridges))]
+
+    # Transfer topics are [signature, from, to]
+    return [{"address": tokens, "topics": [TRANSFER_TOPIC, bridge_topics]},
+            {"address": tokens, "topics": [TRANSFER_TOPIC, None, bridge_topics]}]
+
+
+def activity_keys(log: dict) -> List[Tuple[str, str]]:
+    """
+    Keys of the screened contracts a log is activity of: (contract address, '') for its emitter and
+    (token address, bridge address) for both sides of a Transfer.
+
+    :param log: Log dictionary
+    :return: List of keys
+    """
+    address = log['address'].lower()
+    keys = [(address, "")]
+    if len(log.get('topics', [])) == 3 and log['topics'][0] == TRANSFER_TOPIC:
+        keys += [(address, topic_to_address(topic)) for topic in log['topics'][1:]]
+
+    return keys
+
+
+class LogSubscriber:
+
+    def __init__(self, network: str, endpoint: str, filters: List[dict], on_log: Callable[[str, dict], None],
+                 on_connect: Callable[[str], None], max_delay: float = 60):
+        """
+        Keeps a persistent 'eth_subscribe logs' WebSocket subscription to a node, filtered by the screened
+        contract addresses, and calls on_log with the network name and every matching log, so only the contracts
+        with new activity are polled. After every (re)connect on_connect is called once, which backfills anything
+        missed while disconnected from the contracts' block cursors.
+
+        :param network: Network name
+        :param endpoint: Node provider WebSocket url endpoint
+        :param filters: Log filters, one subscription each, eg. from contract_filters or transfer_filters
+        :param on_log: Function called with the network name and log dictionary of every matching log
+        :param on_connect: Function called with the network name once subscribed
+        :param max_delay: Max secs to wait between reconnect attempts
+        """
+        self.network = network.lower()
+        self.endpoint = endpoint
+        self.filters = filters
+        self.on_log = on_log
+        self.on_connect = on_connect
+        self.max_delay = max_delay
+
+        # True while every subscription is open
+        self.healthy = False
+        self.last_block: Optional[int] = None
+
+        self._ws: Optional[ClientWebSocketResponse] = None
+        self._resubscribe = False
+
+    async def resubscribe(self, filters: List[dict]) -> None:
+        """
+        Replaces the log filters, eg. when contracts are moved to or away from this worker,
+        and subscribes again with them at once if connected.
+
+        :param filters: Log filters, one subscription each
+        :return: None
+        """
+        self.filters = filters
+        if self._ws is not None:
+            self._resubscribe = True
+            await self._ws.close()
+
+    async def run(self) -> None:
+        """
+        Subscribes to the logs and reconnects with exponential backoff whenever dropped. Runs until cancelled.
+
+        :return: None
+        """
+        delay = 1
+        # No total timeout - the subscription is meant to stay open
+        async with ClientSession(timeout=ClientTimeout(total=None, sock_connect=10)) as session:
+            while True:
+                try:
+                    async with session.ws_connect(self.endpoint, heartbeat=30) as ws:
+                        self._ws = ws
+                        for request_id, log_filter in enumerate(self.filters, 1):
+                            await ws.send_json({"jsonrpc": "2.0", "id": request_id, "method": "eth_subscribe",
+                                                "params": ["logs", log_filter]})
+                        pending = len(self.filters)
+
+                        async for message in ws:
+                            if message.type != WSMsgType.TEXT:
+                                break
+
+                            data = message.json()
+                            if 'error' in data:
+                                log_error.warning(f"'WebSocketError' - {self.network} - {data['error']}")
+                                break
+
+                            if data.get('method') == "eth_subscription":
+                                log = data['params']['result']
+                                # Logs of blocks dropped by a reorg are polled again, like new ones
+                                self.last_block = int(log['blockNumber'], 16)
+                                self.on_log(self.network, log)
+
+                            elif 'result' in data and pending:
+                                pending -= 1
+                                if not pending:
+                                    self.healthy = True
+                                    delay = 1
+                                    # Catch up on anything mined while disconnected
+                                    self.on_connect(self.network)
+
+                except asyncio.CancelledError:
+                    raise
+
+                except Exception as e:
+                    log_error.warning(f"'WebSocketError' - {self.network} - {e}")
+
+                finally:
+                    self.healthy = False
+                    self._ws = None
+
+                if self._resubscribe:
+                    self._resubscribe = False
+                    continue
+
+                log_error.warning(f"'WebSocketError' - {self.network} subscription dropped, "
+                                  f"reconnecting in {delay} secs.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
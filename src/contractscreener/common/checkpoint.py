@@ -0,0 +1,123 @@
+import os
+import sqlite3
+
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Iterable,
+)
+
+
+# (network, contract, mode) eg. ('ethereum', '0xa3c6...b63a', 'transactions')
+CheckpointKey = Tuple[str, str, str]
+
+
+class CheckpointStore:
+
+    def __init__(self, filename: str = "logs/checkpoint.db", max_hashes: int = 1000):
+        """
+        Embedded SQLite store of the last processed block and the recent txn hashes
+        of each screened contract, so a restart resumes where the previous run stopped.
+        Writes are staged in memory and flushed in a single transaction by commit().
+
+        :param filename: Path of the SQLite database file
+        :param max_hashes: Max number of recent hashes to keep per contract
+        """
+        self.filename = filename
+        self.max_hashes = max_hashes
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Worker processes share the file, a commit waits for another worker's commit to finish
+        self.connection = sqlite3.connect(filename, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS checkpoints ("
+                                    "network TEXT, contract TEXT, mode TEXT, last_block INTEGER, "
+                                    "PRIMARY KEY (network, contract, mode))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS seen ("
+                                    "network TEXT, contract TEXT, mode TEXT, hash TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS seen_key ON seen (network, contract, mode)")
+
+        self._blocks: Dict[CheckpointKey, int] = {}
+        self._hashes: Dict[CheckpointKey, List[str]] = {}
+
+    def load(self) -> Dict[CheckpointKey, Tuple[Optional[int], List[str]]]:
+        """
+        Loads all checkpoints in one bulk read.
+
+        :return: Dictionary of key -> (last processed block, recent hashes oldest first)
+        """
+        rows = self.connection.execute(
+            "SELECT c.network, c.contract, c.mode, c.last_block, s.hash FROM checkpoints c "
+            "LEFT JOIN seen s ON s.network = c.network AND s.contract = c.contract AND s.mode = c.mode "
+            "ORDER BY s.rowid"
+        ).fetchall()
+
+        checkpoints = {}
+        for network, contract, mode, last_block, txn_hash in rows:
+            key = (network, contract, mode)
+            if key not in checkpoints:
+                checkpoints[key] = (last_block, [])
+            if txn_hash is not None:
+                checkpoints[key][1].append(txn_hash)
+
+        return checkpoints
+
+    def stage(self, key: CheckpointKey, last_block: Optional[int], txn_hashes: Iterable[str] = ()) -> None:
+        """
+        Stages a checkpoint update in memory until the next commit.
+
+        :param key: (network, contract, mode) of the screened contract
+        :param last_block: Last processed block
+        :param txn_hashes: Newly processed txn hashes
+        :return: None
+        """
+        if last_block is not None:
+            self._blocks[key] = last_block
+
+        txn_hashes = list(txn_hashes)
+        if txn_hashes:
+            self._hashes.setdefault(key, []).extend(txn_hashes)
+
+    def commit(self) -> None:
+        """
+        Writes all staged updates in a single transaction and trims old hashes.
+
+        :return: None
+        """
+        if not self._blocks and not self._hashes:
+            return
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO checkpoints (network, contract, mode, last_block) VALUES (?, ?, ?, ?)",
+                [(*key, last_block) for key, last_block in self._blocks.items()]
+            )
+            self.connection.executemany(
+                "INSERT INTO seen (network, contract, mode, hash) VALUES (?, ?, ?, ?)",
+                [(*key, txn_hash) for key, txn_hashes in self._hashes.items() for txn_hash in txn_hashes]
+            )
+            self.connection.executemany(
+                "DELETE FROM seen WHERE network = ? AND contract = ? AND mode = ? AND rowid NOT IN ("
+                "SELECT rowid FROM seen WHERE network = ? AND contract = ? AND mode = ? "
+                "ORDER BY rowid DESC LIMIT ?)",
+                [(*key, *key, self.max_hashes) for key in self._hashes]
+            )
+
+        self._blocks.clear()
+        self._hashes.clear()
+
+    def close(self) -> None:
+        """
+        Commits any staged updates and closes the database.
+
+        :return: None
+        """
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,465 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+
+from hashlib import sha256
+from time import (
+    time,
+    monotonic,
+)
+from datetime import datetime
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Callable,
+    Optional,
+    Awaitable,
+)
+
+from src.contractscreener.common.logger import log_error
+from src.contractscreener.common.heartbeat import Heartbeat
+from src.contractscreener.common.message import TelegramDispatcher
+from src.contractscreener.variables import time_format
+
+
+def shard_key(contract: dict) -> str:
+    """
+    Stable sharding key of a config entry, eg. 'ethereum:0xa3c6...b63a'.
+
+    :param contract: Config entry with 'network' and 'contract_address'
+    :return: Sharding key
+    """
+    return f"{contract['network'].lower()}:{contract['contract_address'].lower()}"
+
+
+def assign_shards(contracts: Dict[str, dict], workers: List[int]) -> Dict[int, Dict[str, dict]]:
+    """
+    Assigns every config entry to one worker by rendezvous hashing of its network and address.
+    An entry only ever moves when its worker leaves, or comes back, so rebalancing moves as few contracts as possible.
+
+    :param contracts: Dictionary of config name -> config entry
+    :param workers: List of live worker numbers
+    :return: Dictionary of worker number -> its config entries
+    """
+    shards = {worker: {} for worker in workers}
+    for name, contract in contracts.items():
+        key = shard_key(contract)
+        worker = max(workers, key=lambda number: sha256(f"{number}:{key}".encode()).digest())
+        shards[worker][name] = contract
+
+    return shards
+
+
+class CoordinatorClient:
+
+    def __init__(self, address: str, worker_name: str, max_delay: float = 30):
+        """
+        Worker side of the coordinator link. Has the same send(), start() and close() as TelegramDispatcher,
+        but queues alerts and heartbeats to the coordinator, which drops duplicates and delivers them.
+        Shard updates sent back over the same connection are passed to on_shard.
+        Stops the worker if the coordinator process exits.
+
+        :param address: Coordinator address, eg. '127.0.0.1:40123'
+        :param worker_name: Name of this worker, eg. 'worker-2'
+        :param max_delay: Max secs to wait between reconnect attempts
+        """
+        self.host, port = address.rsplit(":", 1)
+        self.port = int(port)
+        self.worker_name = worker_name
+        self.max_delay = max_delay
+
+        self.parent = os.getppid()
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Message taken off the queue and not forwarded yet, sent again after a reconnect
+        self._message: Optional[dict] = None
+
+        # Coroutine function called with the worker's new contracts whenever the coordinator moves some
+        self.on_shard: Optional[Callable[[Dict[str, dict]], Awaitable[None]]] = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so the queue belongs to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+
+        return self._queue
+
+    def __len__(self) -> int:
+        return self.queue.qsize() + (self._message is not None)
+
+    def send(
+            self,
+            message_text: str,
+            disable_web_page_preview: bool = True,
+            telegram_chat_id: Optional[str] = "",
+            debug: bool = False,
+            network: str = "",
+            txn_time: float = 0,
+            alert_key: str = "",
+    ) -> None:
+        """
+        Queues an alert for the coordinator, same arguments as TelegramDispatcher.send.
+
+        :return: None
+        """
+        self.queue.put_nowait({"type": "alert", "message_text": str(message_text),
+                               "disable_web_page_preview": disable_web_page_preview,
+                               "telegram_chat_id": telegram_chat_id, "debug": debug, "network": network,
+                               "txn_time": txn_time, "alert_key": alert_key})
+
+    def heartbeat(self, status: dict) -> None:
+        """
+        Queues this worker's heartbeat for the coordinator.
+
+        :param status: Heartbeat status dictionary
+        :return: None
+        """
+        self.queue.put_nowait({"type": "heartbeat", "worker": self.worker_name, "status": status})
+
+    def start(self) -> asyncio.Task:
+        """
+        Starts forwarding queued messages in a background task. Must be called from within a running event loop.
+
+        :return: Forwarding task
+        """
+        self._task = asyncio.create_task(self.run())
+
+        return self._task
+
+    async def run(self) -> None:
+        """
+        Forwards queued messages as JSON lines and receives shard updates, reconnecting with backoff.
+        Runs until cancelled.
+
+        :return: None
+        """
+        delay = 1
+        while True:
+            if os.getppid() != self.parent:
+                # Orphaned - the coordinator has exited
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                delay = 1
+                # Tells the coordinator which worker this connection belongs to
+                writer.write(json.dumps({"type": "hello", "worker": self.worker_name}).encode() + b"\n")
+
+                link = [asyncio.create_task(self.forward(writer)), asyncio.create_task(self.receive(reader))]
+                try:
+                    done, _ = await asyncio.wait(link, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                finally:
+                    for task in link:
+                        task.cancel()
+                    await asyncio.gather(*link, return_exceptions=True)
+                    writer.close()
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                log_error.warning(f"'CoordinatorError' - {self.worker_name} - {e}, reconnecting in {delay} secs.")
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+    async def forward(self, writer: asyncio.StreamWriter) -> None:
+        """Writes the queued messages to the coordinator."""
+        while True:
+            if self._message is None:
+                self._message = await self.queue.get()
+            writer.write(json.dumps(self._message).encode() + b"\n")
+            await writer.drain()
+            self._message = None
+
+    async def receive(self, reader: asyncio.StreamReader) -> None:
+        """Reads the shard updates sent by the coordinator."""
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Connection closed by the coordinator")
+
+            message = json.loads(line)
+            if message['type'] == "shard" and self.on_shard:
+                # Not interrupted half way by a dropped connection
+                await asyncio.shield(self.on_shard(message['contracts']))
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        Waits up to timeout secs for queued messages to be forwarded, then stops the background task.
+
+        :param timeout: Max secs to wait for queued messages
+        :return: None
+        """
+        deadline = monotonic() + timeout
+        while len(self) and self._task and not self._task.done() and monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        if len(self):
+            log_error.warning(f"'CoordinatorError' - {self.worker_name} - {len(self)} queued messages were not "
+                              f"forwarded.")
+
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class Coordinator:
+
+    def __init__(self, script: str, mode: str, info: dict, workers: int, dispatcher: TelegramDispatcher,
+                 heartbeat: Heartbeat, shard_dir: str = "logs/shards", worker_timeout: float = 120,
+                 restart_delay: float = 60, report_interval: float = 10):
+        """
+        Runs the screener as a number of worker processes, each screening a shard of the contracts.
+        Workers send their alerts and heartbeats back, alerts are delivered once from here.
+        When a worker dies, or stops sending heartbeats, its contracts are moved to the remaining workers
+        and moved back once it has been restarted. Running workers get their new shard over their connection
+        and only start or stop the contracts that moved.
+
+        :param script: Path of the screener script, ie. etherscan.py
+        :param mode: Screening mode argument, eg. '-t' or '-e'
+        :param info: Full config with 'settings' and 'contracts'
+        :param workers: Number of worker processes
+        :param dispatcher: Telegram dispatcher delivering the alerts of all workers
+        :param heartbeat: Heartbeat combining the statuses of all workers
+        :param shard_dir: Directory of the workers' config files
+        :param worker_timeout: Max secs between two heartbeats of a worker, or until its first one, before it is restarted
+        :param restart_delay: Secs to wait before restarting a dead worker
+        :param report_interval: Secs between two coordinator status lines
+        """
+        self.script = script
+        self.mode = mode
+        self.info = info
+        self.workers = workers
+        self.dispatcher = dispatcher
+        self.heartbeat = heartbeat
+        self.shard_dir = shard_dir
+        self.worker_timeout = worker_timeout
+        self.restart_delay = restart_delay
+        self.report_interval = report_interval
+
+        self.address = ""
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.started: Dict[int, float] = {}
+        self.shards: Dict[int, Dict[str, dict]] = {}
+        # worker number -> time it may be restarted
+        self.dead: Dict[int, float] = {}
+        # worker name -> (time received, last heartbeat status)
+        self.statuses: Dict[str, Tuple[float, dict]] = {}
+        # worker name -> its connection, for shard updates
+        self.connections: Dict[str, asyncio.StreamWriter] = {}
+
+        os.makedirs(shard_dir, exist_ok=True)
+
+    @staticmethod
+    def worker_name(number: int) -> str:
+        return f"worker-{number}"
+
+    def worker_config(self, number: int, contracts: Dict[str, dict]) -> dict:
+        """Config of a worker - its own contracts, a link back here and no heartbeat file of its own."""
+        settings = {**self.info['settings'], "workers": 1, "coordinator": self.address,
+                    "worker_name": self.worker_name(number), "heartbeat_file": ""}
+
+        if settings.get('metrics_port'):
+            settings['metrics_port'] = settings['metrics_port'] + 1 + number
+
+        return {"settings": settings, "contracts": contracts}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Receives the JSON lines of one worker connection."""
+        worker = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                message = json.loads(line)
+                if message['type'] == "alert":
+                    # Duplicates, eg. from a contract that just moved to another worker, are dropped by alert_key
+                    self.dispatcher.send(message['message_text'], message['disable_web_page_preview'],
+                                         message['telegram_chat_id'], message['debug'], message['network'],
+                                         message['txn_time'], message['alert_key'])
+                elif message['type'] == "heartbeat":
+                    self.statuses[message['worker']] = (time(), message['status'])
+                elif message['type'] == "hello":
+                    worker = message['worker']
+                    self.connections[worker] = writer
+
+        except (ValueError, KeyError, ConnectionError) as e:
+            log_error.warning(f"'CoordinatorError' - Invalid worker message - {e}")
+
+        except asyncio.CancelledError:
+            # Connections still open on shutdown
+            pass
+
+        finally:
+            if self.connections.get(worker) is writer:
+                del self.connections[worker]
+            writer.close()
+
+    def write_config(self, number: int, contracts: Dict[str, dict]) -> str:
+        """Writes a worker's config file and returns its path."""
+        filename = os.path.join(self.shard_dir, f"{self.worker_name(number)}.json")
+        with open(f"{filename}.tmp", "w") as file:
+            json.dump(self.worker_config(number, contracts), file)
+        os.replace(f"{filename}.tmp", filename)
+
+        return filename
+
+    async def start_worker(self, number: int, contracts: Dict[str, dict]) -> None:
+        """Writes a worker's config file and starts it."""
+        filename = self.write_config(number, contracts)
+
+        self.statuses.pop(self.worker_name(number), None)
+        self.processes[number] = await asyncio.create_subprocess_exec(sys.executable, self.script, self.mode, filename)
+        self.started[number] = monotonic()
+        self.shards[number] = contracts
+
+    async def stop_worker(self, number: int, timeout: float = 30) -> None:
+        """Stops a worker, giving it time to flush its checkpoints and queued alerts."""
+        process = self.processes.pop(number, None)
+        self.shards.pop(number, None)
+        self.connections.pop(self.worker_name(number), None)
+        if process is None or process.returncode is not None:
+            return
+
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    async def send_shard(self, number: int, contracts: Dict[str, dict]) -> bool:
+        """Sends a running worker its new shard over its connection, returns False if it is not connected."""
+        writer = self.connections.get(self.worker_name(number))
+        if writer is None or writer.is_closing():
+            return False
+
+        try:
+            writer.write(json.dumps({"type": "shard", "contracts": contracts}).encode() + b"\n")
+            await writer.drain()
+        except ConnectionError as e:
+            log_error.warning(f"'CoordinatorError' - {self.worker_name(number)} - {e}")
+            return False
+
+        # Restarted with its current shard if it dies later
+        self.write_config(number, contracts)
+        self.shards[number] = contracts
+
+        return True
+
+    async def rebalance(self) -> None:
+        """
+        Assigns the contracts to the live workers. Running workers are sent their new shard and only start or stop
+        the contracts that moved, workers that are not running are started.
+        """
+        live = [number for number in range(self.workers) if number not in self.dead]
+        if not live:
+            return
+
+        shards = assign_shards(self.info['contracts'], live)
+        # Running workers hand over the contracts moving away first, so a returning worker resumes their checkpoints
+        for number in live:
+            if number not in self.processes or shards[number] == self.shards.get(number):
+                continue
+
+            if not await self.send_shard(number, shards[number]):
+                # Not connected yet, eg. still starting - restarted with its new shard instead
+                await self.stop_worker(number)
+
+        for number in live:
+            if number not in self.processes and shards[number]:
+                await self.start_worker(number, shards[number])
+
+        sizes = ", ".join(f"{self.worker_name(number)}: {len(shards[number])}" for number in live)
+        print(f"{datetime.now().astimezone().strftime(time_format)} - Contracts assigned to workers - {sizes}.")
+
+    async def supervise(self) -> None:
+        """Spots dead or stalled workers, and restarts dead ones after restart_delay secs."""
+        changed = False
+        for number, process in list(self.processes.items()):
+            received, _ = self.statuses.get(self.worker_name(number), (None, None))
+            stalled = monotonic() - self.started[number] > self.worker_timeout and \
+                (received is None or time() - received > self.worker_timeout)
+
+            if process.returncode is None and not stalled:
+                continue
+
+            reason = f"exited with {process.returncode}" if process.returncode is not None else "stalled"
+            log_error.warning(f"'CoordinatorError' - {self.worker_name(number)} {reason}, "
+                              f"moving its contracts to the other workers.")
+            await self.stop_worker(number)
+            self.statuses.pop(self.worker_name(number), None)
+            self.dead[number] = monotonic() + self.restart_delay
+            changed = True
+
+        for number, restart_at in list(self.dead.items()):
+            if monotonic() >= restart_at:
+                del self.dead[number]
+                changed = True
+
+        if changed:
+            await self.rebalance()
+
+    def combined_status(self) -> dict:
+        """Combines the workers' heartbeats - a network is only as fresh as its most lagging worker."""
+        networks = {}
+        for _, status in self.statuses.values():
+            for network, info in status['networks'].items():
+                combined = networks.setdefault(network, {"last_success": info['last_success'], "tasks": 0,
+                                                         "failing": 0, "max_interval": 0})
+                if info['last_success'] is None or combined['last_success'] is None:
+                    combined['last_success'] = None
+                else:
+                    combined['last_success'] = min(combined['last_success'], info['last_success'])
+                combined['tasks'] += info['tasks']
+                combined['failing'] += info['failing']
+                combined['max_interval'] = max(combined['max_interval'], info['max_interval'])
+
+        workers = {self.worker_name(number): {"pid": process.pid, "contracts": len(self.shards.get(number, {}))}
+                   for number, process in self.processes.items()}
+
+        return {"pid": os.getpid(), "started": self.heartbeat.started, "updated": time(),
+                "loop": sum(status['loop'] for _, status in self.statuses.values()),
+                "networks": networks, "workers": workers}
+
+    async def run(self) -> None:
+        """
+        Starts the workers and supervises them until cancelled, then stops them all.
+
+        :return: None
+        """
+        server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.address = "127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+
+        self.dispatcher.start()
+        try:
+            await self.rebalance()
+
+            last_report = monotonic()
+            while True:
+                await asyncio.sleep(1)
+                await self.supervise()
+
+                if monotonic() - last_report >= self.report_interval:
+                    self.heartbeat.write(self.combined_status())
+                    last_report = monotonic()
+
+                    timestamp = datetime.now().astimezone().strftime(time_format)
+                    print(f"{timestamp} - Coordinator: {len(self.processes)}/{self.workers} workers running. "
+                          f"Alerts queued {len(self.dispatcher)}.")
+
+        finally:
+            await asyncio.gather(*[self.stop_worker(number) for number in list(self.processes)])
+            server.close()
+            await self.dispatcher.close()
@@ -0,0 +1,81 @@
+import os
+import json
+
+from time import time
+from typing import (
+    List,
+    Dict,
+)
+
+from src.contractscreener.common.logger import log_error
+
+
+class Heartbeat:
+
+    def __init__(self, filename: str = "logs/heartbeat.json"):
+        """
+        Status file with the last successful poll of every network, rewritten atomically on every report loop.
+        A watchdog reading it, eg. container_check.py, spots a stalled process or a lagging network
+        within seconds, without reading any logs.
+
+        :param filename: Path of status file, empty to not write one
+        """
+        self.filename = filename
+        self.started = time()
+
+        self.last_status: Dict[str, object] = {}
+
+    def status(self, network_tasks: Dict[str, List], loop: int) -> Dict[str, object]:
+        """
+        Builds the current status from the screening tasks of each network.
+
+        :param network_tasks: Dictionary of network -> list of ScreeningTasks
+        :param loop: Number of the current report loop
+        :return: Status dictionary
+        """
+        networks = {}
+        for network, tasks in network_tasks.items():
+            successes = [task.last_success for task in tasks if task.last_success is not None]
+            networks[network] = {
+                "last_success": max(successes, default=None),
+                "tasks": len(tasks),
+                "failing": len([task for task in tasks if task.failures]),
+                # Longest a healthy task of the network may go between two polls
+                "max_interval": max([task.interval for task in tasks], default=0),
+            }
+
+        self.last_status = {"pid": os.getpid(), "started": self.started, "updated": time(), "loop": loop,
+                            "networks": networks}
+
+        return self.last_status
+
+    def beat(self, network_tasks: Dict[str, List], loop: int) -> None:
+        """
+        Writes the current status to the status file, replacing the old one in a single step
+        so a reader never sees a partially written file.
+
+        :param network_tasks: Dictionary of network -> list of ScreeningTasks
+        :param loop: Number of the current report loop
+        :return: None
+        """
+        self.write(self.status(network_tasks, loop))
+
+    def write(self, status: Dict[str, object]) -> None:
+        """
+        Writes a status to the status file, eg. one combined from several worker processes.
+
+        :param status: Status dictionary
+        :return: None
+        """
+        self.last_status = status
+        if not self.filename:
+            return
+
+        temp_file = f"{self.filename}.tmp"
+        try:
+            with open(temp_file, "w") as file:
+                json.dump(status, file)
+            os.replace(temp_file, self.filename)
+
+        except OSError as e:
+            log_error.warning(f"'HeartbeatError' - Unable to write {self.filename} - {e}")
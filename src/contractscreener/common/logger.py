@@ -1,35 +1,248 @@
+import os
+import gzip
+import shutil
 import logging
 
+from atexit import register
+from queue import SimpleQueue
+from time import (
+    time,
+    strftime,
+)
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    BaseRotatingHandler,
+)
+from typing import (
+    Dict,
+    Optional,
+)
+
 from src.contractscreener.variables import log_format
 
 
+class RotatingLogHandler(BaseRotatingHandler):
+
+    def __init__(self, filename: str, max_bytes: int = 10 * 1024 * 1024, interval: float = 24 * 60 * 60,
+                 backups: int = 5, compress: bool = True):
+        """
+        File handler that rotates its file once it grows past max_bytes or every interval secs, whichever
+        comes first. A rotated file is renamed with the time of its rotation, eg. 'txns.log.20221105-143000',
+        and gzipped.
+
+        :param filename: Path of log file
+        :param max_bytes: Size in bytes a file is rotated at, 0 for no size limit
+        :param interval: Secs a file is rotated after, 0 for no time limit
+        :param backups: Number of rotated files kept, 0 to keep all of them
+        :param compress: If true, rotated files are gzipped
+        """
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        super().__init__(filename, "a", encoding="utf-8", delay=True)
+
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        self.compress = compress
+
+        self.rollover_at = time() + interval
+
+    def rotation_filename(self, default_name: str) -> str:
+        return f"{default_name}.gz" if self.compress else default_name
+
+    def rotate(self, source: str, dest: str) -> None:
+        if not self.compress:
+            os.replace(source, dest)
+            return
+
+        with open(source, "rb") as file_in, gzip.open(dest, "wb") as file_out:
+            shutil.copyfileobj(file_in, file_out)
+        os.remove(source)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.interval and time() >= self.rollover_at:
+            return True
+
+        if self.max_bytes:
+            if self.stream is None:
+                self.stream = self._open()
+            size = self.stream.tell()
+            # A single record larger than max_bytes still goes into a file of its own
+            if size and size + len(self.format(record)) + 1 >= self.max_bytes:
+                return True
+
+        return False
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        self.rollover_at = time() + self.interval
+
+        # Nothing was logged since the last rotation
+        if not os.path.exists(self.baseFilename) or not os.path.getsize(self.baseFilename):
+            return
+
+        stamp = f"{self.baseFilename}.{strftime('%Y%m%d-%H%M%S')}"
+        dest = self.rotation_filename(stamp)
+        # Several size rotations within the same sec
+        count = 0
+        while os.path.exists(dest):
+            count += 1
+            dest = self.rotation_filename(f"{stamp}-{count}")
+
+        self.rotate(self.baseFilename, dest)
+        self.remove_backups()
+
+    def remove_backups(self) -> None:
+        """
+        Removes the oldest rotated files beyond the number of backups kept.
+
+        :return: None
+        """
+        if not self.backups:
+            return
+
+        directory, name = os.path.split(self.baseFilename)
+        rotated = [os.path.join(directory, file) for file in os.listdir(directory) if file.startswith(f"{name}.")]
+        # Oldest first, names of several rotations within the same sec do not sort by age
+        rotated.sort(key=os.path.getmtime)
+        for file in rotated[:-self.backups]:
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+
+
+# Records are put on the queue by the screener and written to disk by a single background thread,
+# so a slow disk never blocks the event loop
+log_queue: SimpleQueue = SimpleQueue()
+# Logger name -> its file handler
+log_handlers: Dict[str, RotatingLogHandler] = {}
+log_listener: Optional[QueueListener] = None
+
+
+def start_listener() -> None:
+    """
+    (Re)starts the background thread writing queued records to the file handlers.
+
+    :return: None
+    """
+    global log_listener
+
+    if log_listener:
+        # Writes out every record queued so far
+        log_listener.stop()
+
+    log_listener = QueueListener(log_queue, *log_handlers.values(), respect_handler_level=True)
+    log_listener.start()
+
+
+def stop_listener() -> None:
+    """
+    Writes out every queued record and stops the background thread, eg. on exit.
+
+    :return: None
+    """
+    global log_listener
+
+    if log_listener:
+        log_listener.stop()
+        log_listener = None
+
+    for handler in log_handlers.values():
+        handler.close()
+
+
 def logger_setup(
         log_name: str,
         filename: str,
         level=logging.INFO,
+        log_fmt: str = log_format,
 ) -> logging.Logger:
     """
-    Sets up a new logger config.
+    Sets up a new logger config. Records are queued and written to a rotating file by a background thread.
 
     :param log_name: Name of Logger. Make sure unique name is given for each Log
     :param filename: Name of filename
     :param level: Logger level of severity
+    :param log_fmt: Format of each line
     :returns: An instance of the Logger class
     """
     # Set up formatting style
-    formatter = logging.Formatter(log_format)
+    formatter = logging.Formatter(log_fmt)
 
-    handler = logging.FileHandler(filename)
+    handler = RotatingLogHandler(filename)
     handler.setFormatter(formatter)
+    # All loggers share one queue, each file handler only writes the records of its own logger
+    handler.addFilter(logging.Filter(log_name))
+    log_handlers[log_name] = handler
 
-    # Create logger with name, level and handler
+    # Create logger with name, level and queue handler
     logger = logging.getLogger(log_name)
     logger.setLevel(level)
-    logger.addHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    start_listener()
 
     return logger
 
 
+def configure_logging(max_bytes: int = 10 * 1024 * 1024, interval: float = 24 * 60 * 60, backups: int = 5,
+                      compress: bool = True, journal_file: str = "logs/journal.jsonl",
+                      journal_max_bytes: int = 100 * 1024 * 1024, record_file: str = "", suffix: str = "") -> None:
+    """
+    Applies the rotation settings to every log file. The journal and the poll recording keep all of their
+    rotated files.
+
+    :param max_bytes: Size in bytes a log file is rotated at, 0 for no size limit
+    :param interval: Secs a log file is rotated after, 0 for no time limit
+    :param backups: Number of rotated files kept of each log, 0 to keep all of them
+    :param compress: If true, rotated files are gzipped
+    :param journal_file: Path of the transaction journal, empty to not keep one
+    :param journal_max_bytes: Size in bytes the journal and the poll recording are rotated at
+    :param record_file: Path of the poll recording, with every txn of every poll for replaying, empty to not keep one
+    :param suffix: Added to every file name, so processes running side by side never rotate each other's files,
+     eg. 'worker-0' writes to 'logs/error.worker-0.log'
+    :return: None
+    """
+    # Writes out every record queued under the old settings first
+    stop_listener()
+
+    append_only = {"journal": journal_file, "polls": record_file}
+
+    for log_name, handler in log_handlers.items():
+        if log_name in append_only:
+            logging.getLogger(log_name).disabled = not append_only[log_name]
+            filename = append_only[log_name] or handler.baseFilename
+            handler.max_bytes, handler.backups = journal_max_bytes, 0
+        else:
+            filename = handler.baseFilename
+            handler.max_bytes, handler.backups = max_bytes, backups
+
+        if suffix:
+            root, extension = os.path.splitext(filename)
+            filename = f"{root}.{suffix}{extension}"
+        if filename:
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+
+        handler.baseFilename = os.path.abspath(filename)
+        handler.interval = interval
+        handler.compress = compress
+        handler.rollover_at = time() + interval
+
+    start_listener()
+
+
 # Configure logging settings
 log_error = logger_setup("error", "logs/error.log")
 log_txns = logger_setup("txns", "logs/txns.log")
+# Append-only journal of every new txn, one compact JSON object per line
+log_journal = logger_setup("journal", "logs/journal.jsonl", log_fmt="%(message)s")
+# Every txn of every poll, off unless a record file is set
+log_polls = logger_setup("polls", "logs/polls.jsonl", log_fmt="%(message)s")
+log_polls.disabled = True
+
+register(stop_listener)
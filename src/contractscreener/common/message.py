@@ -1,15 +1,36 @@
+import asyncio
 import requests
 
-from time import sleep
-from typing import Optional
+from time import (
+    time,
+    sleep,
+    monotonic,
+)
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+)
 
+from aiohttp import (
+    ClientSession,
+    ClientTimeout,
+)
 from requests.exceptions import ConnectionError
 
 from src.contractscreener.common.logger import log_error
+from src.contractscreener.blockchain.seen import SeenHashes
+from src.contractscreener.common.metrics import (
+    alerts_sent,
+    telegram_errors,
+    alert_lag_seconds,
+)
 from src.contractscreener.variables import (
     TOKEN,
     CHAT_ID_ALERTS,
     CHAT_ID_DEBUG,
+    http_session,
 )
 
 
@@ -21,6 +42,7 @@ def telegram_send_message(
         debug: bool = False,
         timeout: float = 10,
         sleep_time: int = 3,
+        max_attempts: int = 5,
 ) -> requests.Response or None:
     """
     Sends a Telegram message to a specified chat.
@@ -36,7 +58,8 @@ def telegram_send_message(
     :param telegram_chat_id: Telegram chat ID for alerts, default is 'CHAT_ID_ALERTS' from .env file
     :param debug: If true sends message to Telegram 'CHAT_ID_DEBUG' chat taken from .env file
     :param timeout: Max secs to wait for POST request
-    :param sleep_time: Time to sleep if Telegram bot clutters
+    :param sleep_time: Time to sleep if Telegram bot clutters and does not say how long to wait
+    :param max_attempts: Max number of attempts before giving up
     :return: requests.Response
     """
     telegram_token = str(telegram_token)
@@ -66,19 +89,249 @@ def telegram_send_message(
 
     # send the POST request
     try:
-        counter = 1
-        # If too many requests, wait for Telegram's rate limit
-        while True:
-            post_request = requests.post(url=url, data=payload, timeout=timeout)
+        for counter in range(1, max_attempts + 1):
+            post_request = http_session.post(url=url, data=payload, timeout=timeout)
+            response = post_request.json()
 
-            if post_request.json()['ok']:
+            if response['ok']:
                 return post_request
 
+            # If too many requests, wait for Telegram's rate limit
+            wait_time = response.get('parameters', {}).get('retry_after', sleep_time)
             log_error.warning(f"'telegram_send_message' - Telegram message not sent, attempt {counter}. "
-                              f"Sleeping for {sleep_time} secs...")
-            counter += 1
-            sleep(sleep_time)
+                              f"{response.get('description')}. Sleeping for {wait_time} secs...")
+            sleep(wait_time)
+
+        log_error.warning(f"'telegram_send_message' - '{message_text}' was not sent after {max_attempts} attempts.")
+        return None
 
     except ConnectionError as e:
         log_error.warning(f"'telegram_send_message' - {e} - '{message_text})' was not sent.")
         return None
+
+
+class TelegramDispatcher:
+
+    def __init__(
+            self,
+            telegram_token: Optional[str] = "",
+            chat_interval: float = 3,
+            max_length: int = 4096,
+            timeout: float = 10,
+            max_attempts: int = 5,
+            max_alert_keys: int = 10000,
+    ):
+        """
+        Non-blocking Telegram sender. Messages are queued by send() and delivered by a background task
+        over one pooled session, so a slow or rate limited Telegram never holds up screening.
+        Messages queued for the same chat while it waits for its rate limit are merged into fewer,
+        larger messages.
+
+        :param telegram_token: Telegram TOKEN API, default is 'TOKEN' from .env file
+        :param chat_interval: Min secs between two messages to the same chat
+        :param max_length: Max length of a merged message
+        :param timeout: Max secs to wait for POST request
+        :param max_attempts: Max number of attempts for a message before dropping it
+        :param max_alert_keys: Number of recent alert keys remembered to drop duplicate alerts
+        """
+        self.telegram_token = str(telegram_token) if telegram_token else TOKEN
+        self.chat_interval = chat_interval
+        self.max_length = max_length
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+        self.url = "https://api.telegram.org/bot{}/sendMessage".format(self.telegram_token)
+
+        # (chat id, disable web page preview) -> queued (message text, network, on-chain txn time)
+        self.pending: Dict[Tuple[str, bool], List[Tuple[str, str, float]]] = {}
+        # chat id -> time it may be sent to again
+        self.next_allowed: Dict[str, float] = {}
+        self.alert_keys = SeenHashes(max_alert_keys)
+        # Number of messages taken off the pending lists and still being posted
+        self._sending = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so the queue belongs to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+
+        return self._queue
+
+    def __len__(self) -> int:
+        return self.queue.qsize() + sum(len(texts) for texts in self.pending.values()) + self._sending
+
+    def send(
+            self,
+            message_text: str,
+            disable_web_page_preview: bool = True,
+            telegram_chat_id: Optional[str] = "",
+            debug: bool = False,
+            network: str = "",
+            txn_time: float = 0,
+            alert_key: str = "",
+    ) -> None:
+        """
+        Queues a Telegram message without waiting for it to be delivered.
+
+        :param message_text: Text message to send
+        :param disable_web_page_preview: Set web preview on/off
+        :param telegram_chat_id: Telegram chat ID for alerts, default is 'CHAT_ID_ALERTS' from .env file
+        :param debug: If true sends message to Telegram 'CHAT_ID_DEBUG' chat taken from .env file
+        :param network: Network of the alerted txn, for alert metrics
+        :param txn_time: On-chain timestamp of the alerted txn, for alert lag metrics
+        :param alert_key: Identity of the alert, a message with an alert_key sent before is dropped
+        :return: None
+        """
+        if alert_key and not self.alert_keys.add(alert_key):
+            return
+
+        telegram_chat_id = str(telegram_chat_id) if telegram_chat_id else ""
+        if telegram_chat_id == "":
+            telegram_chat_id = CHAT_ID_DEBUG if debug else CHAT_ID_ALERTS
+
+        self.queue.put_nowait((telegram_chat_id, bool(disable_web_page_preview), str(message_text),
+                               network, txn_time))
+
+    def start(self) -> asyncio.Task:
+        """
+        Starts delivering queued messages in a background task. Must be called from within a running event loop.
+
+        :return: Delivery task
+        """
+        if not self.telegram_token:
+            raise Exception(f"Must provide Telegram Token.")
+
+        self._session = ClientSession(timeout=ClientTimeout(total=self.timeout))
+        self._task = asyncio.create_task(self.run())
+
+        return self._task
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        Waits up to timeout secs for queued messages to be delivered, then stops the background task.
+
+        :param timeout: Max secs to wait for queued messages
+        :return: None
+        """
+        deadline = monotonic() + timeout
+        while len(self) and self._task and not self._task.done() and monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        if len(self):
+            log_error.warning(f"'TelegramDispatcher' - {len(self)} queued messages were not sent.")
+
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        if self._session:
+            await self._session.close()
+
+    def _add(self, item: Tuple[str, bool, str, str, float]) -> None:
+        """Adds a queued message to the pending list of its chat."""
+        telegram_chat_id, disable_web_page_preview, message_text, network, txn_time = item
+        self.pending.setdefault((telegram_chat_id, disable_web_page_preview), []).append(
+            (message_text, network, txn_time))
+
+    def _drain(self) -> None:
+        """Moves all queued messages into the per chat pending lists."""
+        while not self.queue.empty():
+            self._add(self.queue.get_nowait())
+
+    def _take_message(self, key: Tuple[str, bool]) -> Tuple[str, List[Tuple[str, float]]]:
+        """Merges as many pending messages of a chat as fit in one message, with the alerted txns they carry."""
+        texts = self.pending[key]
+
+        message_text, network, txn_time = texts.pop(0)
+        message_text = message_text[:self.max_length]
+        origins = [(network, txn_time)]
+        while texts and len(message_text) + 2 + len(texts[0][0]) <= self.max_length:
+            next_text, network, txn_time = texts.pop(0)
+            message_text += "\n\n" + next_text
+            origins.append((network, txn_time))
+
+        if not texts:
+            del self.pending[key]
+
+        return message_text, origins
+
+    async def run(self) -> None:
+        """
+        Delivers queued messages, one chat at a time, respecting each chat's rate limit. Runs until cancelled.
+
+        :return: None
+        """
+        while True:
+            if not self.pending:
+                self._add(await self.queue.get())
+            self._drain()
+
+            # Serve the chat that may be sent to the soonest
+            key = min(self.pending, key=lambda k: self.next_allowed.get(k[0], 0))
+            wait_time = self.next_allowed.get(key[0], 0) - monotonic()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+                self._drain()
+
+            message_text, origins = self._take_message(key)
+            self._sending = len(origins)
+            try:
+                if await self._post(key[0], key[1], message_text):
+                    self._record(origins)
+            finally:
+                self._sending = 0
+
+    @staticmethod
+    def _record(origins: List[Tuple[str, float]]) -> None:
+        """Records delivered alerts and their lag from the txn's on-chain time."""
+        delivered = time()
+        for network, txn_time in origins:
+            if not network:
+                continue
+
+            alerts_sent.inc(network=network)
+            if txn_time:
+                alert_lag_seconds.observe(delivered - txn_time, network=network)
+
+    async def _post(self, telegram_chat_id: str, disable_web_page_preview: bool, message_text: str) -> bool:
+        """Sends one message, honouring Telegram's retry_after. Returns True if delivered."""
+        payload = {"chat_id": telegram_chat_id, "text": message_text,
+                   "disable_web_page_preview": str(disable_web_page_preview).lower(), "parse_mode": "HTML"}
+
+        for counter in range(1, self.max_attempts + 1):
+            try:
+                async with self._session.post(self.url, data=payload) as response:
+                    response_dict = await response.json(content_type=None)
+
+            except Exception as e:
+                telegram_errors.inc(kind="connection")
+                log_error.warning(f"'TelegramDispatcher' - {e}, attempt {counter}.")
+                await asyncio.sleep(counter)
+                continue
+
+            self.next_allowed[telegram_chat_id] = monotonic() + self.chat_interval
+            if response_dict.get('ok'):
+                return True
+
+            retry_after = response_dict.get('parameters', {}).get('retry_after')
+            if retry_after is None:
+                telegram_errors.inc(kind="dropped")
+                log_error.warning(f"'TelegramDispatcher' - {response_dict.get('description')} - "
+                                  f"'{message_text}' was not sent.")
+                return False
+
+            telegram_errors.inc(kind="rate_limit")
+            log_error.warning(f"'TelegramDispatcher' - Telegram message not sent, attempt {counter}. "
+                              f"Sleeping for {retry_after} secs...")
+            self.next_allowed[telegram_chat_id] = monotonic() + retry_after
+            await asyncio.sleep(retry_after)
+
+        telegram_errors.inc(kind="dropped")
+        log_error.warning(f"'TelegramDispatcher' - '{message_text}' was not sent after {self.max_attempts} attempts.")
+
+        return False
@@ -0,0 +1,283 @@
+from bisect import bisect_left
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Callable,
+    Optional,
+    Sequence,
+)
+
+from aiohttp import web
+
+
+# Secs, from a fast explorer request up to a poll stuck behind the rate limit
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Secs from a txn's block time to its Telegram alert
+LAG_BUCKETS = (2, 5, 10, 15, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """
+        Base of a metric family, with one value per combination of label values.
+
+        :param name: Metric name, eg. 'screener_txns_scanned_total'
+        :param documentation: One line description
+        :param labels: Label names, eg. ['network']
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        try:
+            return tuple(str(labels[name]) for name in self.labels)
+        except KeyError as e:
+            raise ValueError(f"Metric {self.name} needs labels {self.labels}, got {labels}") from e
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Increases the counter of a label combination.
+
+        :param amount: Amount to add
+        :param labels: Label values, eg. network='ethereum'
+        :return: None
+        """
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Sets the gauge of a label combination.
+
+        :param value: New value
+        :param labels: Label values, eg. network='ethereum'
+        :return: None
+        """
+        self.values[self.key(labels)] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """
+        Reads the gauge from a function at scrape time instead, eg. the length of a queue.
+
+        :param function: Function returning a dictionary of label values tuple -> value
+        :return: None
+        """
+        self.function = function
+
+    def samples(self) -> List[str]:
+        values = self.function() if self.function else self.values
+
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+        # label values -> [count in each bucket, sum, count]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Records one observation of a label combination.
+
+        :param value: Observed value, eg. secs
+        :param labels: Label values, eg. host='api.etherscan.io'
+        :return: None
+        """
+        entry = self.values.setdefault(self.key(labels), [[0] * len(self.buckets), 0.0, 0])
+
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(self.labels, key, 'le="' + _number(bound) + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        """
+        In-process metrics, rendered in the Prometheus text format and served over a local HTTP port.
+        Metrics are updated from the event loop only, so no locking is needed.
+        """
+        self.metrics: Dict[str, Metric] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+
+        :return: Metrics text
+        """
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def serve(self, port: int, host: str = "127.0.0.1",
+                    health: Optional[Callable[[], dict]] = None) -> None:
+        """
+        Serves the metrics at http://<host>:<port>/metrics. Must be called from within a running event loop.
+
+        :param port: Port to listen on
+        :param host: Interface to listen on, eg. '0.0.0.0' inside a container
+        :param health: Optional function returning a status dictionary, served as JSON at /health
+        :return: None
+        """
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+
+        if health:
+            async def handle_health(request: web.Request) -> web.Response:
+                return web.json_response(health())
+
+            app.router.add_get("/health", handle_health)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def close(self) -> None:
+        """
+        Stops serving the metrics.
+
+        :return: None
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Shared by all modules of the process
+metrics = MetricsRegistry()
+
+request_seconds = metrics.histogram(
+    "screener_request_seconds", "Latency of explorer and node requests, excluding rate limit queueing.", ["host"])
+request_errors = metrics.counter(
+    "screener_request_errors_total",
+    "Failed explorer and node requests by kind: connection, json, response or rate_limit (429 or 'Max rate limit').",
+    ["host", "kind"])
+throttle_waiting = metrics.gauge(
+    "screener_throttle_waiting", "Requests currently queued for an explorer's rate limit.", ["host"])
+api_key_requests = metrics.counter(
+    "screener_api_key_requests_total",
+    "Explorer requests by network, API key (last 4 characters) and outcome: ok, rate_limit, invalid or error.",
+    ["network", "key", "outcome"])
+breaker_open = metrics.gauge(
+    "screener_breaker_open", "Circuit breaker state of an explorer host: 0 closed, 0.5 half-open, 1 open.", ["host"])
+hedged_requests = metrics.counter(
+    "screener_hedged_requests_total", "Duplicate explorer requests sent after the p95 delay, by host.", ["host"])
+node_failovers = metrics.counter(
+    "screener_node_failovers_total", "Erc20 polls served by the node because every explorer host was down.",
+    ["network"])
+contract_reads = metrics.counter(
+    "screener_contract_reads_total",
+    "Contract reads by network and how they were served: call, multicall, batch or cache.", ["network", "source"])
+txns_scanned = metrics.counter(
+    "screener_txns_scanned_total", "Transactions and Transfer logs read from explorers and nodes.", ["network"])
+poll_seconds = metrics.histogram(
+    "screener_poll_seconds", "Duration of a contract or network poll, including rate limit queueing.", ["network"])
+poll_interval_seconds = metrics.gauge(
+    "screener_poll_interval_seconds", "Polling interval currently chosen for each task by the adaptive scheduler.",
+    ["task"])
+loop_seconds = metrics.gauge(
+    "screener_loop_seconds", "Duration of the last report loop, ie. the 'Loop N executed in X secs' line.")
+alerts_queued = metrics.gauge(
+    "screener_alerts_queued", "Alerts waiting to be delivered to Telegram.")
+alerts_sent = metrics.counter(
+    "screener_alerts_sent_total", "Alerts delivered to Telegram.", ["network"])
+alert_lag_seconds = metrics.histogram(
+    "screener_alert_lag_seconds", "Secs from a txn's on-chain timeStamp to the delivery of its Telegram alert.",
+    ["network"], buckets=LAG_BUCKETS)
+telegram_errors = metrics.counter(
+    "screener_telegram_errors_total", "Failed Telegram requests by kind: connection, rate_limit or dropped.", ["kind"])
@@ -33,6 +33,13 @@ infura_endpoints = {
     'polygon': os.getenv("WEB3_INFURA_POLYGON"),
 }
 
+infura_ws_endpoints = {
+    'ethereum': os.getenv("WEB3_INFURA_WS_ETHEREUM"),
+    'optimism': os.getenv("WEB3_INFURA_WS_OPTIMISM"),
+    'arbitrum': os.getenv("WEB3_INFURA_WS_ARBITRUM"),
+    'polygon': os.getenv("WEB3_INFURA_WS_POLYGON"),
+}
+
 etherscans = {
     'ethereum': ['https://api.etherscan.io', 'https://etherscan.io', '🔲'],
     'arbitrum': ['https://api.arbiscan.io', 'https://arbiscan.io', '🟦'],